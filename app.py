@@ -3,538 +3,587 @@
 ##### Uniqname: tydorje             #####
 #########################################
 
-from flask import Flask, render_template, request, redirect, url_for
+from flask import Flask, render_template, request, redirect, url_for, jsonify, abort, make_response, g, send_file, stream_with_context
 
-import requests
+import base64
 import json
-
-TMDb_key = "INSERT"
-StreamingAvailability_key = "INSERT"
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import islice
+
+from requests import RequestException
+
+from tmdb import (SERVICES, GENRES, LANGUAGES, DURATION_RUNTIMES, DISCOVER_MAX_PAGE, TMDB_HOST, reference_registry, discover_movie_pages,
+                  get_tmdb_watch_provider, get_tmdb_genre_id, get_tmdb_language_id, tmdb_movie_with_directors,
+                  get_streaming_link)
+from upstream import BREAKER_COOLDOWN, upstream_stats, circuit_open
+from cache_store import cache_stats, get_store
+from catalog import catalog_stats
+from single_flight import coalescing_stats
+from stale_refresh import stale_refresher
+from metrics import registry
+from profiling import install_profiling
+from link_prefetch import link_prefetcher, prefetch_links
+from poster_proxy import POSTER_MAX_AGE, get_poster, get_poster_cache, poster_content_type
+from rendered_cache import RenderedPageCache
+
+MAX_UPSTREAM_WORKERS = int(os.environ.get("MAX_UPSTREAM_WORKERS", 8)) # max concurrent per-movie TMDb requests, tune against TMDb rate limits
+MAX_PAGES_PER_LOAD = 5 # Discover Movie pages one search or "load more" may read looking for results
+RESULTS_MAX_AGE = 60 # seconds browsers and proxies may reuse a results page before revalidating it with its ETag
+STREAM_RESULTS = os.environ.get("STREAM_RESULTS", "") # "discover" or "arrival" streams uncached results pages as movies resolve, in that order
+
+if STREAM_RESULTS not in ("", "discover", "arrival"): # a typo shouldn't silently turn streaming off
+    raise ValueError(f"STREAM_RESULTS must be discover or arrival, not {STREAM_RESULTS!r}")
+
+CRITERIA_CHOICES = { # search parameters in canonical URL order, and their choices
+    "service": SERVICES,
+    "genre": GENRES,
+    "language": LANGUAGES,
+    "duration": list(DURATION_RUNTIMES)
+}
 
 app = Flask(__name__)
+upstream_executor = ThreadPoolExecutor(max_workers=MAX_UPSTREAM_WORKERS, thread_name_prefix="tmdb") # shared by all requests so the limit is global
+reference_registry.start(wait=False) # start from the saved provider, genre and language IDs, fetch and refresh them in the background
+rendered_pages = RenderedPageCache() # rendered first results pages by criteria
+get_store().add_listener(rendered_pages.invalidate) # drop a page when a Discover list or movie it shows is rewritten
+
+http_duration = registry.histogram("http_request_duration_seconds", "Requests served by route, method and status.", ("route", "method", "status"))
+http_in_flight = registry.gauge("http_requests_in_flight", "Requests being served.")
+registry.add_collector(lambda: rendered_page_metrics(rendered_pages.cache_stats()))
+install_profiling(app) # sampled request profiles, only if PROFILE_SAMPLE_RATE or PROFILE_HEADER is set
+
+##################METRICS################
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    http_in_flight.inc()
 
-##################CACHE##################
+@app.after_request
+def record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule else "unmatched" # the route pattern, so IDs don't make new series
+    http_duration.observe(time.perf_counter() - g.request_started, route=route, method=request.method, status=response.status_code)
+    return response
 
-CACHE_FILE = "cache.json"
+@app.teardown_request
+def finish_request_metrics(error):
+    http_in_flight.dec()
 
-def open_cache():
-    ''' opens the cache file if it exists and loads the JSON data into a dictionary
+def rendered_page_metrics(stats):
+    ''' gets the rendered page cache counters as metric families, at scrape time
 
-    if the cache file doesn't exist, creates a new cache dictionary.
-    
     Parameters
     ----------
-    none
+    stats : dict
+        the RenderedPageCache.cache_stats() counters
 
     Returns
     -------
-    dict
-        the opened cache as a dictionary
+    list
+        (name, kind, documentation, samples) families
     '''
-    try:
-        with open(CACHE_FILE, 'r') as cache_file:
-            cache_contents = cache_file.read()
-            return json.loads(cache_contents) if cache_contents else {}
-    except:
-        return {}
+    return [
+        ("rendered_pages", "gauge", "Results pages kept rendered.", [({}, stats["pages"])]),
+        ("rendered_page_lookups_total", "counter", "Rendered page cache reads by result.",
+         [({"result": "hit"}, stats.get("hits", 0)), ({"result": "miss"}, stats.get("misses", 0))]),
+        ("rendered_page_invalidations_total", "counter", "Rendered pages dropped because an entry they show was rewritten.", [({}, stats.get("invalidations", 0))])
+    ]
 
-def save_cache(cache):
-    ''' saves the provided cache dictionary to the cache file in JSON format
+##################SEARCH#################
 
-    cache dictionary is saved to the designated CACHE_FILE.
+def normalize_criteria(values):
+    ''' gets the canonical search criteria from request parameters, rejecting unknown choices
 
     Parameters
     ----------
-    cache: dict
-        the cache dictionary that needs to be saved
+    values : dict
+        the form or query string parameters
 
     Returns
     -------
-    none
+    dict
+        the service, genre, language and duration, in canonical order and spelling
     '''
-    with open(CACHE_FILE, 'w') as cache_file:
-        json.dump(cache, cache_file)
+    criteria = {}
+
+    for name, choices in CRITERIA_CHOICES.items():
+        value = (values.get(name) or "").strip().casefold()
+        matches = [choice for choice in choices if choice.casefold() == value]
+
+        if not matches: # missing or unknown choice
+            abort(400)
+
+        criteria[name] = matches[0]
+
+    return criteria
 
-def update_cache(cache_key, data):
-    ''' updates the cache with the specified cache key and data from TMDb Discover Movie endpoint
+
+def runtime_range(user_duration):
+    ''' gets the runtime range for a duration dropdown value
 
     Parameters
     ----------
-    cache_key : str
-        the key to identify the data in the cache
-    data : dict
-        the movie data to be stored in the cache
+    user_duration : str
+        the duration dropdown value
 
     Returns
     -------
-    none
+    tuple
+        the minimum and maximum runtime in minutes
     '''
-    cache = open_cache() # open the cache
-    cache[cache_key] = data # update the cache key with data
-    save_cache(cache) # save the cache
+    if user_duration in DURATION_RUNTIMES: # if the duration is one of the choices,
+        return DURATION_RUNTIMES[user_duration] # return its runtime range
+
+    abort(400) # unknown duration
 
-def update_cache_with_movie_details(tmdb_id, movie_details):
-    ''' updates the cache with movie details for a specific TMDb ID from the TMDb Details endpoint
+def search_results(criteria, start_page, dependencies=None, after_local=False):
+    ''' gets the movie results for the user's criteria, starting at a Discover Movie page
+
+    Discover pages are walked lazily, so only the pages needed for this load are fetched. pages whose movies
+    are all removed by the runtime check are skipped, up to MAX_PAGES_PER_LOAD pages.
 
     Parameters
     ----------
-    tmdb_id : int
-        the TMDb ID of the movie
-    movie_details : dict
-        the details of the movie to be stored in the cache
+    criteria : dict
+        the service, language, genre and duration chosen by the user
+    start_page : int
+        the first Discover Movie page to read
+    dependencies : set, optional
+        filled with the (namespace, key) cache entries the results are built from
+    after_local : bool, optional
+        True if the local catalog matches were already served (default of False)
 
     Returns
     -------
-    none
+    tuple
+        the list of movie results and the next Discover Movie page, or None if there are no more pages
     '''
-    cache = open_cache() # open the cache
-    cache[tmdb_id] = {"movie_details": movie_details, "streaming_link": {}} # update the cache with movie details
-    save_cache(cache) # save the cache
+    discover_arguments = discover_criteria(criteria)
+    cache_key, _, _, _, runtime_gte, runtime_lte = discover_arguments
+    pages = discover_movie_pages(*discover_arguments, start_page, after_local) # lazily get lists of TMDb IDs from Discover Movie endpoint
+    results, next_page = [], None
+    dependencies = set() if dependencies is None else dependencies
+
+    for page, (tmdb_ids, next_page) in enumerate(islice(pages, MAX_PAGES_PER_LOAD), start=start_page):
+        add_page_dependencies(dependencies, cache_key, page, tmdb_ids)
 
-def get_movie_details_from_cache(tmdb_id):
-    ''' retrieves movie details from the cache for a specific TMDb ID
+        results = movie_results(tmdb_ids, criteria, runtime_gte, runtime_lte)
+        if results: # stop at the first page with results
+            break
+
+    return results, next_page
+
+def discover_criteria(criteria):
+    ''' gets the Discover Movie cache key and filters for the user's criteria
 
     Parameters
     ----------
-    tmdb_id : int
-        the TMDb ID of the movie
+    criteria : dict
+        the service, language, genre and duration chosen by the user
 
     Returns
     -------
-    dict or None
-        the movie details if found in the cache, otherwise None
+    tuple
+        the cache key, watch provider ID, genre ID, language ID, minimum runtime and maximum runtime
     '''
-    cache = open_cache() # open the cache
-    cache_key = str(tmdb_id) # define a cache key
+    runtime_gte, runtime_lte = runtime_range(criteria["duration"])
 
-    if cache_key in cache: # if cache key already in cache,
-        return cache[cache_key]["movie_details"] # return the movie details from the cache
+    service_id = get_tmdb_watch_provider(criteria["service"]) # get TMDb watch provider ID
+    genre_id = get_tmdb_genre_id(criteria["genre"]) # get TMDb genre ID
+    language_id = get_tmdb_language_id(criteria["language"]) # get TMDb original language ID
 
-    return None # else, return None
+    cache_key = f"{service_id}_{genre_id}_{language_id}_{runtime_gte}_{runtime_lte}" # generate Discover Movie endpoint cache key
+    return cache_key, service_id, genre_id, language_id, runtime_gte, runtime_lte
 
-def tmdb_discover_movie_cached(cache_key, service, genre, original_language, runtime_gte, runtime_lte):
-    ''' either retrieves data from the cache or makes a request to the TMDb Discover Movie endpoint, updates the cache, and returns the retrieved data
+def add_page_dependencies(dependencies, cache_key, page, tmdb_ids):
+    ''' records the cache entries a Discover Movie page of results is built from
 
     Parameters
     ----------
+    dependencies : set
+        the (namespace, key) cache entries to add to
     cache_key : str
-        the cache key used to identify the cached data
-    service : str
-        the TMDb ID for the movie's streaming service
-    genre : str
-        the TMDb ID for the movie's genre
-    original_language : str
-        the TMDb for the movie's original language
-    runtime_gte : int
-        the minimum runtime of the movie
-    runtime_lte : int
-        the maximum runtime of the movie
-    
+        the Discover Movie cache key
+    page : int
+        the Discover Movie page
+    tmdb_ids : list
+        the TMDb IDs on the page
+
     Returns
     -------
-    dict
-        the cached data, if available. otherwise, the retrieved data from the TMDb Discover Movie endpoint
+    none
     '''
-    cache = open_cache() # open the cache
-    cached_data = cache.get(cache_key) # get the cached data
-
-    if cached_data: # if data is found in cache,
-        return cached_data # return the cached data
-
-    data = tmdb_discover_movie(service, genre, original_language, runtime_gte, runtime_lte) # if no  data found in cache, make a request to the TMDb Discover Movie endpoint
-    update_cache(cache_key, data) # update the cache
-    return data # return the retrieved data
+    dependencies.add(("discover", cache_key if page == 1 else f"{cache_key}_page{page}"))
+    dependencies.update((namespace, str(tmdb_id)) for tmdb_id in tmdb_ids for namespace in ("movie_details", "directors"))
 
-def update_cache_with_streaming_link(tmdb_id, service, streaming_link):
-    '''updates cache with streaming link for a specified TMDb ID and service
-    
-    opens the cache, updates it with a streaming link for a service, then saves the cache.
+def movie_results(tmdb_ids, criteria, runtime_gte, runtime_lte):
+    ''' gets the result details for a list of TMDb IDs, keeping the movies within the runtime range
 
     Parameters
     ----------
-    tmdb_id : int
-        the TMDb ID of the movie
-    service : str
-        the streaming service for which the link is being updated
-    streaming_link : str
-        the streaming link to be stored in the cache
+    tmdb_ids : list
+        the TMDb IDs from the Discover Movie endpoint
+    criteria : dict
+        the service, language, genre and duration chosen by the user
+    runtime_gte : int
+        the minimum runtime
+    runtime_lte : int
+        the maximum runtime
 
     Returns
     -------
-    none
+    list
+        the movie results, in Discover Movie order
     '''
-    cache = open_cache() # open the cache
-    cache[str(tmdb_id)]["streaming_link"][service] = streaming_link # check for existing streaming link
-
-    if streaming_link: # if streaming link available,
-        cache[str(tmdb_id)]["streaming_link"][service] = streaming_link # update cache with streaming link
-    else: # if streaming link not available,
-        cache[str(tmdb_id)]["streaming_link"][service] = "Streaming link not available." # update cache with missing link info
-    
-    save_cache(cache) # save the updates to the cache
+    movie_futures = [upstream_executor.submit(tmdb_movie_with_directors, tmdb_id) for tmdb_id in tmdb_ids] # fetch all Details and Credits at once
+    movies = [movie_future.result() for movie_future in movie_futures] # get additional movie details and directors from Details and Credits endpoints
 
-def get_streaming_link_from_cache(tmdb_id, user_service):
-    '''retrieves the streaming link from the cache for a specified TMDb ID and service
+    return build_results(tmdb_ids, movies, criteria, runtime_gte, runtime_lte)
 
-    opens the cache, checks if streaming link info is available for a service, and returns the link if available. else, returns None.
+def resolved_results(tmdb_ids, criteria, runtime_gte, runtime_lte, order):
+    ''' yields the result of each movie within the runtime range as soon as its Details and Credits resolve
 
     Parameters
     ----------
-    tmdb_id : int
-        the TMDb ID of the movie
-    user_service : str
-        the streaming service for which the link is being retrieved
+    tmdb_ids : list
+        the TMDb IDs from the Discover Movie endpoint
+    criteria : dict
+        the service, language, genre and duration chosen by the user
+    runtime_gte : int
+        the minimum runtime
+    runtime_lte : int
+        the maximum runtime
+    order : str
+        "discover" to keep the Discover Movie order, "arrival" to yield whichever movie resolves first
 
     Returns
     -------
-    str or None
-        the streaming link, if available, or None if not found in the cache
+    generator
+        (Discover Movie position, result) pairs
     '''
-    cache = open_cache() # open the cache
-    streaming_links = cache[str(tmdb_id)]["streaming_link"] # get streaming links info
-
-    if user_service in streaming_links: # if service is represented in streaming links info,
-        return streaming_links[user_service] # return the streaming link
+    movie_futures = {upstream_executor.submit(tmdb_movie_with_directors, tmdb_id): index for index, tmdb_id in enumerate(tmdb_ids)} # fetch all Details and Credits at once
 
-    return None # else, return None
+    for movie_future in (as_completed(movie_futures) if order == "arrival" else movie_futures):
+        index = movie_futures[movie_future]
 
-#################FUNCTIONS###############
+        for result in build_results([tmdb_ids[index]], [movie_future.result()], criteria, runtime_gte, runtime_lte):
+            yield index, result
 
-def get_tmdb_watch_provider(user_service):
-    ''' gets the TMDb watch provider ID for the specified streaming service
+def build_results(tmdb_ids, movies, criteria, runtime_gte, runtime_lte):
+    ''' builds the template results for fetched movies, keeping the movies within the runtime range
 
     Parameters
     ----------
-    user_service : str
-        the name of the streaming service
+    tmdb_ids : list
+        the TMDb IDs from the Discover Movie endpoint
+    movies : list
+        the (movie record, directors) pair of every TMDb ID, or None for a movie TMDb doesn't have
+    criteria : dict
+        the service, language, genre and duration chosen by the user
+    runtime_gte : int
+        the minimum runtime
+    runtime_lte : int
+        the maximum runtime
 
     Returns
     -------
-    int
-        the TMDb watch provider ID
+    list
+        the movie results, in Discover Movie order
     '''
-    url = "https://api.themoviedb.org/3/watch/providers/movie?language=en-US&watch_region=US"
+    results = [] # initialize list of movie results
 
-    headers = {
-        "accept": "application/json",
-        "Authorization": f"Bearer {TMDb_key}"
-    }
+    for tmdb_id, movie_with_directors in zip(tmdb_ids, movies): # keep the Discover Movie result order
+        if movie_with_directors is None: # if the movie was removed from TMDb, skip it
+            continue
 
-    params={
-        "api_key": TMDb_key
-    }
+        movie, directors = movie_with_directors
 
-    response = requests.get(url, headers=headers, params=params)
-    providers = response.json().get("results", [])
+        if runtime_gte <= movie.runtime <= runtime_lte: # account for any incorrect runtime input in TMDb Discover Movie endpoint
+            result = {
+                "tmdb_id": tmdb_id,
+                "title": movie.title,
+                "directors": ", ".join(directors),
+                "runtime": movie.runtime,
+                "genre": criteria["genre"],
+                "language": criteria["language"],
+                "service": criteria["service"],
+                "poster_path": movie.poster_path.lstrip("/") if movie.poster_path else None, # served resized through /poster
+                "overview": movie.overview,
+                "streaming_link": "" # initialize streaming link attribute for later use
+            }
+            results.append(result)
 
-    for provider in providers:
-        if provider["provider_name"] == user_service:
-            return provider["provider_id"]
+    return results
 
-def get_tmdb_genre_id(user_genre):
-    ''' gets the TMDb genre ID for the user-specified genre
+def is_canonical_search(criteria):
+    ''' checks whether the current request uses the canonical search URL for its criteria
 
     Parameters
     ----------
-    user_genre : str
-        the name of the genre
+    criteria : dict
+        the normalized criteria from normalize_criteria
 
     Returns
     -------
-    int
-        the TMDb genre ID
+    bool
+        True if the query string has exactly the canonical parameters, in order and spelling
     '''
-    url = "https://api.themoviedb.org/3/genre/movie/list?language=en"
+    return list(request.args) == list(CRITERIA_CHOICES) and all(request.args[name] == value for name, value in criteria.items())
 
-    headers = {
-        "accept": "application/json",
-        "Authorization": f"Bearer {TMDb_key}"
-    }
+def render_results_page(criteria, results, next_page, dependencies):
+    ''' renders the first results page for a search and keeps it in the rendered page cache
 
-    params={
-        "api_key": TMDb_key
-    }
+    Parameters
+    ----------
+    criteria : dict
+        the normalized criteria
+    results : list
+        the movie results
+    next_page : int or None
+        the next Discover Movie page
+    dependencies : set
+        the (namespace, key) cache entries the results are built from
 
-    response = requests.get(url, headers=headers, params=params)
-    genres = response.json().get("genres", [])
+    Returns
+    -------
+    RenderedPage
+        the cached page
+    '''
+    next_cursor = encode_cursor(criteria, next_page) if next_page else None
+    html = render_template("results.html", results=results, next_cursor=next_cursor) # render results.html with results
+    return rendered_pages.put(tuple(criteria.values()), html, dependencies, [result["tmdb_id"] for result in results])
 
-    for genre in genres:
-        if genre["name"] == user_genre:
-            return genre["id"]
+def stream_results_page(criteria):
+    ''' streams the first results page for a search: the page shell at once, then every result as its movie resolves
 
-def get_tmdb_language_id(user_language):
-    ''' gets the TMDb language ID for the user-specified language
+    results are sent in STREAM_RESULTS order. once every result is sent, the page is rendered in Discover Movie order
+    and kept in the rendered page cache, so the next search for the criteria gets the same page as without streaming.
 
     Parameters
     ----------
-    user_language : str
-        the name of the language
+    criteria : dict
+        the normalized criteria
 
     Returns
     -------
-    int
-        the TMDb language ID
+    generator
+        the page's HTML chunks
     '''
-    url = "https://api.themoviedb.org/3/configuration/languages"
+    discover_arguments = discover_criteria(criteria) # before the first chunk, so bad criteria still get a 400
+    cache_key, _, _, _, runtime_gte, runtime_lte = discover_arguments
 
-    headers = {
-        "accept": "application/json",
-        "Authorization": f"Bearer {TMDb_key}"
-    }
+    def chunks():
+        yield render_template("results_start.html") # the head and sidebar, before any upstream request
 
-    params={
-        "api_key": TMDb_key
-    }
+        pages = discover_movie_pages(*discover_arguments, 1)
+        placed, next_page, dependencies = [], None, set()
 
-    response = requests.get(url, headers=headers, params=params)
-    languages = response.json()
+        try:
+            for page, (tmdb_ids, next_page) in enumerate(islice(pages, MAX_PAGES_PER_LOAD), start=1):
+                add_page_dependencies(dependencies, cache_key, page, tmdb_ids)
 
-    for language in languages:
-        if language["english_name"] == user_language:
-            return language["iso_639_1"]
+                for index, result in resolved_results(tmdb_ids, criteria, runtime_gte, runtime_lte, STREAM_RESULTS):
+                    placed.append((index, result))
+                    yield render_template("result_items.html", results=[result])
 
-def tmdb_discover_movie(service, genre, original_language, runtime_gte, runtime_lte, language="en-US"):
-    ''' makes a request to the TMDb Discover Movie endpoint based on user-specified criteria
+                if placed: # stop at the first page with results
+                    break
+        except RequestException: # the 200 is already sent, so end the page with the message and don't cache it
+            yield render_template("results_end.html", results=[], unavailable=True)
+            return
+
+        yield finish_streamed_page(criteria, placed, next_page, dependencies)
+
+    return chunks()
+
+def finish_streamed_page(criteria, placed, next_page, dependencies):
+    ''' renders the end of a streamed results page and keeps the whole page in the rendered page cache
 
     Parameters
     ----------
-    service : str
-        the TMDb watch provider ID for filtering
-    genre : int
-        the TMDb genre ID for filtering
-    original_language : str
-        the TMDb language ID for filtering
-    runtime_gte : int
-        the minimum runtime (in minutes) for filtering
-    runtime_lte : int
-        the maximum runtime (in minutes) for filtering
-    language : str, optional
-        the language for movie details results (default of "en-US")
+    criteria : dict
+        the normalized criteria
+    placed : list
+        the (Discover Movie position, result) pairs sent
+    next_page : int or None
+        the next Discover Movie page
+    dependencies : set
+        the (namespace, key) cache entries the results are built from
 
     Returns
     -------
-    list
-        a list of TMDb IDs for movies that match the criteria
+    str
+        the rest of the page, after the results
     '''
-    url = "https://api.themoviedb.org/3/discover/movie"
-
-    headers = {
-        "accept": "application/json",
-        "Authorization": f"Bearer {TMDb_key}"
-    }
-
-    params={
-        "api_key": TMDb_key,
-        "include_adult": "false",
-        "include_video": "false",
-        "language": language,
-        "with_genres": genre,
-        "with_original_language": original_language,
-        "with_runtime.gte": runtime_gte,
-        "with_runtime.lte": runtime_lte,
-        "watch_region": "US",
-        "with_watch_providers": service
-    }
-
-    response = requests.get(url, headers=headers, params=params)
-    results = response.json().get("results", [])
-
-    return [result["id"] for result in results]
-
-def tmdb_movie_details(tmdb_id):
-    ''' makes a request to the TMDb Details endpoint for a specific movie
+    results = [result for _, result in sorted(placed, key=lambda item: item[0])] # back in Discover Movie order
+    render_results_page(criteria, results, next_page, dependencies)
+    prefetch_links(result["tmdb_id"] for result in results) # look up the top results' streaming links before they are clicked
+    next_cursor = encode_cursor(criteria, next_page) if next_page else None
+    return render_template("results_end.html", results=results, next_cursor=next_cursor)
+
+def streamed_results_response(chunks):
+    ''' builds the response for a streamed results page
+
+    the page has no ETag until it is complete, a later request for it is answered from the rendered page cache with one.
 
     Parameters
     ----------
-    tmdb_id : int
-        the TMDb ID of the movie
+    chunks : iterable
+        the page's HTML chunks, an async iterator when served by asgi.py
 
     Returns
     -------
-    dict
-        a dictionary containing movie details
+    flask.Response
+        the response
     '''
-    cached_details = get_movie_details_from_cache(tmdb_id) # check cache for movie details
-
-    if cached_details: # if cache already contains movie details,
-        return cached_details # return cached data
-    
-    url = f"https://api.themoviedb.org/3/movie/{tmdb_id}"
-
-    headers = {
-        "accept": "application/json",
-        "Authorization": f"Bearer {TMDb_key}"
-    }
-
-    params={
-        "api_key": TMDb_key,
-        "language": "en-US"
-    }
+    response = app.response_class(chunks, mimetype="text/html")
+    response.headers["Cache-Control"] = f"public, max-age={RESULTS_MAX_AGE}"
+    response.headers["X-Accel-Buffering"] = "no" # ask proxies like nginx to pass every chunk on at once
+    return response
 
-    response = requests.get(url, headers=headers, params=params) # if no data found in cache, make a request to TMDb Details endpoint
-    data = response.json()
-
-    update_cache_with_movie_details(tmdb_id, data) # update the cache
-    return data # return the retrieved data
-
-def tmdb_directors(tmdb_id):
-    ''' makes a request to the TMDb Credits endpoint to get the Director(s) for a specific movie
+def unavailable_response(fragment=False):
+    ''' builds the 503 response for a search TMDb couldn't answer, because its circuit is open or its retries ran out,
+    and the cache had no entry to serve instead
 
     Parameters
     ----------
-    tmdb_id : int
-        the TMDb ID of the movie
+    fragment : bool, optional
+        True to send only the (empty) list items, for "load more" (default of False)
 
     Returns
     -------
-    list
-        a list of directors for the movie, or a list containing "Unknown" if no crew and/or directors
+    flask.Response
+        the results page with an "unavailable, try again shortly" message
     '''
-    url = f"https://api.themoviedb.org/3/movie/{tmdb_id}/credits"
-
-    headers = {
-        "accept": "application/json",
-        "Authorization": f"Bearer {TMDb_key}"
-    }
-
-    params={
-        "api_key": TMDb_key,
-        "language": "en-US"
-    }
-
-    response = requests.get(url, headers=headers, params=params)
-    crew = response.json().get("crew", [])
-    if not crew: # if no crew data available,
-        return ["Unknown"] # return Unknown director
-    directors = [member["name"] for member in crew if member["job"] == "Director"]
-    if not directors: # if no director data available,
-        return ["Unknown"] # return Unknown director
-    return directors # return the list of directors
-        
-def get_streaming_link(tmdb_id, user_service):
-    ''' either retrieves data from the cache or makes a request to the StreamingAvailabilityAPI, updates the cache, and returns the retrieved streaming link
+    html = render_template("result_items.html", results=[]) if fragment else render_template("results.html", results=[], unavailable=True)
+    response = make_response(html, 503)
+    response.headers["Retry-After"] = str(int(BREAKER_COOLDOWN)) # an open circuit lets a trial request through after its cooldown
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+def results_page_response(page):
+    ''' builds the response for a rendered results page, 304 Not Modified if the browser already has it
 
     Parameters
     ----------
-    tmdb_id : int
-        the TMDb ID of the movie
-    user_service : str
-        the preferred streaming service
+    page : RenderedPage
+        the rendered page
 
     Returns
     -------
-    str or None
-        the streaming link, if available. otherwise, returns None
+    flask.Response
+        the response with its ETag and Cache-Control headers
     '''
-    cached_details = get_streaming_link_from_cache(tmdb_id, user_service) # check cache for streaming link
-
-    if cached_details: # if streaming link in cache,
-        return cached_details # return cached streaming link
-    
-    url = "https://streaming-availability.p.rapidapi.com/get"
-
-    querystring = {"output_language":"en","tmdb_id":f"movie/{tmdb_id}"}
-
-    headers = {
-        "X-RapidAPI-Key": StreamingAvailability_key,
-        "X-RapidAPI-Host": "streaming-availability.p.rapidapi.com"
-    }
+    response = make_response(page.html)
+    response.set_etag(page.etag)
+    response.headers["Cache-Control"] = f"public, max-age={RESULTS_MAX_AGE}"
+    return response.make_conditional(request)
 
-    response = requests.get(url, headers=headers, params=querystring) # else, make a request to StreamingAvailabilityAPI
-    result = response.json().get("result", {})
+def encode_cursor(criteria, page, after_local=False):
+    ''' encodes the search criteria and the next Discover Movie page as an opaque "load more" cursor
 
-    if "streamingInfo" in result and "us" in result["streamingInfo"]:
-        services = result["streamingInfo"]["us"]
-
-        for service in services:
-            if service["service"] == get_streaming_availability_service(user_service): # if user-specified service is available,
-                update_cache_with_streaming_link(tmdb_id, user_service, service["link"]) # update cache with retrieved streaming link
-                return service["link"] # return streaming link
+    Parameters
+    ----------
+    criteria : dict
+        the service, language, genre and duration chosen by the user
+    page : int
+        the next Discover Movie page
+    after_local : bool, optional
+        True if the pages served so far came from the local catalog (default of False)
 
-    return None
+    Returns
+    -------
+    str
+        the URL-safe cursor
+    '''
+    after_local = after_local or page == 1 # a next page of 1 follows the local catalog matches (see discover_movie_pages)
+    cursor = json.dumps({"criteria": criteria, "page": page, "after_local": after_local}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(cursor.encode()).decode().rstrip("=")
 
-def get_streaming_availability_service(user_service):
-    ''' gets the corresponding StreamingAvailabilityAPI service code for the given streaming service
+def decode_cursor(cursor):
+    ''' decodes a "load more" cursor, rejecting the request if it is malformed
 
     Parameters
     ----------
-    user_service : str
-        the name of the streaming service
+    cursor : str
+        the cursor from encode_cursor
 
     Returns
     -------
-    str
-        the corresponding StreamingAvailabilityAPI service code
+    tuple
+        the search criteria, the next Discover Movie page and whether the local catalog matches were served
     '''
-    service_mappings = {
-        "Netflix": "netflix",
-        "Prime": "prime",
-        "Disney": "disney",
-        "HBO Max": "hbo",
-        "Hulu": "hulu",
-        "Peacock": "peacock",
-        "Paramount": "paramount",
-        "Starz": "starz",
-        "Showtime": "showtime",
-        "Apple TV": "apple",
-        "MUBI": "mubi",
-    }
-    return service_mappings[user_service]
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        criteria, page, after_local = decoded["criteria"], int(decoded["page"]), bool(decoded.get("after_local"))
+        criteria = {name: str(criteria[name]) for name in ("service", "language", "genre", "duration")}
+    except (ValueError, KeyError, TypeError):
+        abort(400) # malformed cursor
+
+    if not 1 <= page <= DISCOVER_MAX_PAGE: # if the page is out of TMDb's range,
+        abort(400)
+
+    return criteria, page, after_local
 
 ##################FLASK##################
 
 @app.route('/')
 def index():
-    services = ["Netflix", "Prime", "Disney", "HBO Max", "Hulu", "Peacock", "Paramount", "Starz", "Showtime", "Apple TV", "MUBI"] # initialize values for streaming service dropdown
-    genres = ["Adventure","Fantasy","Animation","Drama","Horror","Action","Comedy","History","Western","Thriller","Crime","Documentary","Science Fiction","Mystery","Music","Romance","Family","War"] # initialize values for genre dropdown
-    languages = ["English", "French", "German", "Spanish", "Hindi", "Mandarin", "Japanese", "Korean"] # initialize values for language dropdown
-    durations = ["Short (< 89 min)", "Medium (90–120 min)", "Long (> 120 min)"] # initialize values for durations dropdown
+    services = SERVICES # initialize values for streaming service dropdown
+    genres = GENRES # initialize values for genre dropdown
+    languages = LANGUAGES # initialize values for language dropdown
+    durations = list(DURATION_RUNTIMES) # initialize values for durations dropdown
 
     return render_template("index.html", services=services, genres=genres, durations=durations, languages=languages) # render index.html
 
-@app.route("/search", methods=["POST"])
+@app.route("/search", methods=["GET", "POST"])
 def search():
-    user_service = request.form.get("service") # retrieve form service data
-    user_language = request.form.get("language") # retrieve form language data
-    user_genre = request.form.get("genre") # retrieve form genre data
-    user_duration = request.form.get("duration") # retrieve form duration data
-
-    if user_duration == "Short (< 89 min)": # short films
-        runtime_gte = 0 # runtime greater than or equal to 0
-        runtime_lte = 89 # runtime less than or equal to 89
-    elif user_duration == "Medium (90–120 min)": # medium films
-        runtime_gte = 90 # runtime greater than or equal to 90
-        runtime_lte = 120 # runtime less than or equal to 120
-    elif user_duration == "Long (> 120 min)": # long films
-        runtime_gte = 121 # runtime greater than or equal to 121
-        runtime_lte = 10000  # runtime less than or equal to 10,000
-
-    service_id = get_tmdb_watch_provider(user_service) # get TMDb watch provider ID
-    genre_id = get_tmdb_genre_id(user_genre) # get TMDb genre ID
-    language_id = get_tmdb_language_id(user_language) # get TMDb original language ID
+    if request.method == "POST": # if an old form posted the criteria,
+        return redirect(url_for("search", **normalize_criteria(request.form)), code=303) # send it to the cacheable GET URL
 
-    cache_key = f"{service_id}_{genre_id}_{language_id}_{runtime_gte}_{runtime_lte}" # generate Discover Movie endpoint cache key
-    tmdb_ids = tmdb_discover_movie_cached(cache_key, service_id, genre_id, language_id, runtime_gte, runtime_lte) # get list of TMDb IDs from Discover Movie endpoint
-    results = [] # initialize list of movie results
+    criteria = normalize_criteria(request.args) # retrieve the service, genre, language and duration
 
-    for tmdb_id in tmdb_ids:
-        movie = tmdb_movie_details(tmdb_id) # get additional movie details from Details endpoint
-        if runtime_gte <= movie["runtime"] <= runtime_lte: # account for any incorrect runtime input in TMDb Discover Movie endpoint
-            result = {
-                "tmdb_id": tmdb_id,
-                "title": movie["title"],
-                "directors": ", ".join(tmdb_directors(tmdb_id)), # get directors from Credits endpoint
-                "runtime": movie["runtime"],
-                "genre": user_genre,
-                "language": user_language,
-                "service": user_service,
-                "poster_path": f"https://image.tmdb.org/t/p/original/{movie['poster_path']}" if movie['poster_path'] else None,
-                "overview": movie["overview"],
-                "streaming_link": "" # initialize streaming link attribute for later use
-            }
-            results.append(result)
+    if not is_canonical_search(criteria): # if not the canonical URL,
+        return redirect(url_for("search", **criteria), code=301) # so browsers and proxies cache one URL per search
 
-    return render_template("results.html", results=results) # render results.html with results
+    page = rendered_pages.get(tuple(criteria.values())) # warm searches reuse the rendered page
+
+    if page is None and STREAM_RESULTS and not circuit_open(TMDB_HOST): # if not rendered and streaming is on, send results as they resolve, unless TMDb's circuit is open so a failure can still be a 503
+        return streamed_results_response(stream_with_context(stream_results_page(criteria)))
+
+    if page is None: # if not rendered since its entries last changed,
+        dependencies = set()
+
+        try:
+            results, next_page = search_results(criteria, 1, dependencies) # get results from the first Discover Movie page
+        except RequestException: # if TMDb is unavailable and nothing cached covers the search,
+            return unavailable_response()
+
+        page = render_results_page(criteria, results, next_page, dependencies)
+
+    prefetch_links(page.tmdb_ids) # look up the top results' streaming links before they are clicked
+    return results_page_response(page)
+
+@app.route("/search/more")
+def search_more():
+    criteria, page, after_local = decode_cursor(request.args.get("cursor", "")) # resume after the pages already served
+
+    try:
+        results, next_page = search_results(criteria, page, after_local=after_local)
+    except RequestException: # if TMDb is unavailable and nothing cached covers the next page,
+        return unavailable_response(fragment=bool(request.args.get("fragment")))
+
+    next_cursor = encode_cursor(criteria, next_page, after_local) if next_page else None
+    prefetch_links(result["tmdb_id"] for result in results)
+
+    if request.args.get("fragment"): # if the results page is appending to its list,
+        response = make_response(render_template("result_items.html", results=results)) # render only the new list items
+        response.headers["X-Next-Cursor"] = next_cursor or ""
+        return response
+
+    return render_template("results.html", results=results, next_cursor=next_cursor) # render results.html with results
 
 @app.route("/open_streaming_link", methods=["POST"])
 def open_streaming_link():
@@ -548,5 +597,46 @@ def open_streaming_link():
     else: # else if streaming link is not available,
         return render_template("open_streaming_link.html", streaming_link=streaming_link) # render open_streaming_link.html with streaming link
 
+@app.route("/streaming_link_status")
+def streaming_link_status():
+    try:
+        tmdb_ids = [int(tmdb_id) for tmdb_id in request.args.getlist("tmdb_id")]
+    except ValueError: # not a TMDb ID
+        abort(400)
+
+    return jsonify({str(tmdb_id): link_prefetcher.status(tmdb_id) for tmdb_id in tmdb_ids}) # whether each movie's link prefetch has finished
+
+@app.route("/poster/<size>/<filename>")
+def poster(size, filename):
+    for attempt in range(2): # a poster evicted between the lookup and the read is fetched again
+        try:
+            path = get_poster(size, filename) # a cached TMDb rendition, downloaded on the first request
+        except Exception: # if TMDb's image server is unreachable,
+            abort(502)
+
+        if path is None: # if the size or file name is invalid, or TMDb doesn't have the poster,
+            abort(404)
+
+        try:
+            response = send_file(path, mimetype=poster_content_type(filename), conditional=True) # opens the file, so a later eviction can't cut it short
+            break
+        except FileNotFoundError:
+            if attempt:
+                raise
+
+    response.headers["Cache-Control"] = f"public, max-age={POSTER_MAX_AGE}, immutable" # a poster file name never changes content
+    return response
+
+@app.route("/stats")
+def stats():
+    return jsonify(upstream=upstream_stats(), cache=cache_stats(), catalog=catalog_stats(), coalescing=coalescing_stats(),
+                   rendered_pages=rendered_pages.cache_stats(), posters=get_poster_cache().cache_stats(), prefetch=link_prefetcher.prefetch_stats(), refresh=stale_refresher.refresh_stats()) # report upstream (circuits included), cache, catalog, coalescing, rendered page, poster, prefetch and refresh counters
+
+@app.route("/metrics")
+def metrics():
+    response = make_response(registry.render()) # upstream, circuit, route, cache, coalescing, rendered page, poster, prefetch and refresh metrics for Prometheus
+    response.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+    return response
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
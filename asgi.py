@@ -0,0 +1,320 @@
+#########################################
+##### Name: Tara Dorje              #####
+##### Uniqname: tydorje             #####
+#########################################
+
+import asyncio
+import io
+import time
+
+import httpx
+from asgiref.wsgi import WsgiToAsgi
+from flask import redirect, render_template, request, url_for
+from requests import RequestException
+from werkzeug.exceptions import HTTPException
+
+from app import (app, MAX_PAGES_PER_LOAD, STREAM_RESULTS, rendered_pages, http_duration, http_in_flight, normalize_criteria, is_canonical_search,
+                 discover_criteria, add_page_dependencies, build_results, render_results_page, results_page_response, finish_streamed_page,
+                 streamed_results_response, unavailable_response)
+from link_prefetch import prefetch_links
+from profiling import PROFILING_ENABLED, should_profile, start_profile, finish_profile
+from tmdb import TMDB_HOST
+from tmdb_async import discover_movie_pages_async, tmdb_movie_with_directors_async
+from upstream import circuit_open
+from upstream_async import close_client
+
+wsgi_app = WsgiToAsgi(app) # every other route runs the Flask views in a thread pool
+
+##################SEARCH#################
+
+async def search_results_async(criteria, start_page, dependencies=None):
+    ''' the async counterpart of app.search_results: every movie on a page is fetched concurrently on the event loop
+
+    Parameters
+    ----------
+    criteria : dict
+        the service, language, genre and duration chosen by the user
+    start_page : int
+        the first Discover Movie page to read
+    dependencies : set, optional
+        filled with the (namespace, key) cache entries the results are built from
+
+    Returns
+    -------
+    tuple
+        the list of movie results and the next Discover Movie page, or None if there are no more pages
+    '''
+    discover_arguments = discover_criteria(criteria)
+    cache_key, _, _, _, runtime_gte, runtime_lte = discover_arguments
+    results, next_page = [], None
+    dependencies = set() if dependencies is None else dependencies
+    pages = discover_movie_pages_async(*discover_arguments, start_page) # lazily get lists of TMDb IDs from Discover Movie endpoint
+
+    page = start_page
+
+    async for tmdb_ids, next_page in pages:
+        add_page_dependencies(dependencies, cache_key, page, tmdb_ids)
+
+        movies = await asyncio.gather(*(tmdb_movie_with_directors_async(tmdb_id) for tmdb_id in tmdb_ids)) # fetch all Details and Credits at once
+        results = build_results(tmdb_ids, movies, criteria, runtime_gte, runtime_lte)
+
+        if results or page - start_page + 1 >= MAX_PAGES_PER_LOAD: # stop at the first page with results
+            break
+
+        page += 1
+
+    await pages.aclose()
+    return results, next_page
+
+async def resolved_results_async(tmdb_ids, criteria, runtime_gte, runtime_lte, order):
+    ''' the async counterpart of app.resolved_results: yields each result within the runtime range as soon as its movie resolves
+
+    Parameters
+    ----------
+    tmdb_ids : list
+        the TMDb IDs from the Discover Movie endpoint
+    criteria : dict
+        the service, language, genre and duration chosen by the user
+    runtime_gte : int
+        the minimum runtime
+    runtime_lte : int
+        the maximum runtime
+    order : str
+        "discover" to keep the Discover Movie order, "arrival" to yield whichever movie resolves first
+
+    Returns
+    -------
+    async generator
+        (Discover Movie position, result) pairs
+    '''
+    async def resolve(index, tmdb_id):
+        return index, await tmdb_movie_with_directors_async(tmdb_id)
+
+    tasks = [asyncio.ensure_future(resolve(index, tmdb_id)) for index, tmdb_id in enumerate(tmdb_ids)] # fetch all Details and Credits at once
+
+    try:
+        for task in (asyncio.as_completed(tasks) if order == "arrival" else tasks):
+            index, movie = await task
+
+            for result in build_results([tmdb_ids[index]], [movie], criteria, runtime_gte, runtime_lte):
+                yield index, result
+    finally:
+        for task in tasks: # the client went away, or a movie failed
+            task.cancel()
+
+def stream_results_page_async(criteria):
+    ''' the async counterpart of app.stream_results_page
+
+    Parameters
+    ----------
+    criteria : dict
+        the normalized criteria
+
+    Returns
+    -------
+    async generator
+        the page's HTML chunks, rendered inside the request context they are sent from
+    '''
+    discover_arguments = discover_criteria(criteria) # before the first chunk, so bad criteria still get a 400
+    cache_key, _, _, _, runtime_gte, runtime_lte = discover_arguments
+
+    async def chunks():
+        yield render_template("results_start.html") # the head and sidebar, before any upstream request
+
+        pages = discover_movie_pages_async(*discover_arguments, 1)
+        placed, next_page, dependencies, page = [], None, set(), 1
+
+        try:
+            async for tmdb_ids, next_page in pages:
+                add_page_dependencies(dependencies, cache_key, page, tmdb_ids)
+
+                async for index, result in resolved_results_async(tmdb_ids, criteria, runtime_gte, runtime_lte, STREAM_RESULTS):
+                    placed.append((index, result))
+                    yield render_template("result_items.html", results=[result])
+
+                if placed or page >= MAX_PAGES_PER_LOAD: # stop at the first page with results
+                    break
+
+                page += 1
+        except (httpx.HTTPError, RequestException): # the 200 is already sent, so end the page with the message and don't cache it
+            yield render_template("results_end.html", results=[], unavailable=True)
+            return
+        finally:
+            await pages.aclose()
+
+        yield finish_streamed_page(criteria, placed, next_page, dependencies)
+
+    return chunks()
+
+async def search():
+    ''' the async counterpart of the app.search view for GET requests, run inside a Flask request context
+
+    Parameters
+    ----------
+    none
+
+    Returns
+    -------
+    flask.Response
+        the results page, a 304 Not Modified, a redirect to the canonical search URL, or a 503 if TMDb is unavailable
+    '''
+    criteria = normalize_criteria(request.args) # retrieve the service, genre, language and duration
+
+    if not is_canonical_search(criteria): # if not the canonical URL,
+        return redirect(url_for("search", **criteria), code=301)
+
+    page = rendered_pages.get(tuple(criteria.values())) # warm searches reuse the rendered page
+
+    if page is None and STREAM_RESULTS and not circuit_open(TMDB_HOST): # if not rendered and streaming is on, send results as they resolve, unless TMDb's circuit is open so a failure can still be a 503
+        return streamed_results_response(stream_results_page_async(criteria))
+
+    if page is None: # if not rendered since its entries last changed,
+        dependencies = set()
+
+        try:
+            results, next_page = await search_results_async(criteria, 1, dependencies)
+        except (httpx.HTTPError, RequestException): # if TMDb is unavailable and nothing cached covers the search,
+            return unavailable_response()
+
+        page = render_results_page(criteria, results, next_page, dependencies)
+
+    prefetch_links(page.tmdb_ids) # look up the top results' streaming links before they are clicked
+    return results_page_response(page)
+
+##################ASGI###################
+
+def environ_from_scope(scope):
+    ''' builds the WSGI environ Flask needs for a request context from an ASGI HTTP scope
+
+    Parameters
+    ----------
+    scope : dict
+        the ASGI connection scope
+
+    Returns
+    -------
+    dict
+        the WSGI environ
+    '''
+    server_name, server_port = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server_name,
+        "SERVER_PORT": str(server_port),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(),
+        "wsgi.errors": io.StringIO()
+    }
+
+    for name, value in scope["headers"]:
+        name = name.decode("latin-1").upper().replace("-", "_")
+        environ[name if name in ("CONTENT_TYPE", "CONTENT_LENGTH") else f"HTTP_{name}"] = value.decode("latin-1")
+
+    return environ
+
+async def send_response(response, send, head=False):
+    ''' sends a Flask response over an ASGI connection
+
+    Parameters
+    ----------
+    response : flask.Response
+        the response
+    send : coroutine function
+        the ASGI send channel, a streamed body must be sent inside the request's context
+    head : bool, optional
+        True to leave out the body, for HEAD requests (default of False)
+
+    Returns
+    -------
+    none
+    '''
+    await send({
+        "type": "http.response.start",
+        "status": response.status_code,
+        "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in response.headers.items()]
+    })
+    chunks = response.response
+
+    if not hasattr(chunks, "__aiter__"): # a buffered body
+        await send({"type": "http.response.body", "body": b"" if head else response.get_data()})
+        return
+
+    try:
+        if not head:
+            async for chunk in chunks: # a streamed results page, every chunk sent as soon as it is rendered
+                await send({"type": "http.response.body", "body": chunk.encode(), "more_body": True})
+
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        await chunks.aclose()
+
+async def lifespan(receive, send):
+    ''' answers the ASGI server's startup and shutdown events, closing the async HTTP client on shutdown
+
+    Parameters
+    ----------
+    receive : coroutine function
+        the ASGI receive channel
+    send : coroutine function
+        the ASGI send channel
+
+    Returns
+    -------
+    none
+    '''
+    while True:
+        message = await receive()
+
+        if message["type"] == "lifespan.startup": # the app module already started the reference data registry
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await close_client()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def asgi_app(scope, receive, send):
+    ''' the ASGI entry point: GET /search runs on the event loop with non-blocking upstream requests,
+    every other route is served by the Flask app
+
+    Parameters
+    ----------
+    scope : dict
+        the ASGI connection scope
+    receive : coroutine function
+        the ASGI receive channel
+    send : coroutine function
+        the ASGI send channel
+
+    Returns
+    -------
+    none
+    '''
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+
+    if scope["type"] == "http" and scope["path"] == "/search" and scope["method"] in ("GET", "HEAD"):
+        started = time.perf_counter()
+
+        with app.request_context(environ_from_scope(scope)), http_in_flight.track_in_flight(): # request, url_for and render_template work as in the Flask view
+            profiled = PROFILING_ENABLED and should_profile(request.headers)
+            profile = start_profile("/search", scope["method"], scope["path"], dict(request.args)) if profiled else None # samples the event loop, other requests on it included
+
+            try:
+                response = await search()
+            except HTTPException as error: # bad criteria
+                response = error.get_response()
+
+            await send_response(response, send, head=scope["method"] == "HEAD") # a streamed page renders its results here
+
+            if profile is not None:
+                finish_profile(profile, response.status_code)
+
+        http_duration.observe(time.perf_counter() - started, route="/search", method=scope["method"], status=response.status_code) # Flask's hooks don't run here
+        return
+
+    await wsgi_app(scope, receive, send)
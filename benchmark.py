@@ -0,0 +1,403 @@
+#########################################
+##### Name: Tara Dorje              #####
+##### Uniqname: tydorje             #####
+#########################################
+
+import argparse
+import bisect
+import json
+import math
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+import requests
+
+from mock_upstream import PROVIDERS, GENRE_IDS, LANGUAGE_CODES, start_mock_upstream
+from tmdb import SERVICES, GENRES, LANGUAGES, DURATION_RUNTIMES
+
+REPO_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+TMDB_ID_PATTERN = re.compile(r'name="tmdb_id"\s+value="(\d+)"') # the hidden input of every result's "open streaming link" form
+PERCENTILES = (50, 95, 99)
+UNMETERED_QUOTA = 10 ** 6 # the mock doesn't meter StreamingAvailabilityAPI requests, so prefetching isn't capped
+
+##################WORKLOAD###############
+
+def fixture_criteria(fixtures_path):
+    ''' gets the search criteria of the Discover lists saved in a cache.json file, so their real movies are searched
+
+    Parameters
+    ----------
+    fixtures_path : str
+        the cache.json-shaped fixtures
+
+    Returns
+    -------
+    list
+        the criteria dictionaries, in canonical order
+    '''
+    names = ({str(provider_id): service for service, provider_id in PROVIDERS.items()}, {str(genre_id): genre for genre, genre_id in GENRE_IDS.items()},
+             {code: language for language, code in LANGUAGE_CODES.items()}, {f"{gte}_{lte}": duration for duration, (gte, lte) in DURATION_RUNTIMES.items()})
+    criteria = []
+
+    with open(fixtures_path, 'r') as cache_file:
+        cache = json.load(cache_file)
+
+    for key, value in cache.items():
+        parts = key.split("_")
+
+        if not isinstance(value, list) or len(parts) != 5: # only first Discover pages
+            continue
+
+        service, genre, language, duration = (table.get(part) for table, part in zip(names, (parts[0], parts[1], parts[2], f"{parts[3]}_{parts[4]}")))
+
+        if service and genre and language and duration:
+            criteria.append({"service": service, "genre": genre, "language": language, "duration": duration})
+
+    return criteria
+
+def build_workload(fixtures_path, searches, requests_count, link_fraction, seed):
+    ''' builds the request sequence every phase replays
+
+    Parameters
+    ----------
+    fixtures_path : str or None
+        the cache.json-shaped fixtures, whose searches are used first
+    searches : int
+        the number of distinct searches
+    requests_count : int
+        the number of requests
+    link_fraction : float
+        the fraction of requests that open a streaming link
+    seed : int
+        the random seed, so runs are comparable
+
+    Returns
+    -------
+    list
+        ("search", criteria) and ("link", service) requests, a link opens a movie from an earlier search result
+    '''
+    generator = random.Random(seed)
+    pool = fixture_criteria(fixtures_path)[:searches] if fixtures_path else []
+
+    while len(pool) < searches: # fill up with random searches, which the mock makes up movies for
+        pool.append({"service": generator.choice(SERVICES), "genre": generator.choice(GENRES),
+                     "language": generator.choice(LANGUAGES), "duration": generator.choice(list(DURATION_RUNTIMES))})
+
+    return [("link", generator.choice(SERVICES)) if generator.random() < link_fraction else ("search", generator.choice(pool))
+            for _ in range(requests_count)]
+
+##################LOAD###################
+
+class LoadGenerator:
+    ''' sends a workload at a fixed request rate and records each request's latency
+
+    requests are started on schedule whether or not earlier ones finished (an open loop), and latency is
+    measured from the scheduled start, so a slow server can't hide its queueing delay by slowing the generator down.
+
+    Parameters
+    ----------
+    base_url : str
+        the app's URL
+    rps : float
+        the target requests per second
+    workers : int
+        the most requests in flight at once
+    think_time : float, optional
+        seconds between a search returning a movie and a link request opening it, like a user reading the results (default of 1)
+    '''
+
+    def __init__(self, base_url, rps, workers, think_time=1):
+        self.base_url = base_url
+        self.rps = rps
+        self.workers = workers
+        self.think_time = think_time
+        self.tmdb_ids = [] # movies seen in search results, for link requests
+        self.seen_at = [] # time.monotonic() each of them was seen, in order
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+
+        if session is None: # one kept-alive connection per worker, like browsers
+            session = self._local.session = requests.Session()
+
+        return session
+
+    def send(self, request, scheduled):
+        ''' sends one request once its scheduled time comes
+
+        Parameters
+        ----------
+        request : tuple
+            the ("search", criteria) or ("link", service) request
+        scheduled : float
+            the time.monotonic() the request is scheduled for
+
+        Returns
+        -------
+        tuple
+            the request kind, the status code (0 for a connection error) and the latency in seconds
+        '''
+        time.sleep(max(0, scheduled - time.monotonic()))
+        kind, argument = request
+
+        try:
+            if kind == "search":
+                response = self._session().get(f"{self.base_url}/search?{urlencode(argument)}", timeout=60)
+                found = [int(tmdb_id) for tmdb_id in TMDB_ID_PATTERN.findall(response.text)]
+                with self._lock:
+                    self.tmdb_ids.extend(found)
+                    self.seen_at.extend([time.monotonic()] * len(found))
+            else:
+                with self._lock:
+                    seen = bisect.bisect_right(self.seen_at, time.monotonic() - self.think_time) # movies shown at least think_time ago
+                    tmdb_id = self.tmdb_ids[random.randrange(seen)] if seen else None
+
+                if tmdb_id is None: # no search has returned a movie long enough ago
+                    return kind, -1, 0.0
+
+                response = self._session().post(f"{self.base_url}/open_streaming_link", data={"tmdb_id": tmdb_id, "service": argument},
+                                                allow_redirects=False, timeout=60) # the redirect leaves the app
+            status = response.status_code
+        except requests.RequestException:
+            status = 0
+
+        return kind, status, time.monotonic() - scheduled
+
+    def run(self, workload):
+        ''' sends the workload at the target rate
+
+        Parameters
+        ----------
+        workload : list
+            the requests
+
+        Returns
+        -------
+        tuple
+            the (kind, status, latency) samples and the elapsed seconds
+        '''
+        started = time.monotonic() + 0.1
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(self.send, request, started + number / self.rps) for number, request in enumerate(workload)]
+            samples = [future.result() for future in futures]
+
+        return [sample for sample in samples if sample[1] != -1], time.monotonic() - started
+
+def percentile(values, percent):
+    ''' gets a percentile of a list of numbers by the nearest-rank method
+
+    Parameters
+    ----------
+    values : list
+        the numbers
+    percent : float
+        the percentile, from 0 to 100
+
+    Returns
+    -------
+    float
+        the percentile, or 0 for an empty list
+    '''
+    if not values:
+        return 0.0
+
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+def summarize(samples, elapsed, upstream_calls):
+    ''' summarizes one phase's samples
+
+    Parameters
+    ----------
+    samples : list
+        the (kind, status, latency) samples
+    elapsed : float
+        the phase's seconds
+    upstream_calls : dict
+        the mock server's calls per endpoint during the phase
+
+    Returns
+    -------
+    dict
+        the request and error counts, throughput, latency percentiles in milliseconds per request kind, and upstream calls
+    '''
+    summary = {"requests": len(samples), "errors": sum(1 for _, status, _ in samples if status == 0 or status >= 500),
+               "throughput_rps": round(len(samples) / elapsed, 2), "latency_ms": {}, "upstream_calls": upstream_calls,
+               "upstream_calls_per_request": round(sum(upstream_calls.values()) / max(len(samples), 1), 2)}
+
+    for kind in ("all", "search", "link"):
+        latencies = [latency for sample_kind, _, latency in samples if kind in ("all", sample_kind)]
+
+        if latencies:
+            summary["latency_ms"][kind] = {f"p{percent}": round(percentile(latencies, percent) * 1000, 1) for percent in PERCENTILES}
+
+    return summary
+
+##################SERVER#################
+
+def start_app(server, port, upstream_origin, directory):
+    ''' starts the app in a subprocess pointed at the mock upstream server, with an empty cache
+
+    the subprocess runs in a scratch directory, so cache.db, cache.json and reference_data.json start empty.
+
+    Parameters
+    ----------
+    server : str
+        "flask" for the threaded Flask server, or "asgi" for uvicorn
+    port : int
+        the port to serve on
+    upstream_origin : str
+        the mock server's URL, passed as UPSTREAM_ORIGIN
+    directory : str
+        the scratch directory
+
+    Returns
+    -------
+    subprocess.Popen
+        the running app
+    '''
+    environment = {"PREFETCH_QUOTA": str(UNMETERED_QUOTA), **os.environ, "UPSTREAM_ORIGIN": upstream_origin, "PYTHONPATH": REPO_DIRECTORY}
+
+    if server == "asgi":
+        command = [sys.executable, "-m", "uvicorn", "asgi:asgi_app", "--port", str(port), "--log-level", "warning"]
+    else:
+        command = [sys.executable, "-c", f"from app import app; app.run(port={port}, threaded=True)"]
+
+    process = subprocess.Popen(command, cwd=directory, env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+
+    while time.monotonic() < deadline: # wait until it answers
+        try:
+            requests.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return process
+        except requests.RequestException:
+            if process.poll() is not None:
+                break
+            time.sleep(0.2)
+
+    process.kill()
+    raise RuntimeError(f"the app did not start on port {port}")
+
+def wait_for_prefetch(base_url, timeout):
+    ''' waits until the app's background streaming link prefetches are done
+
+    Parameters
+    ----------
+    base_url : str
+        the app's URL
+    timeout : float
+        the most seconds to wait
+
+    Returns
+    -------
+    dict
+        the app's prefetch counters
+    '''
+    deadline = time.monotonic() + timeout
+
+    while True:
+        prefetch = requests.get(f"{base_url}/stats", timeout=10).json()["prefetch"]
+
+        if not prefetch["pending"] or time.monotonic() >= deadline:
+            return prefetch
+
+        time.sleep(0.5)
+
+def benchmark(args):
+    ''' runs the workload against a cold cache, then again against the warm cache
+
+    the warm phase starts once the prefetches queued by the cold phase are done (up to --prefetch-wait seconds),
+    so its link requests measure clicks on results whose links had time to be looked up.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        the command line arguments
+
+    Returns
+    -------
+    dict
+        the summary of the "cold" and "warm" phases
+    '''
+    mock = start_mock_upstream(args.fixtures, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate)
+    mock_url = f"http://127.0.0.1:{mock.server_address[1]}"
+    workload = build_workload(args.fixtures, args.searches, int(args.rps * args.duration), args.link_fraction, args.seed)
+    report = {}
+
+    with tempfile.TemporaryDirectory() as directory:
+        process = start_app(args.server, args.port, mock_url, directory)
+
+        try:
+            generator = LoadGenerator(f"http://127.0.0.1:{args.port}", args.rps, args.workers, args.think_time)
+
+            for phase in ("cold", "warm"):
+                requests.get(f"{mock_url}/__mock/reset")
+                samples, elapsed = generator.run(workload)
+                report[phase] = summarize(samples, elapsed, requests.get(f"{mock_url}/__mock/stats").json()["calls"])
+                report[phase]["prefetch"] = wait_for_prefetch(generator.base_url, args.prefetch_wait if phase == "cold" else 0)
+        finally:
+            process.terminate()
+            process.wait()
+            mock.shutdown()
+
+    return report
+
+def print_report(report):
+    ''' prints the phase summaries as a table
+
+    Parameters
+    ----------
+    report : dict
+        the summaries from benchmark
+
+    Returns
+    -------
+    none
+    '''
+    for phase, summary in report.items():
+        print(f"{phase}: {summary['requests']} requests, {summary['errors']} errors, {summary['throughput_rps']} req/s, "
+              f"{summary['upstream_calls_per_request']} upstream calls per request")
+
+        for kind, latencies in summary["latency_ms"].items():
+            print(f"  {kind:<7}" + "  ".join(f"{name} {value:>8.1f} ms" for name, value in latencies.items()))
+
+        print("  upstream " + ", ".join(f"{name} {count}" for name, count in sorted(summary["upstream_calls"].items())))
+        print("  prefetch (since start) " + ", ".join(f"{name} {summary['prefetch'].get(name, 0)}" for name in ("fetched", "already_cached", "failed", "skipped", "pending")))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test /search and /open_streaming_link offline against a mock TMDb / RapidAPI server, cold then warm.")
+    parser.add_argument("--rps", type=float, default=10, help="target requests per second (default: 10)")
+    parser.add_argument("--duration", type=float, default=30, help="seconds per phase (default: 30)")
+    parser.add_argument("--searches", type=int, default=40, help="distinct searches in the workload (default: 40)")
+    parser.add_argument("--link-fraction", type=float, default=0.3, help="fraction of requests opening a streaming link (default: 0.3)")
+    parser.add_argument("--think-time", type=float, default=1, help="seconds between a movie appearing in results and a link request opening it (default: 1)")
+    parser.add_argument("--prefetch-wait", type=float, default=180, help="most seconds to wait for the cold phase's link prefetches before the warm phase (default: 180)")
+    parser.add_argument("--workers", type=int, default=64, help="most requests in flight at once (default: 64)")
+    parser.add_argument("--server", choices=("flask", "asgi"), default="flask", help="serve with the threaded Flask server or uvicorn (default: flask)")
+    parser.add_argument("--port", type=int, default=5055, help="port for the app (default: 5055)")
+    parser.add_argument("--fixtures", default=os.path.join(REPO_DIRECTORY, "cache.json"), help="cache.json-shaped mock data (default: cache.json)")
+    parser.add_argument("--latency", type=float, default=0.05, help="mean seconds the mock adds to every response (default: 0.05)")
+    parser.add_argument("--jitter", type=float, default=0.02, help="seconds the mock latency varies by (default: 0.02)")
+    parser.add_argument("--error-rate", type=float, default=0, help="fraction of mock responses that are 503s (default: 0)")
+    parser.add_argument("--rate-limit-rate", type=float, default=0, help="fraction of mock responses that are 429s (default: 0)")
+    parser.add_argument("--seed", type=int, default=1, help="workload random seed (default: 1)")
+    parser.add_argument("--json", help="also write the report to this JSON file")
+    args = parser.parse_args()
+
+    report = benchmark(args)
+    print_report(report)
+
+    if args.json:
+        with open(args.json, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
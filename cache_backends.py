@@ -0,0 +1,681 @@
+#########################################
+##### Name: Tara Dorje              #####
+##### Uniqname: tydorje             #####
+#########################################
+
+import socket
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit
+
+# an entry row is (namespace, key, text, stored_at, expires_at, validators): the JSON text of the value, the time it
+# was stored, the time it expires (or None) and the JSON text of its upstream validators (or None)
+
+class CacheBackend:
+    ''' the persistence interface behind CacheStore
+
+    a backend stores entry rows per namespace. it knows nothing about TTLs, JSON or the memory tier:
+    CacheStore computes every time and encodes every value, so all backends behave the same.
+    cache_conformance.py checks that they do.
+    '''
+
+    def setup(self, namespace_ttls, legacy_rows):
+        ''' prepares storage for the namespaces, importing the legacy rows exactly once per cache
+
+        Parameters
+        ----------
+        namespace_ttls : dict
+            maps each cache namespace to its TTL in seconds
+        legacy_rows : callable
+            returns the entry rows to import from a legacy cache file
+
+        Returns
+        -------
+        none
+        '''
+        raise NotImplementedError
+
+    def get(self, namespace, key):
+        ''' reads one entry, fresh or expired
+
+        Parameters
+        ----------
+        namespace : str
+            the cache namespace
+        key : str
+            the entry key
+
+        Returns
+        -------
+        tuple or None
+            the (text, stored_at, expires_at, validators) of the entry, or None if missing
+        '''
+        raise NotImplementedError
+
+    def put_many(self, rows):
+        ''' writes entry rows atomically, replacing existing entries
+
+        Parameters
+        ----------
+        rows : list
+            the entry rows
+
+        Returns
+        -------
+        none
+        '''
+        raise NotImplementedError
+
+    def update(self, namespace, key, now, build_row):
+        ''' atomically reads one fresh entry and replaces it, excluding concurrent writers to the entry
+
+        Parameters
+        ----------
+        namespace : str
+            the cache namespace
+        key : str
+            the entry key
+        now : float
+            the current time, entries expiring at or before it are passed as None
+        build_row : callable
+            called with the current text (or None), returns the entry row to write
+
+        Returns
+        -------
+        tuple
+            the entry row written
+        '''
+        raise NotImplementedError
+
+    def touch(self, namespace, key, stored_at, expires_at):
+        ''' changes the stored and expiry times of an entry without rewriting its value
+
+        Parameters
+        ----------
+        namespace : str
+            the cache namespace
+        key : str
+            the entry key
+        stored_at : float
+            the new stored time
+        expires_at : float
+            the new expiry time
+
+        Returns
+        -------
+        none
+        '''
+        raise NotImplementedError
+
+    def items(self, namespace, now):
+        ''' reads every fresh entry in a namespace
+
+        Parameters
+        ----------
+        namespace : str
+            the cache namespace
+        now : float
+            the current time
+
+        Returns
+        -------
+        list
+            (key, text) tuples
+        '''
+        raise NotImplementedError
+
+    def evict(self, namespace, now, max_entries, keep_validated):
+        ''' deletes expired entries, then the oldest entries over max_entries
+
+        Parameters
+        ----------
+        namespace : str
+            the cache namespace
+        now : float
+            the current time
+        max_entries : int
+            the entries kept
+        keep_validated : float
+            the seconds expired entries with validators are kept past their expiry
+
+        Returns
+        -------
+        tuple
+            the number of expired and of evicted entries deleted
+        '''
+        raise NotImplementedError
+
+    def count(self, namespace):
+        ''' counts the entries in a namespace, fresh or expired
+
+        Parameters
+        ----------
+        namespace : str
+            the cache namespace
+
+        Returns
+        -------
+        int
+            the number of entries
+        '''
+        raise NotImplementedError
+
+def is_expired(expires_at, validators, now, keep_validated):
+    ''' checks whether an eviction sweep deletes an entry
+
+    Parameters
+    ----------
+    expires_at : float or None
+        the entry's expiry time
+    validators : str or None
+        the entry's validators
+    now : float
+        the current time
+    keep_validated : float
+        the seconds expired entries with validators are kept past their expiry
+
+    Returns
+    -------
+    bool
+        True if the entry should be deleted
+    '''
+    return expires_at is not None and expires_at <= now - (keep_validated if validators else 0)
+
+##################MEMORY#################
+
+class MemoryBackend(CacheBackend):
+    ''' keeps entries in process memory, for tests and single-process runs that don't need a cache on disk '''
+
+    def __init__(self):
+        self.namespaces = {}
+        self.migrated = False
+        self._lock = threading.RLock()
+
+    def setup(self, namespace_ttls, legacy_rows):
+        with self._lock:
+            for namespace in namespace_ttls:
+                self.namespaces.setdefault(namespace, {})
+
+            if not self.migrated:
+                self.put_many(legacy_rows())
+                self.migrated = True
+
+    def get(self, namespace, key):
+        with self._lock:
+            return self.namespaces[namespace].get(key)
+
+    def put_many(self, rows):
+        with self._lock:
+            for namespace, key, text, stored_at, expires_at, validators in rows:
+                self.namespaces[namespace][key] = (text, stored_at, expires_at, validators)
+
+    def update(self, namespace, key, now, build_row):
+        with self._lock:
+            entry = self.namespaces[namespace].get(key)
+            fresh = entry is not None and (entry[2] is None or entry[2] > now)
+            row = build_row(entry[0] if fresh else None)
+            self.put_many([row])
+            return row
+
+    def touch(self, namespace, key, stored_at, expires_at):
+        with self._lock:
+            entry = self.namespaces[namespace].get(key)
+            if entry is not None:
+                self.namespaces[namespace][key] = (entry[0], stored_at, expires_at, entry[3])
+
+    def items(self, namespace, now):
+        with self._lock:
+            return [(key, entry[0]) for key, entry in self.namespaces[namespace].items() if entry[2] is None or entry[2] > now]
+
+    def evict(self, namespace, now, max_entries, keep_validated):
+        with self._lock:
+            entries = self.namespaces[namespace]
+            expired = [key for key, entry in entries.items() if is_expired(entry[2], entry[3], now, keep_validated)]
+
+            for key in expired:
+                del entries[key]
+
+            oldest = sorted(entries, key=lambda key: entries[key][1])[:max(0, len(entries) - max_entries)]
+
+            for key in oldest:
+                del entries[key]
+
+            return len(expired), len(oldest)
+
+    def count(self, namespace):
+        with self._lock:
+            return len(self.namespaces[namespace])
+
+##################SQLITE#################
+
+class SQLiteBackend(CacheBackend):
+    ''' keeps entries in a SQLite database with one table per namespace
+
+    the database runs in WAL mode so readers never block the writer, and every read or write is a single
+    primary-key lookup. each thread gets its own connection, and writes that must be atomic run in
+    BEGIN IMMEDIATE transactions, so several processes can share the file.
+
+    Parameters
+    ----------
+    path : str
+        the path of the SQLite database file
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        ''' returns the calling thread's connection, opening it if needed
+
+        Parameters
+        ----------
+        none
+
+        Returns
+        -------
+        sqlite3.Connection
+            the thread-local database connection
+        '''
+        connection = getattr(self._local, "connection", None)
+
+        if connection is None: # if this thread has no connection yet,
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None) # autocommit, transactions are explicit
+            connection.execute("PRAGMA journal_mode=WAL") # readers don't block the writer
+            connection.execute("PRAGMA synchronous=NORMAL") # durable at checkpoints, fast per write
+            self._local.connection = connection
+
+        return connection
+
+    def _transaction(self, function):
+        ''' runs a function in a BEGIN IMMEDIATE transaction, which locks out other writers
+
+        Parameters
+        ----------
+        function : callable
+            called with the connection
+
+        Returns
+        -------
+        object
+            the function's result
+        '''
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+
+        try:
+            result = function(connection)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+        return result
+
+    def setup(self, namespace_ttls, legacy_rows):
+        ''' creates the namespace tables and imports the legacy rows if this is a new database
+
+        tables created before entries had expiry times get the new columns, and their rows start
+        their TTL now. tables created before validators were kept get an empty validators column.
+        '''
+        def create(connection):
+            connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+            for namespace, ttl in namespace_ttls.items():
+                connection.execute(f"CREATE TABLE IF NOT EXISTS {namespace} (key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL DEFAULT 0, expires_at REAL, validators TEXT)")
+                columns = {row[1] for row in connection.execute(f"PRAGMA table_info({namespace})")}
+
+                if "stored_at" not in columns: # if the table predates expiry times,
+                    connection.execute(f"ALTER TABLE {namespace} ADD COLUMN stored_at REAL NOT NULL DEFAULT 0")
+                    connection.execute(f"ALTER TABLE {namespace} ADD COLUMN expires_at REAL")
+                    connection.execute(f"UPDATE {namespace} SET stored_at = ?, expires_at = ?", (time.time(), time.time() + ttl))
+
+                if "validators" not in columns: # if the table predates upstream validators,
+                    connection.execute(f"ALTER TABLE {namespace} ADD COLUMN validators TEXT")
+
+                connection.execute(f"CREATE INDEX IF NOT EXISTS {namespace}_stored_at ON {namespace} (stored_at)") # oldest-first eviction
+
+            migrated = connection.execute("SELECT value FROM meta WHERE key = 'legacy_migrated'").fetchone()
+
+            if not migrated: # if the legacy cache has not been imported yet,
+                self._insert(connection, legacy_rows())
+                connection.execute("INSERT INTO meta (key, value) VALUES ('legacy_migrated', '1')")
+
+        self._transaction(create) # serialize schema setup between processes
+
+    def _insert(self, connection, rows):
+        ''' writes entry rows with an open connection
+
+        Parameters
+        ----------
+        connection : sqlite3.Connection
+            the connection to write with
+        rows : list
+            the entry rows
+
+        Returns
+        -------
+        none
+        '''
+        for namespace, key, text, stored_at, expires_at, validators in rows:
+            connection.execute(f"INSERT OR REPLACE INTO {namespace} (key, value, stored_at, expires_at, validators) VALUES (?, ?, ?, ?, ?)",
+                               (key, text, stored_at, expires_at, validators))
+
+    def get(self, namespace, key):
+        return self._connection().execute(f"SELECT value, stored_at, expires_at, validators FROM {namespace} WHERE key = ?", (key,)).fetchone()
+
+    def put_many(self, rows):
+        if len(rows) == 1: # a single statement is atomic on its own
+            self._insert(self._connection(), rows)
+        else:
+            self._transaction(lambda connection: self._insert(connection, rows))
+
+    def update(self, namespace, key, now, build_row):
+        def read_and_write(connection):
+            row = connection.execute(f"SELECT value FROM {namespace} WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)", (key, now)).fetchone()
+            new_row = build_row(row[0] if row else None)
+            self._insert(connection, [new_row])
+            return new_row
+
+        return self._transaction(read_and_write) # lock out other writers between the read and the write
+
+    def touch(self, namespace, key, stored_at, expires_at):
+        self._connection().execute(f"UPDATE {namespace} SET stored_at = ?, expires_at = ? WHERE key = ?", (stored_at, expires_at, key))
+
+    def items(self, namespace, now):
+        return self._connection().execute(f"SELECT key, value FROM {namespace} WHERE expires_at IS NULL OR expires_at > ?", (now,)).fetchall()
+
+    def evict(self, namespace, now, max_entries, keep_validated):
+        def sweep(connection):
+            expired = connection.execute(f"DELETE FROM {namespace} WHERE expires_at IS NOT NULL AND expires_at <= ? - (CASE WHEN validators IS NULL THEN 0 ELSE ? END)",
+                                         (now, keep_validated)).rowcount
+            excess = connection.execute(f"SELECT COUNT(*) FROM {namespace}").fetchone()[0] - max_entries
+            evicted = 0
+
+            if excess > 0: # if the namespace is over its cap,
+                evicted = connection.execute(f"DELETE FROM {namespace} WHERE key IN (SELECT key FROM {namespace} ORDER BY stored_at LIMIT ?)", (excess,)).rowcount # delete the oldest entries
+
+            return expired, evicted
+
+        return self._transaction(sweep)
+
+    def count(self, namespace):
+        return self._connection().execute(f"SELECT COUNT(*) FROM {namespace}").fetchone()[0]
+
+##################REDIS##################
+
+class RespError(Exception):
+    ''' an error reply from a Redis-protocol server '''
+
+class RespConnection:
+    ''' a minimal blocking client for the Redis serialization protocol (RESP2)
+
+    Parameters
+    ----------
+    host : str
+        the server host
+    port : int
+        the server port
+    db : int, optional
+        the database number to SELECT (default of 0)
+    timeout : float, optional
+        the socket timeout in seconds (default of 5)
+    '''
+
+    def __init__(self, host, port, db=0, timeout=5):
+        self.socket = socket.create_connection((host, port), timeout=timeout)
+        self.reader = self.socket.makefile('rb')
+
+        if db: # the default database needs no SELECT
+            self.execute("SELECT", db)
+
+    def execute(self, *command):
+        ''' sends one command and reads its reply
+
+        Parameters
+        ----------
+        *command
+            the command name and arguments
+
+        Returns
+        -------
+        object
+            the decoded reply
+        '''
+        return self.pipeline([command])[0]
+
+    def pipeline(self, commands):
+        ''' sends several commands in one write and reads their replies in order
+
+        Parameters
+        ----------
+        commands : list
+            the commands, each a tuple of name and arguments
+
+        Returns
+        -------
+        list
+            the decoded replies (an error reply is returned as a RespError, not raised)
+        '''
+        self.socket.sendall(b"".join(self._encode(command) for command in commands))
+        replies = [self._read() for _ in commands]
+
+        for reply in replies:
+            if isinstance(reply, RespError) and len(commands) == 1:
+                raise reply
+
+        return replies
+
+    def _encode(self, command):
+        ''' encodes a command as a RESP array of bulk strings '''
+        parts = [str(part).encode() if not isinstance(part, bytes) else part for part in command]
+        return b"".join([f"*{len(parts)}\r\n".encode()] + [f"${len(part)}\r\n".encode() + part + b"\r\n" for part in parts])
+
+    def _read(self):
+        ''' reads and decodes one RESP reply '''
+        line = self.reader.readline()
+
+        if not line: # the server closed the connection
+            raise ConnectionError("Redis-protocol server closed the connection")
+
+        kind, body = line[:1], line[1:-2]
+
+        if kind == b"+":
+            return body.decode()
+        if kind == b"-":
+            return RespError(body.decode())
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            length = int(body)
+            if length == -1: # nil
+                return None
+            data = self.reader.read(length + 2)[:-2]
+            return data.decode()
+        if kind == b"*":
+            length = int(body)
+            return None if length == -1 else [self._read() for _ in range(length)]
+
+        raise RespError(f"unknown reply type {line!r}")
+
+class RedisBackend(CacheBackend):
+    ''' keeps entries on a Redis-protocol server, so every app instance shares one warm cache
+
+    each entry is a hash at "<prefix>:<namespace>:<key>" with value, stored_at, expires_at and validators fields,
+    and each namespace has a sorted set of its keys by stored time for counting, listing and oldest-first eviction.
+    multi-entry writes run in MULTI/EXEC, and updates use WATCH so a concurrent writer makes them retry.
+
+    Parameters
+    ----------
+    url : str
+        the server URL, "redis://host:port/db"
+    prefix : str, optional
+        the key prefix (default of "movie-cache")
+    '''
+
+    def __init__(self, url, prefix="movie-cache"):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or 6379
+        self.db = int(parts.path.strip("/") or 0)
+        self.prefix = prefix
+        self._local = threading.local()
+
+    def _connection(self):
+        ''' returns the calling thread's connection, opening it if needed
+
+        Parameters
+        ----------
+        none
+
+        Returns
+        -------
+        RespConnection
+            the thread-local server connection
+        '''
+        connection = getattr(self._local, "connection", None)
+
+        if connection is None:
+            connection = self._local.connection = RespConnection(self.host, self.port, self.db)
+
+        return connection
+
+    def _entry_key(self, namespace, key):
+        return f"{self.prefix}:{namespace}:{key}"
+
+    def _index_key(self, namespace):
+        return f"{self.prefix}:{namespace}"
+
+    def _write_commands(self, rows):
+        ''' gets the commands that write entry rows
+
+        Parameters
+        ----------
+        rows : list
+            the entry rows
+
+        Returns
+        -------
+        list
+            the commands
+        '''
+        commands = []
+
+        for namespace, key, text, stored_at, expires_at, validators in rows:
+            entry_key = self._entry_key(namespace, key)
+            commands.append(("DEL", entry_key))
+            commands.append(("HSET", entry_key, "value", text, "stored_at", repr(stored_at),
+                             "expires_at", "" if expires_at is None else repr(expires_at), "validators", validators or ""))
+            commands.append(("ZADD", self._index_key(namespace), repr(stored_at), key))
+
+        return commands
+
+    def _decode(self, fields):
+        ''' decodes an HMGET reply of value, stored_at, expires_at and validators into an entry tuple '''
+        text, stored_at, expires_at, validators = fields
+
+        if text is None: # missing entry
+            return None
+
+        return text, float(stored_at), float(expires_at) if expires_at else None, validators or None
+
+    def setup(self, namespace_ttls, legacy_rows):
+        if self._connection().execute("SET", f"{self.prefix}:legacy_migrated", "1", "NX") == "OK": # only the first instance imports
+            self.put_many(legacy_rows())
+
+    def get(self, namespace, key):
+        return self._decode(self._connection().execute("HMGET", self._entry_key(namespace, key), "value", "stored_at", "expires_at", "validators"))
+
+    def put_many(self, rows):
+        if not rows:
+            return
+
+        replies = self._connection().pipeline([("MULTI",)] + self._write_commands(rows) + [("EXEC",)])
+
+        if isinstance(replies[-1], RespError):
+            raise replies[-1]
+
+    def update(self, namespace, key, now, build_row):
+        connection = self._connection()
+        entry_key = self._entry_key(namespace, key)
+
+        while True: # optimistic: retry if another writer changes the entry between WATCH and EXEC
+            connection.execute("WATCH", entry_key)
+            entry = self.get(namespace, key)
+            fresh = entry is not None and (entry[2] is None or entry[2] > now)
+            row = build_row(entry[0] if fresh else None)
+            replies = connection.pipeline([("MULTI",)] + self._write_commands([row]) + [("EXEC",)])
+
+            if replies[-1] is not None: # EXEC ran, nothing changed the entry
+                return row
+
+    def touch(self, namespace, key, stored_at, expires_at):
+        entry_key = self._entry_key(namespace, key)
+        self._connection().pipeline([
+            ("MULTI",),
+            ("HSET", entry_key, "stored_at", repr(stored_at), "expires_at", repr(expires_at)),
+            ("ZADD", self._index_key(namespace), repr(stored_at), key),
+            ("EXEC",)
+        ])
+
+    def _entries(self, namespace):
+        ''' reads every entry of a namespace, in oldest-first order
+
+        Parameters
+        ----------
+        namespace : str
+            the cache namespace
+
+        Returns
+        -------
+        list
+            (key, entry tuple or None) pairs
+        '''
+        connection = self._connection()
+        keys = connection.execute("ZRANGE", self._index_key(namespace), 0, -1)
+        replies = connection.pipeline([("HMGET", self._entry_key(namespace, key), "value", "stored_at", "expires_at", "validators") for key in keys])
+        return [(key, self._decode(fields)) for key, fields in zip(keys, replies)]
+
+    def items(self, namespace, now):
+        return [(key, entry[0]) for key, entry in self._entries(namespace) if entry is not None and (entry[2] is None or entry[2] > now)]
+
+    def evict(self, namespace, now, max_entries, keep_validated):
+        entries = self._entries(namespace)
+        expired = [key for key, entry in entries if entry is None or is_expired(entry[2], entry[3], now, keep_validated)]
+        remaining = [key for key, entry in entries if key not in set(expired)]
+        oldest = remaining[:max(0, len(remaining) - max_entries)] # the index is ordered by stored time
+        deleted = expired + oldest
+
+        if deleted:
+            commands = [("DEL", self._entry_key(namespace, key)) for key in deleted] + [("ZREM", self._index_key(namespace), *deleted)]
+            self._connection().pipeline(commands)
+
+        return len(expired), len(oldest)
+
+    def count(self, namespace):
+        return self._connection().execute("ZCARD", self._index_key(namespace))
+
+def backend_from_config(setting, sqlite_path):
+    ''' creates the cache backend named by the CACHE_BACKEND setting
+
+    Parameters
+    ----------
+    setting : str
+        "sqlite", "memory" or a "redis://host:port/db" URL
+    sqlite_path : str
+        the database path for the SQLite backend
+
+    Returns
+    -------
+    CacheBackend
+        the backend
+    '''
+    if setting == "sqlite":
+        return SQLiteBackend(sqlite_path)
+    if setting == "memory":
+        return MemoryBackend()
+    if setting.startswith("redis://"):
+        return RedisBackend(setting)
+
+    raise ValueError(f"unknown CACHE_BACKEND {setting!r}, expected sqlite, memory or a redis:// URL")
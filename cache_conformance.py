@@ -0,0 +1,192 @@
+#########################################
+##### Name: Tara Dorje              #####
+##### Uniqname: tydorje             #####
+#########################################
+
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+
+import cache_store
+from cache_backends import MemoryBackend, SQLiteBackend, RedisBackend
+from redis_standin import start_standin
+
+def check(results, name, condition):
+    ''' records one conformance check
+
+    Parameters
+    ----------
+    results : list
+        the (name, passed) results so far
+    name : str
+        what is checked
+    condition : bool
+        whether the backend passed
+
+    Returns
+    -------
+    none
+    '''
+    results.append((name, bool(condition)))
+
+def conformance(make_store, legacy_path):
+    ''' runs the same cache behaviors against one backend
+
+    Parameters
+    ----------
+    make_store : callable
+        called with a legacy cache path (or None), returns a new CacheStore on the backend's storage,
+        the same storage on every call
+    legacy_path : str
+        the path of a legacy cache.json to migrate
+
+    Returns
+    -------
+    list
+        the (name, passed) results
+    '''
+    results = []
+    store = make_store(legacy_path)
+
+    check(results, "legacy cache migrated", store.get("discover", "legacy") == [1, 2, 3])
+    check(results, "legacy movie migrated", store.get("streaming_link", 7) == {"netflix": "https://example.com/7"})
+    store.put("discover", "legacy", [9])
+    check(results, "legacy cache migrated once", make_store(legacy_path).get("discover", "legacy") == [9])
+
+    store.put("directors", 1, ["Agnès Varda"])
+    check(results, "put then get", store.get("directors", 1) == ["Agnès Varda"])
+    check(results, "missing key", store.get("directors", 404) is None)
+    check(results, "int and str keys match", store.get("directors", "1") == ["Agnès Varda"])
+
+    store.put_many([("directors", 2, ["A"]), ("availability", 2, {"streamingOptions": {}})], ttl=60)
+    check(results, "put_many writes every namespace", store.get("directors", 2) == ["A"] and store.get("availability", 2) == {"streamingOptions": {}})
+
+    other = make_store(None) # a second process on the same storage, with its own memory tier
+    check(results, "writes visible to another store", other.get("directors", 1) == ["Agnès Varda"])
+
+    store.put("discover", "short", [1], ttl=-1)
+    check(results, "expired entry is a miss", store.get("discover", "short") is None and other.get("discover", "short") is None)
+    check(results, "expired entry without validators is not stale", store.get_stale("discover", "short") == (None, None))
+
+    store.put("discover", "validated", [5], ttl=-10, validators={"etag": '"v1"'})
+    check(results, "expired entry with validators is stale", other.get_stale("discover", "validated") == ([5], {"etag": '"v1"'}))
+    other.extend("discover", "validated", 60)
+    check(results, "extend makes it fresh", store.get("discover", "validated") == [5] and other.get_stale("discover", "validated") == (None, None))
+
+    keys = dict(store.items("discover"))
+    check(results, "items lists fresh entries only", "validated" in keys and "short" not in keys)
+
+    check(results, "stale entry is servable until its hard expiry", other.get_servable("discover", "short") == [1])
+    store.put("discover", "gone", [2], ttl=-cache_store.NAMESPACE_STALE_TTLS["discover"] - 1)
+    check(results, "entry past its hard expiry is not servable", store.get_servable("discover", "gone") is None)
+    check(results, "any_age serves past the hard expiry", other.get_servable("discover", "gone", any_age=True) == [2])
+
+    store.put("discover", "old", [0], ttl=-2 * cache_store.REVALIDATION_WINDOW, validators={"etag": '"old"'})
+    store.evict("discover")
+    check(results, "evict deletes entries past their hard expiry", store.get_servable("discover", "gone", any_age=True) is None and store.cache_stats()["discover"].get("expired_deleted", 0) >= 2)
+    check(results, "evict keeps stale entries before their hard expiry", store.get_servable("discover", "short") == [1])
+    check(results, "evict keeps validated entries in the window", other.get("discover", "validated") == [5])
+
+    saved = cache_store.NAMESPACE_MAX_ENTRIES["directors"]
+    cache_store.NAMESPACE_MAX_ENTRIES["directors"] = 2
+
+    try:
+        for tmdb_id in range(10, 15):
+            store.put("directors", tmdb_id, [str(tmdb_id)])
+            time.sleep(0.001) # distinct stored times
+        store.evict("directors")
+    finally:
+        cache_store.NAMESPACE_MAX_ENTRIES["directors"] = saved
+
+    survivors = {key for key, _ in store.items("directors")}
+    check(results, "evict keeps the newest entries over the cap", survivors == {"13", "14"})
+    check(results, "count matches after eviction", store.cache_stats()["directors"]["entries"] == 2)
+
+    def add_link(number):
+        writer = make_store(None) if number % 2 else store # half the threads write through another store
+
+        def add(links):
+            links = links or {}
+            links[f"service{number}"] = number
+            return links
+
+        for _ in range(20):
+            writer.update("streaming_link", 99, add)
+
+    threads = [threading.Thread(target=add_link, args=(number,)) for number in range(8)]
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    check(results, "concurrent updates keep every write", other.backend.get("streaming_link", "99") is not None
+          and set(json.loads(other.backend.get("streaming_link", "99")[0])) == {f"service{number}" for number in range(8)})
+
+    heard = []
+    store.add_listener(lambda namespace, key: heard.append((namespace, key)))
+    store.put("discover", "listened", [1])
+    check(results, "listeners hear writes", ("discover", "listened") in heard)
+
+    return results
+
+def run(backends):
+    ''' runs the conformance checks against the named backends
+
+    Parameters
+    ----------
+    backends : list
+        any of "memory", "sqlite" and "redis"
+
+    Returns
+    -------
+    dict
+        maps each backend to its (name, passed) results
+    '''
+    report = {}
+
+    with tempfile.TemporaryDirectory() as directory:
+        legacy_path = os.path.join(directory, "cache.json")
+
+        with open(legacy_path, 'w') as legacy_file:
+            json.dump({"legacy": [1, 2, 3], "7": {"movie_details": None, "streaming_link": {"netflix": "https://example.com/7"}}}, legacy_file)
+
+        for name in backends:
+            if name == "memory":
+                backend = MemoryBackend()
+                make_backend = lambda: backend # one process, so every store shares the object
+            elif name == "sqlite":
+                path = os.path.join(directory, "conformance.db")
+                make_backend = lambda: SQLiteBackend(path)
+            else:
+                server = start_standin()
+                url = f"redis://127.0.0.1:{server.server_address[1]}/0"
+                make_backend = lambda: RedisBackend(url)
+
+            report[name] = conformance(lambda legacy: cache_store.CacheStore(make_backend(), legacy), legacy_path)
+
+            if name == "redis":
+                server.shutdown()
+
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that every cache backend behaves the same.")
+    parser.add_argument("backends", nargs="*", default=["memory", "sqlite", "redis"], help="backends to check (default: all)")
+    args = parser.parse_args()
+
+    failed = 0
+
+    for name, results in run(args.backends).items():
+        print(f"{name}: {sum(passed for _, passed in results)}/{len(results)} passed")
+
+        for check_name, passed in results:
+            if not passed:
+                failed += 1
+                print(f"  FAILED {check_name}")
+
+    if failed:
+        raise SystemExit(1)
@@ -0,0 +1,1142 @@
+#########################################
+##### Name: Tara Dorje              #####
+##### Uniqname: tydorje             #####
+#########################################
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from cache_backends import SQLiteBackend, backend_from_config
+from file_lock import file_lock, atomic_write_json
+from metrics import registry
+from movie_record import project_movie, encode_movie, decode_movie, movie_to_dict
+
+##################STORE##################
+
+CACHE_FILE = "cache.json" # legacy whole-file cache, migrated into CACHE_DB on first start
+CACHE_DB = "cache.db" # SQLite cache database
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "sqlite") # "sqlite" (CACHE_DB), "memory" or a "redis://host:port/db" URL
+
+NAMESPACES = ("discover", "movie_details", "raw_details", "directors", "availability", "streaming_link") # one table per cache namespace
+
+DAY = 24 * 60 * 60
+
+NAMESPACE_TTLS = { # seconds an entry stays fresh, short where the catalog or availability changes often
+    "discover": DAY,
+    "movie_details": 30 * DAY,
+    "raw_details": 30 * DAY,
+    "directors": 30 * DAY,
+    "availability": DAY,
+    "streaming_link": DAY
+}
+
+NAMESPACE_STALE_TTLS = { # seconds past its expiry (soft expiry) an entry is still served while it is refreshed in the background (up to its hard expiry)
+    "discover": DAY,
+    "movie_details": 30 * DAY,
+    "raw_details": 30 * DAY,
+    "directors": 30 * DAY,
+    "availability": 6 * 60 * 60, # a link that left its service shouldn't be served for long
+    "streaming_link": 6 * 60 * 60
+}
+
+NAMESPACE_MAX_ENTRIES = { # persistent entries kept per namespace before the oldest are evicted
+    "discover": 20000,
+    "movie_details": 100000,
+    "raw_details": 100000,
+    "directors": 100000,
+    "availability": 100000,
+    "streaming_link": 100000
+}
+
+MEMORY_BUDGET = int(os.environ.get("CACHE_MEMORY_BUDGET", 32 * 1024 * 1024)) # bytes of encoded entries kept in the in-process LRU tier
+EVICTION_INTERVAL = 500 # writes to a namespace between persistent eviction sweeps
+REVALIDATION_WINDOW = 30 * DAY # seconds an expired entry with validators is kept for conditional requests
+STORE_RAW_DETAILS = os.environ.get("STORE_RAW_DETAILS") == "1" # also keep full TMDb Details payloads in the raw_details namespace
+JSON_SEPARATORS = (",", ":") # entries are stored without the default ", " / ": " padding
+
+class LRUCache:
+    ''' an in-process least-recently-used cache of encoded entries with a memory budget
+
+    keys are (namespace, key) tuples and values are the JSON text of the entry, so each hit
+    decodes a private copy and the budget is measured in encoded bytes.
+
+    Parameters
+    ----------
+    budget : int
+        the maximum total size in bytes of the cached JSON text
+    '''
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.size = 0
+        self.evictions = Counter() # evictions per namespace
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        ''' gets a fresh entry and marks it as most recently used
+
+        Parameters
+        ----------
+        key : tuple
+            the (namespace, key) of the entry
+
+        Returns
+        -------
+        str or None
+            the JSON text, or None if the entry is missing or expired
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None: # not cached in memory
+                return None
+
+            text, expires_at = entry
+
+            if expires_at is not None and expires_at <= time.time(): # if the entry is stale,
+                self._remove(key) # drop it
+                return None
+
+            self._entries.move_to_end(key)
+            return text
+
+    def put(self, key, text, expires_at):
+        ''' adds or replaces an entry, evicting least recently used entries to stay within the budget
+
+        Parameters
+        ----------
+        key : tuple
+            the (namespace, key) of the entry
+        text : str
+            the JSON text of the entry
+        expires_at : float or None
+            the time the entry expires
+
+        Returns
+        -------
+        none
+        '''
+        with self._lock:
+            self._remove(key)
+
+            if len(text) > self.budget: # never cache an entry larger than the whole budget
+                return
+
+            self._entries[key] = (text, expires_at)
+            self.size += len(text)
+
+            while self.size > self.budget: # evict from the least recently used end
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions[oldest_key[0]] += 1
+
+    def discard(self, key):
+        ''' removes an entry if it is cached
+
+        Parameters
+        ----------
+        key : tuple
+            the (namespace, key) of the entry
+
+        Returns
+        -------
+        none
+        '''
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        ''' removes an entry and releases its size, the caller holds the lock
+
+        Parameters
+        ----------
+        key : tuple
+            the (namespace, key) of the entry
+
+        Returns
+        -------
+        none
+        '''
+        entry = self._entries.pop(key, None)
+
+        if entry is not None:
+            self.size -= len(entry[0])
+
+class CacheStore:
+    ''' a keyed cache store with one table per namespace on a pluggable backend, fronted by an in-process LRU tier
+
+    the backend only persists entry rows (see cache_backends.py). the store encodes values, computes
+    expiry times, keeps counters and runs eviction sweeps, so memory, SQLite and Redis-protocol backends behave
+    the same. entries expire after their namespace's TTL, and each namespace is capped at NAMESPACE_MAX_ENTRIES
+    rows. an expired entry can still be served, while it is refreshed, until its hard expiry NAMESPACE_STALE_TTLS later.
+    entries stored with upstream validators (ETag / Last-Modified) outlive their expiry by REVALIDATION_WINDOW,
+    so they can be revalidated with a conditional request and extended instead of refetched.
+
+    the memory tier is per process: with a backend shared by several processes, an entry another process
+    rewrote can be served from memory until it expires here.
+
+    Parameters
+    ----------
+    backend : CacheBackend or str
+        the persistence backend, or the path of a SQLite database file
+    legacy_path : str, optional
+        the path of a legacy cache.json file to migrate on first start
+    memory_budget : int, optional
+        the size in bytes of the in-process LRU tier (default of MEMORY_BUDGET)
+    '''
+
+    def __init__(self, backend, legacy_path=None, memory_budget=MEMORY_BUDGET):
+        self.backend = SQLiteBackend(backend) if isinstance(backend, str) else backend
+        self.legacy_path = legacy_path
+        self.memory = LRUCache(memory_budget)
+        self.stats = Counter() # (namespace, counter name) -> count
+        self._stats_lock = threading.Lock()
+        self._writes = Counter() # writes per namespace since the last eviction sweep
+        self._listeners = [] # called with (namespace, key) after every write
+        self.backend.setup(NAMESPACE_TTLS, self._legacy_rows) # creates the namespaces and migrates the legacy cache once
+
+    def _legacy_rows(self):
+        ''' reads a legacy cache.json file as entry rows to import
+
+        Parameters
+        ----------
+        none
+
+        Returns
+        -------
+        list
+            the entry rows, empty if there is no legacy file
+        '''
+        if not self.legacy_path or not os.path.exists(self.legacy_path): # nothing to migrate
+            return []
+
+        with file_lock(self.legacy_path, shared=True), open(self.legacy_path, 'r') as cache_file: # not while export_cache replaces it
+            cache_contents = cache_file.read()
+
+        legacy_cache = json.loads(cache_contents) if cache_contents else {} # a corrupt file raises, it is never imported as empty
+        return [self._row(namespace, key, encode_value(value)) for namespace, key, value in split_legacy_cache(legacy_cache)]
+
+    def _row(self, namespace, key, text, ttl=None, validators=None):
+        ''' builds the entry row the backend stores for one encoded value
+
+        Parameters
+        ----------
+        namespace : str
+            the cache namespace
+        key : str
+            the entry key
+        text : str
+            the JSON text of the value
+        ttl : float, optional
+            the seconds the entry stays fresh (default of the namespace TTL)
+        validators : dict, optional
+            the upstream response's "etag" and "last_modified" validators
+
+        Returns
+        -------
+        tuple
+            the (namespace, key, text, stored_at, expires_at, validators) row
+        '''
+        stored_at = time.time()
+        expires_at = stored_at + (NAMESPACE_TTLS[namespace] if ttl is None else ttl)
+        return namespace, key, text, stored_at, expires_at, encode_value(validators) if validators else None
+
+    def _wrote(self, namespace, key, text, expires_at):
+        ''' records a committed write in the memory tier and runs an eviction sweep every EVICTION_INTERVAL writes
+
+        Parameters
+        ----------
+        namespace : str
+            the cache namespace
+        key : str
+            the entry key
+        text : str
+            the JSON text of the value
+        expires_at : float
+            the time the entry expires
+
+        Returns
+        -------
+        none
+        '''
+        self.memory.put((namespace, key), text, expires_at)
+
+        for listener in self._listeners: # let dependent caches drop what they built from the old value
+            listener(namespace, key)
+
+        with self._stats_lock:
+            self._writes[namespace] += 1
+            sweep = self._writes[namespace] >= EVICTION_INTERVAL
+            if sweep:
+                self._writes[namespace] = 0
+
+        if sweep: # if it's time for a sweep,
+            self.evict(namespace)
+
+    def add_listener(self, listener):
+        ''' registers a function called with (namespace, key) after every write in this process
+
+        Parameters
+        ----------
+        listener : callable
+            the function to call
+
+        Returns
+        -------
+        none
+        '''
+        self._listeners.append(listener)
+
+    def count(self, namespace, name, amount=1):
+        ''' increments a cache counter for a namespace
+
+        Parameters
+        ----------
+        namespace : str
+            the cache namespace
+        name : str
+            the counter name
+        amount : int, optional
+            the amount to add (default of 1)
+
+        Returns
+        -------
+        none
+        '''
+        with self._stats_lock:
+            self.stats[(namespace, name)] += amount
+
+    def get(self, namespace, key):
+        ''' reads one fresh entry from a namespace, checking the memory tier first
+
+        Parameters
+        ----------
+        namespace : str
+            the cache namespace
+        key : str or int
+            the entry key
+
+        Returns
+        -------
+        object or None
+            the stored value, or None if the key is not cached or has expired
+        '''
+        key = str(key)
+        text = self.memory.get((namespace, key))
+
+        if text is not None: # if the memory tier has it,
+            self.count(namespace, "memory_hits")
+            return json.loads(text)
+
+        entry = self.backend.get(namespace, key)
+
+        if entry is None: # if the key is not cached,
+            self.count(namespace, "misses")
+            return None
+
+        text, _, expires_at, _ = entry
+
+        if expires_at is not None and expires_at <= time.time(): # if the entry is stale,
+            self.count(namespace, "expired")
+            self.count(namespace, "misses")
+            return None
+
+        self.count(namespace, "hits")
+        self.memory.put((namespace, key), text, expires_at) # promote to the memory tier
+        return json.loads(text)
+
+    def put(self, namespace, key, value, ttl=None, validators=None):
+        ''' writes one entry to a namespace, replacing any existing value
+
+        Parameters
+        ----------
+        namespace : str
+            the cache namespace
+        key : str or int
+            the entry key
+        value : object
+            the JSON-serializable value to store
+        ttl : float, optional
+            the seconds the entry stays fresh (default of the namespace TTL)
+        validators : dict, optional
+            the upstream response's "etag" and "last_modified" validators
+
+        Returns
+        -------
+        none
+        '''
+        self.put_many([(namespace, key, value)], ttl, validators)
+
+    def put_many(self, entries, ttl=None, validators=None):
+        ''' writes several entries atomically
+
+        Parameters
+        ----------
+        entries : iterable of tuple
+            (namespace, key, value) triples to store
+        ttl : float, optional
+            the seconds every entry stays fresh (default of each namespace's TTL)
+        validators : dict, optional
+            the validators of the upstream response the entries came from
+
+        Returns
+        -------
+        none
+        '''
+        rows = [self._row(namespace, str(key), encode_value(value), ttl, validators) for namespace, key, value in entries]
+        self.backend.put_many(rows)
+
+        for namespace, key, text, _, expires_at, _ in rows:
+            self._wrote(namespace, key, text, expires_at)
+
+    def update(self, namespace, key, update_function):
+        ''' atomically reads, changes and writes back one entry
+
+        the read goes to the backend, not the memory tier, so updates from other processes are kept.
+        an expired value is passed to update_function as None.
+
+        Parameters
+        ----------
+        namespace : str
+            the cache namespace
+        key : str or int
+            the entry key
+        update_function : callable
+            called with the current value (or None), returns the new value
+
+        Returns
+        -------
+        object
+            the new value
+        '''
+        key = str(key)
+        row = self.backend.update(namespace, key, time.time(),
+                                  lambda text: self._row(namespace, key, encode_value(update_function(json.loads(text) if text else None))))
+        self._wrote(namespace, key, row[2], row[4])
+        return json.loads(row[2])
+
+    def get_stale(self, namespace, key):
+        ''' reads an expired entry that can be revalidated with a conditional request
+
+        Parameters
+        ----------
+        namespace : str
+            the cache namespace
+        key : str or int
+            the entry key
+
+        Returns
+        -------
+        tuple
+            the stale value and its validators, or (None, None) if the key is missing, fresh or has no validators
+        '''
+        entry = self.backend.get(namespace, str(key))
+
+        if entry is None or entry[2] is None or entry[2] > time.time() or entry[3] is None: # nothing to revalidate
+            return None, None
+
+        return json.loads(entry[0]), json.loads(entry[3])
+
+    def get_servable(self, namespace, key, any_age=False):
+        ''' reads an entry that may be served while it is refreshed: fresh, or expired but before its hard expiry
+
+        Parameters
+        ----------
+        namespace : str
+            the cache namespace
+        key : str or int
+            the entry key
+        any_age : bool, optional
+            True to also serve entries past their hard expiry that are still stored, when the upstream API
+            can't be reached (default of False)
+
+        Returns
+        -------
+        object or None
+            the stored value, or None if the key is missing or past its hard expiry
+        '''
+        entry = self.backend.get(namespace, str(key))
+
+        if entry is None: # if the key is not cached,
+            return None
+
+        text, _, expires_at, _ = entry
+        now = time.time()
+
+        if expires_at is not None and expires_at <= now: # if the entry is stale,
+            if not any_age and expires_at + NAMESPACE_STALE_TTLS[namespace] <= now: # past its hard expiry
+                return None
+            self.count(namespace, "stale_served")
+
+        return json.loads(text)
+
+    def extend(self, namespace, key, ttl=None):
+        ''' makes an entry fresh again after the upstream API confirmed it is unchanged (304 Not Modified)
+
+        only the expiry time is written, the stored value is neither decoded nor rewritten.
+
+        Parameters
+        ----------
+        namespace : str
+            the cache namespace
+        key : str or int
+            the entry key
+        ttl : float, optional
+            the seconds the entry stays fresh (default of the namespace TTL)
+
+        Returns
+        -------
+        none
+        '''
+        stored_at = time.time()
+        expires_at = stored_at + (NAMESPACE_TTLS[namespace] if ttl is None else ttl)
+        self.backend.touch(namespace, str(key), stored_at, expires_at)
+        self.count(namespace, "revalidated")
+
+    def items(self, namespace):
+        ''' reads every fresh entry in a namespace
+
+        Parameters
+        ----------
+        namespace : str
+            the cache namespace
+
+        Returns
+        -------
+        list
+            a list of (key, value) tuples
+        '''
+        return [(key, json.loads(text)) for key, text in self.backend.items(namespace, time.time())]
+
+    def evict(self, namespace=None):
+        ''' deletes entries past their hard expiry, then the oldest entries over the namespace's NAMESPACE_MAX_ENTRIES
+
+        expired entries with validators are kept for REVALIDATION_WINDOW past their expiry, if that is later.
+
+        Parameters
+        ----------
+        namespace : str, optional
+            the cache namespace (default of every namespace)
+
+        Returns
+        -------
+        int
+            the number of entries deleted
+        '''
+        deleted = 0
+
+        for namespace in [namespace] if namespace else NAMESPACES:
+            stale_ttl = NAMESPACE_STALE_TTLS[namespace]
+            expired, evicted = self.backend.evict(namespace, time.time() - stale_ttl, NAMESPACE_MAX_ENTRIES[namespace], max(0, REVALIDATION_WINDOW - stale_ttl))
+            self.count(namespace, "expired_deleted", expired)
+            self.count(namespace, "evictions", evicted)
+            deleted += expired + evicted
+
+        return deleted
+
+    def cache_stats(self):
+        ''' gets hit, miss and eviction counters and sizes for every namespace
+
+        Parameters
+        ----------
+        none
+
+        Returns
+        -------
+        dict
+            maps each namespace to its counters
+        '''
+        stats = {namespace: {"entries": self.backend.count(namespace)} for namespace in NAMESPACES}
+
+        with self._stats_lock:
+            for (namespace, name), value in self.stats.items():
+                stats[namespace][name] = value
+
+        for namespace, value in self.memory.evictions.items():
+            stats[namespace]["memory_evictions"] = value
+
+        stats["memory"] = {"bytes": self.memory.size, "budget": self.memory.budget}
+        return stats
+
+def encode_value(value):
+    ''' encodes a cache entry as compact JSON text
+
+    Parameters
+    ----------
+    value : object
+        the JSON-serializable entry
+
+    Returns
+    -------
+    str
+        the JSON text
+    '''
+    return json.dumps(value, separators=JSON_SEPARATORS)
+
+def split_legacy_cache(cache):
+    ''' splits a legacy cache.json-shaped dictionary into namespace entries
+
+    Discover keys map to lists of TMDb IDs, and TMDb ID keys map to a dictionary
+    holding "movie_details", "directors", "availability" and "streaming_link".
+
+    Parameters
+    ----------
+    cache : dict
+        the legacy-shaped cache dictionary
+
+    Returns
+    -------
+    list
+        a list of (namespace, key, value) triples
+    '''
+    entries = []
+
+    for key, value in cache.items():
+        if isinstance(value, list): # Discover Movie result list
+            entries.append(("discover", key, value))
+        elif isinstance(value, dict): # movie entry
+            if value.get("movie_details"):
+                entries.append(("movie_details", key, encode_movie(project_movie(value["movie_details"])))) # store the compact record
+            if value.get("directors"):
+                entries.append(("directors", key, value["directors"]))
+            if value.get("availability"):
+                entries.append(("availability", key, value["availability"]))
+            if value.get("streaming_link"):
+                entries.append(("streaming_link", key, value["streaming_link"]))
+
+    return entries
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    ''' returns the shared cache store, opening it (and migrating cache.json) on first use
+
+    Parameters
+    ----------
+    none
+
+    Returns
+    -------
+    CacheStore
+        the shared cache store
+    '''
+    global _store
+
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = CacheStore(backend_from_config(CACHE_BACKEND, CACHE_DB), CACHE_FILE)
+
+    return _store
+
+##################CACHE##################
+
+def cache_stats():
+    ''' gets hit, miss and eviction counters and sizes for every cache namespace
+
+    Parameters
+    ----------
+    none
+
+    Returns
+    -------
+    dict
+        maps each namespace to its counters
+    '''
+    return get_store().cache_stats()
+
+def cache_metrics(stats):
+    ''' gets cache counters and sizes as metric families, at scrape time
+
+    Parameters
+    ----------
+    stats : dict
+        the cache_stats() of every namespace
+
+    Returns
+    -------
+    list
+        (name, kind, documentation, samples) families
+    '''
+    lookups, ratios, entries, removals, revalidated, stale = [], [], [], [], [], []
+
+    for namespace, counters in stats.items():
+        if namespace == "memory": # the memory tier's size, not a namespace
+            continue
+
+        for result, name in (("memory_hit", "memory_hits"), ("hit", "hits"), ("miss", "misses")):
+            lookups.append(({"namespace": namespace, "result": result}, counters.get(name, 0)))
+
+        found = counters.get("memory_hits", 0) + counters.get("hits", 0)
+        ratios.append(({"namespace": namespace}, found / (found + counters.get("misses", 0)) if found or counters.get("misses") else 0.0))
+        entries.append(({"namespace": namespace}, counters["entries"]))
+        revalidated.append(({"namespace": namespace}, counters.get("revalidated", 0)))
+        stale.append(({"namespace": namespace}, counters.get("stale_served", 0)))
+
+        for reason, name in (("expired", "expired_deleted"), ("capacity", "evictions"), ("memory", "memory_evictions")):
+            removals.append(({"namespace": namespace, "reason": reason}, counters.get(name, 0)))
+
+    return [
+        ("cache_lookups_total", "counter", "Cache reads by namespace and result: memory_hit, hit (from the backend) or miss.", lookups),
+        ("cache_hit_ratio", "gauge", "Share of cache reads answered from the memory tier or the backend since start.", ratios),
+        ("cache_entries", "gauge", "Entries stored per namespace, fresh or expired.", entries),
+        ("cache_removals_total", "counter", "Entries removed because they expired, the namespace was full, or the memory tier was full.", removals),
+        ("cache_revalidated_total", "counter", "Expired entries made fresh again by a 304 Not Modified.", revalidated),
+        ("cache_stale_served_total", "counter", "Expired entries served while they were refreshed, or while their upstream's circuit was open.", stale),
+        ("cache_memory_bytes", "gauge", "Bytes of entries held in the memory tier.", [({}, stats["memory"]["bytes"])]),
+        ("cache_memory_budget_bytes", "gauge", "Byte budget of the memory tier.", [({}, stats["memory"]["budget"])])
+    ]
+
+registry.add_collector(lambda: cache_metrics(cache_stats()))
+
+def open_cache():
+    ''' loads every cache namespace into a single dictionary shaped like the legacy cache.json
+
+    this reads the whole store, so it is only meant for inspecting or exporting the cache.
+    the helpers below read and write single entries instead.
+
+    Parameters
+    ----------
+    none
+
+    Returns
+    -------
+    dict
+        the opened cache as a dictionary
+    '''
+    store = get_store()
+    cache = {}
+
+    for cache_key, data in store.items("discover"):
+        cache[cache_key] = data
+
+    for tmdb_id, movie_details in store.items("movie_details"):
+        cache[tmdb_id] = {"movie_details": movie_to_dict(decode_movie(movie_details)), "streaming_link": {}}
+
+    for tmdb_id, directors in store.items("directors"):
+        cache.setdefault(tmdb_id, {"movie_details": None, "streaming_link": {}})["directors"] = directors
+
+    for tmdb_id, availability in store.items("availability"):
+        cache.setdefault(tmdb_id, {"movie_details": None, "streaming_link": {}})["availability"] = availability
+
+    for tmdb_id, streaming_links in store.items("streaming_link"):
+        cache.setdefault(tmdb_id, {"movie_details": None, "streaming_link": {}})["streaming_link"] = streaming_links
+
+    return cache
+
+def save_cache(cache):
+    ''' saves the provided legacy-shaped cache dictionary into the cache store
+
+    entries are upserted in one transaction, so keys missing from the dictionary are left untouched.
+
+    Parameters
+    ----------
+    cache: dict
+        the cache dictionary that needs to be saved
+
+    Returns
+    -------
+    none
+    '''
+    get_store().put_many(split_legacy_cache(cache))
+
+def export_cache(path=CACHE_FILE):
+    ''' writes the whole cache store to a legacy cache.json-shaped file, safely across processes
+
+    the write holds an exclusive advisory lock, merges into the file's current contents (so entries another
+    process exported, or that have since expired here, are kept), and replaces the file atomically.
+    a file that can't be parsed raises instead of being overwritten.
+
+    Parameters
+    ----------
+    path : str, optional
+        the path of the file (default of CACHE_FILE)
+
+    Returns
+    -------
+    int
+        the number of top-level keys written
+    '''
+    with file_lock(path):
+        existing = {}
+
+        if os.path.exists(path):
+            with open(path, 'r') as cache_file:
+                cache_contents = cache_file.read()
+            existing = json.loads(cache_contents) if cache_contents else {}
+
+        merged = merge_legacy_cache(existing, open_cache())
+        atomic_write_json(path, merged)
+
+    return len(merged)
+
+def merge_legacy_cache(base, update):
+    ''' merges two legacy cache.json-shaped dictionaries, preferring the update's values
+
+    streaming links are merged per service, so links saved by either side are kept.
+
+    Parameters
+    ----------
+    base : dict
+        the older cache dictionary
+    update : dict
+        the newer cache dictionary
+
+    Returns
+    -------
+    dict
+        the merged dictionary
+    '''
+    merged = dict(base)
+
+    for key, value in update.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict): # movie entry on both sides
+            movie = {**merged[key], **{name: item for name, item in value.items() if item is not None}}
+            movie["streaming_link"] = {**(merged[key].get("streaming_link") or {}), **(value.get("streaming_link") or {})}
+            merged[key] = movie
+        else:
+            merged[key] = value
+
+    return merged
+
+def update_cache(cache_key, data, ttl=None, validators=None):
+    ''' updates the cache with the specified cache key and data from TMDb Discover Movie endpoint
+
+    Parameters
+    ----------
+    cache_key : str
+        the key to identify the data in the cache
+    data : dict
+        the movie data to be stored in the cache
+    ttl : float, optional
+        the seconds the list stays fresh (default of the discover namespace TTL)
+    validators : dict, optional
+        the response's "etag" and "last_modified" validators, for revalidating the list once it expires
+
+    Returns
+    -------
+    none
+    '''
+    get_store().put("discover", cache_key, data, ttl, validators) # write the single Discover entry
+
+def get_discover_from_cache(cache_key):
+    ''' retrieves a TMDb Discover Movie result list from the cache
+
+    Parameters
+    ----------
+    cache_key : str
+        the key to identify the data in the cache
+
+    Returns
+    -------
+    list or None
+        the cached list of TMDb IDs, or None if not found in the cache
+    '''
+    return get_store().get("discover", cache_key)
+
+def get_stale_discover_from_cache(cache_key):
+    ''' retrieves an expired TMDb Discover Movie result list and its validators, for a conditional request
+
+    Parameters
+    ----------
+    cache_key : str
+        the key to identify the data in the cache
+
+    Returns
+    -------
+    tuple
+        the stale list of TMDb IDs and its validators, or (None, None)
+    '''
+    return get_store().get_stale("discover", cache_key)
+
+def get_servable_discover_from_cache(cache_key, any_age=False):
+    ''' retrieves a TMDb Discover Movie result list that may be served while it is refreshed
+
+    Parameters
+    ----------
+    cache_key : str
+        the key to identify the data in the cache
+    any_age : bool, optional
+        True to serve a list past its hard expiry too, while TMDb can't be reached (default of False)
+
+    Returns
+    -------
+    list or None
+        the list of TMDb IDs, or None if not cached or past its hard expiry
+    '''
+    return get_store().get_servable("discover", cache_key, any_age)
+
+def extend_discover_in_cache(cache_key, ttl=None):
+    ''' makes an expired TMDb Discover Movie result list fresh again after a 304 Not Modified
+
+    Parameters
+    ----------
+    cache_key : str
+        the key to identify the data in the cache
+    ttl : float, optional
+        the seconds the list stays fresh (default of the discover namespace TTL)
+
+    Returns
+    -------
+    none
+    '''
+    get_store().extend("discover", cache_key, ttl)
+
+def update_cache_with_movie_details(tmdb_id, movie_details, directors=None, ttl=None, validators=None):
+    ''' updates the cache with movie details for a specific TMDb ID from the TMDb Details endpoint
+
+    Parameters
+    ----------
+    tmdb_id : int
+        the TMDb ID of the movie
+    movie_details : dict
+        the TMDb Details payload, stored as a compact movie record (and in full if STORE_RAW_DETAILS is set)
+    directors : list, optional
+        the directors of the movie from the TMDb Credits endpoint, stored alongside the details
+    ttl : float, optional
+        the seconds the entries stay fresh (default of each namespace's TTL)
+    validators : dict, optional
+        the response's "etag" and "last_modified" validators, for revalidating the movie once it expires
+
+    Returns
+    -------
+    none
+    '''
+    entries = [("movie_details", tmdb_id, encode_movie(project_movie(movie_details)))] # keep only the fields the program uses
+
+    if STORE_RAW_DETAILS: # if the full payload is wanted too,
+        entries.append(("raw_details", tmdb_id, movie_details)) # keep it in the side store
+
+    if directors: # if the directors were fetched with the details,
+        entries.append(("directors", tmdb_id, directors)) # write them in the same transaction
+
+    get_store().put_many(entries, ttl, validators) # write the movie entry
+
+def get_movie_details_from_cache(tmdb_id):
+    ''' retrieves movie details from the cache for a specific TMDb ID
+
+    Parameters
+    ----------
+    tmdb_id : int
+        the TMDb ID of the movie
+
+    Returns
+    -------
+    MovieRecord or None
+        the movie details if found in the cache, otherwise None
+    '''
+    movie_details = get_store().get("movie_details", tmdb_id)
+
+    if movie_details is None: # if not found in the cache,
+        return None
+
+    record = decode_movie(movie_details)
+
+    if isinstance(movie_details, dict): # if it's a raw payload cached before movie records,
+        get_store().put("movie_details", tmdb_id, encode_movie(record)) # rewrite it compactly
+
+    return record
+
+def get_servable_movie_from_cache(tmdb_id, any_age=False):
+    ''' retrieves a movie record and its directors that may be served while they are refreshed
+
+    Parameters
+    ----------
+    tmdb_id : int
+        the TMDb ID of the movie
+    any_age : bool, optional
+        True to serve a movie past its hard expiry too, while TMDb can't be reached (default of False)
+
+    Returns
+    -------
+    tuple or None
+        the movie record and directors, or None if either is not cached or past its hard expiry
+    '''
+    store = get_store()
+    movie_details = store.get_servable("movie_details", tmdb_id, any_age)
+    directors = store.get_servable("directors", tmdb_id, any_age)
+
+    if movie_details is None or directors is None: # both are needed for a result
+        return None
+
+    return decode_movie(movie_details), directors
+
+def get_stale_movie_from_cache(tmdb_id):
+    ''' retrieves an expired movie record, its directors and its validators, for a conditional request
+
+    Parameters
+    ----------
+    tmdb_id : int
+        the TMDb ID of the movie
+
+    Returns
+    -------
+    tuple
+        the stale movie record, directors and validators, or (None, None, None) if the movie can't be revalidated
+    '''
+    store = get_store()
+    movie_details, validators = store.get_stale("movie_details", tmdb_id)
+    directors = store.get("directors", tmdb_id)
+
+    if directors is None: # stored together, so the directors expired too
+        directors = store.get_stale("directors", tmdb_id)[0]
+
+    if movie_details is None or directors is None: # if the combined response can't be rebuilt,
+        return None, None, None
+
+    return decode_movie(movie_details), directors, validators
+
+def extend_movie_in_cache(tmdb_id, ttl=None):
+    ''' makes an expired movie record and its directors fresh again after a 304 Not Modified
+
+    Parameters
+    ----------
+    tmdb_id : int
+        the TMDb ID of the movie
+    ttl : float, optional
+        the seconds the entries stay fresh (default of each namespace's TTL)
+
+    Returns
+    -------
+    none
+    '''
+    store = get_store()
+
+    for namespace in ("movie_details", "directors") + (("raw_details",) if STORE_RAW_DETAILS else ()):
+        store.extend(namespace, tmdb_id, ttl)
+
+def update_cache_with_directors(tmdb_id, directors):
+    ''' updates the cache with the directors for a specific TMDb ID from the TMDb Credits endpoint
+
+    Parameters
+    ----------
+    tmdb_id : int
+        the TMDb ID of the movie
+    directors : list
+        the directors of the movie
+
+    Returns
+    -------
+    none
+    '''
+    get_store().put("directors", tmdb_id, directors)
+
+def get_directors_from_cache(tmdb_id):
+    ''' retrieves the directors from the cache for a specific TMDb ID
+
+    Parameters
+    ----------
+    tmdb_id : int
+        the TMDb ID of the movie
+
+    Returns
+    -------
+    list or None
+        the directors if found in the cache, otherwise None
+    '''
+    return get_store().get("directors", tmdb_id)
+
+def update_cache_with_availability(tmdb_id, availability, ttl=None):
+    ''' updates the cache with the StreamingAvailabilityAPI record for a specific TMDb ID
+
+    Parameters
+    ----------
+    tmdb_id : int
+        the TMDb ID of the movie
+    availability : dict
+        the availability record, with every US streaming option for every service
+    ttl : float, optional
+        the seconds the record stays fresh (default of the availability namespace TTL)
+
+    Returns
+    -------
+    none
+    '''
+    get_store().put("availability", tmdb_id, availability, ttl)
+
+def get_availability_from_cache(tmdb_id):
+    ''' retrieves the StreamingAvailabilityAPI record from the cache for a specific TMDb ID
+
+    Parameters
+    ----------
+    tmdb_id : int
+        the TMDb ID of the movie
+
+    Returns
+    -------
+    dict or None
+        the availability record if found in the cache, otherwise None
+    '''
+    return get_store().get("availability", tmdb_id)
+
+def get_servable_availability_from_cache(tmdb_id, any_age=False):
+    ''' retrieves a StreamingAvailabilityAPI record that may be served while it is refreshed
+
+    Parameters
+    ----------
+    tmdb_id : int
+        the TMDb ID of the movie
+    any_age : bool, optional
+        True to serve a record past its hard expiry too, while the API can't be reached (default of False)
+
+    Returns
+    -------
+    dict or None
+        the availability record, or None if not cached or past its hard expiry
+    '''
+    return get_store().get_servable("availability", tmdb_id, any_age)
+
+def update_cache_with_streaming_link(tmdb_id, service, streaming_link):
+    '''updates cache with streaming link for a specified TMDb ID and service
+
+    the movie's links are read and rewritten in one transaction, so concurrent updates for other services are kept.
+
+    Parameters
+    ----------
+    tmdb_id : int
+        the TMDb ID of the movie
+    service : str
+        the streaming service for which the link is being updated
+    streaming_link : str
+        the streaming link to be stored in the cache
+
+    Returns
+    -------
+    none
+    '''
+    def set_link(streaming_links):
+        streaming_links = streaming_links or {}
+
+        if streaming_link: # if streaming link available,
+            streaming_links[service] = streaming_link # update cache with streaming link
+        else: # if streaming link not available,
+            streaming_links[service] = "Streaming link not available." # update cache with missing link info
+
+        return streaming_links
+
+    get_store().update("streaming_link", tmdb_id, set_link)
+
+def get_streaming_links_from_cache(tmdb_id):
+    '''retrieves the streaming links saved with update_cache_with_streaming_link for a specified TMDb ID
+
+    Parameters
+    ----------
+    tmdb_id : int
+        the TMDb ID of the movie
+
+    Returns
+    -------
+    dict
+        maps each saved service to its streaming link, or to "Streaming link not available."
+    '''
+    return get_store().get("streaming_link", tmdb_id) or {}
+
+if __name__ == "__main__":
+    export_path = sys.argv[1] if len(sys.argv) > 1 else CACHE_FILE
+    print(f"Exported {export_cache(export_path)} cache keys to {export_path}")
@@ -0,0 +1,285 @@
+#########################################
+##### Name: Tara Dorje              #####
+##### Uniqname: tydorje             #####
+#########################################
+
+import bisect
+import logging
+import threading
+import time
+from collections import Counter
+
+from cache_store import get_store
+from movie_record import decode_movie
+
+CATALOG_MAX_AGE = 10 * 60 # seconds before the index is rebuilt from the cache, to pick up other processes' writes
+CATALOG_MIN_MATCHES = 20 # local matches needed to answer a search without the Discover Movie endpoint, one full page
+
+logger = logging.getLogger(__name__)
+
+class CatalogIndex:
+    ''' an in-memory index over the cached movie records
+
+    keeps inverted postings (genre ID, original language and watch provider ID -> set of TMDb IDs)
+    and a runtime-sorted list, so a Discover Movie query for any criteria combination can be answered
+    from movies the cache already holds. watch providers come from cached Discover Movie lists, since
+    every movie in a list for a provider is on that provider.
+    '''
+
+    def __init__(self):
+        self.movies = {} # TMDb ID -> MovieRecord
+        self.by_genre = {}
+        self.by_language = {}
+        self.by_provider = {}
+        self.runtimes = [] # sorted (runtime, TMDb ID) pairs
+        self.built_at = 0
+        self.stats = Counter()
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock() # held by the first build, so concurrent first searches build once
+        self._rebuilding = False
+
+    def add_movie(self, record):
+        ''' adds or replaces a movie record in the index, skipping records without a TMDb ID or runtime
+
+        Parameters
+        ----------
+        record : MovieRecord
+            the movie record
+
+        Returns
+        -------
+        none
+        '''
+        if record.tmdb_id is None or record.runtime is None: # can't be matched or sorted by runtime
+            with self._lock:
+                self.stats["rejected_records"] += 1
+            return
+
+        with self._lock:
+            self._remove_movie(record.tmdb_id)
+            self.movies[record.tmdb_id] = record
+
+            for genre_id in record.genre_ids:
+                self.by_genre.setdefault(genre_id, set()).add(record.tmdb_id)
+
+            self.by_language.setdefault(record.original_language, set()).add(record.tmdb_id)
+            bisect.insort(self.runtimes, (record.runtime, record.tmdb_id))
+
+    def add_discover_list(self, cache_key, tmdb_ids):
+        ''' records the watch provider of every movie in a cached Discover Movie list
+
+        Parameters
+        ----------
+        cache_key : str
+            the Discover Movie cache key, starting with the watch provider ID
+        tmdb_ids : list
+            the TMDb IDs in the list
+
+        Returns
+        -------
+        none
+        '''
+        provider_id = cache_key.split("_", 1)[0]
+
+        if provider_id == "None": # unknown provider, nothing to record
+            return
+
+        with self._lock:
+            self.by_provider.setdefault(provider_id, set()).update(tmdb_ids)
+
+    def match(self, provider_id, genre_id, language_id, runtime_gte, runtime_lte):
+        ''' finds the indexed movies matching a set of Discover Movie criteria
+
+        Parameters
+        ----------
+        provider_id : int
+            the TMDb watch provider ID
+        genre_id : int
+            the TMDb genre ID
+        language_id : str
+            the TMDb language ID
+        runtime_gte : int
+            the minimum runtime
+        runtime_lte : int
+            the maximum runtime
+
+        Returns
+        -------
+        list
+            the matching TMDb IDs, most popular first
+        '''
+        with self._lock:
+            postings = sorted([
+                self.by_provider.get(str(provider_id), set()),
+                self.by_genre.get(genre_id, set()),
+                self.by_language.get(language_id, set())
+            ], key=len)
+            matches = postings[0].intersection(*postings[1:]) # intersect starting from the smallest posting list
+
+            low = bisect.bisect_left(self.runtimes, (runtime_gte, -1)) # runtime range query
+            high = bisect.bisect_right(self.runtimes, (runtime_lte, float("inf")))
+
+            if high - low < len(matches): # if the runtime range is more selective, intersect with it
+                matches &= {tmdb_id for _, tmdb_id in self.runtimes[low:high]}
+            else: # else, check the few remaining movies directly
+                matches = {tmdb_id for tmdb_id in matches if runtime_gte <= self.movies[tmdb_id].runtime <= runtime_lte}
+
+            return sorted(matches, key=lambda tmdb_id: -self.movies[tmdb_id].popularity)
+
+    def rebuild(self):
+        ''' rebuilds the index from the fresh entries in the cache store, skipping entries that can't be decoded
+
+        Parameters
+        ----------
+        none
+
+        Returns
+        -------
+        none
+        '''
+        store = get_store()
+        rebuilt = CatalogIndex()
+
+        for tmdb_id, movie_details in store.items("movie_details"):
+            try:
+                record = decode_movie(movie_details)
+            except (ValueError, TypeError, KeyError, IndexError): # one bad entry must not break every local search
+                logger.warning("skipping undecodable movie_details entry %s", tmdb_id)
+                continue
+
+            rebuilt.add_movie(record)
+
+        for cache_key, tmdb_ids in store.items("discover"):
+            rebuilt.add_discover_list(cache_key, tmdb_ids)
+
+        with self._lock:
+            self.movies, self.by_genre, self.by_language = rebuilt.movies, rebuilt.by_genre, rebuilt.by_language
+            self.by_provider, self.runtimes = rebuilt.by_provider, rebuilt.runtimes
+            self.stats["rejected_records"] += rebuilt.stats["rejected_records"]
+            self.built_at = time.time()
+
+    def ensure_fresh(self):
+        ''' builds the index on first use, and rebuilds it in the background once it is older than CATALOG_MAX_AGE
+
+        callers arriving during the first build wait for it instead of building the index again.
+
+        Parameters
+        ----------
+        none
+
+        Returns
+        -------
+        none
+        '''
+        if not self.built_at: # if never built,
+            with self._build_lock:
+                if not self.built_at: # another caller may have built it while this one waited
+                    self.rebuild()
+            return
+
+        with self._lock:
+            if self._rebuilding or time.time() - self.built_at < CATALOG_MAX_AGE: # fresh, or already rebuilding
+                return
+            self._rebuilding = True
+
+        threading.Thread(target=self._background_rebuild, name="catalog-rebuild", daemon=True).start()
+
+    def _background_rebuild(self):
+        ''' rebuilds the index, logging instead of raising on failure
+
+        Parameters
+        ----------
+        none
+
+        Returns
+        -------
+        none
+        '''
+        try:
+            self.rebuild()
+        except Exception:
+            logger.exception("could not rebuild the catalog index")
+        finally:
+            with self._lock:
+                self._rebuilding = False
+
+    def _remove_movie(self, tmdb_id):
+        ''' removes a movie from the postings and runtime list, the caller holds the lock
+
+        Parameters
+        ----------
+        tmdb_id : int
+            the TMDb ID of the movie
+
+        Returns
+        -------
+        none
+        '''
+        record = self.movies.pop(tmdb_id, None)
+
+        if record is None: # not indexed
+            return
+
+        for genre_id in record.genre_ids:
+            self.by_genre.get(genre_id, set()).discard(tmdb_id)
+
+        self.by_language.get(record.original_language, set()).discard(tmdb_id)
+        position = bisect.bisect_left(self.runtimes, (record.runtime, tmdb_id))
+
+        if position < len(self.runtimes) and self.runtimes[position] == (record.runtime, tmdb_id):
+            del self.runtimes[position]
+
+catalog = CatalogIndex()
+
+def local_discover(provider_id, genre_id, language_id, runtime_gte, runtime_lte):
+    ''' answers a Discover Movie query from the local catalog if it has enough matches
+
+    the coverage check requires at least CATALOG_MIN_MATCHES matches. fewer means the cache has only
+    seen part of the catalog for these criteria, so the Discover Movie endpoint is still needed.
+    freshness comes from the cache: expired movies and Discover lists drop out at the next rebuild.
+
+    Parameters
+    ----------
+    provider_id : int
+        the TMDb watch provider ID
+    genre_id : int
+        the TMDb genre ID
+    language_id : str
+        the TMDb language ID
+    runtime_gte : int
+        the minimum runtime
+    runtime_lte : int
+        the maximum runtime
+
+    Returns
+    -------
+    tuple
+        the matching TMDb IDs (most popular first) and whether they are enough to skip the upstream call
+    '''
+    catalog.ensure_fresh()
+    matches = catalog.match(provider_id, genre_id, language_id, runtime_gte, runtime_lte)
+    covered = len(matches) >= CATALOG_MIN_MATCHES
+
+    with catalog._lock:
+        catalog.stats["local_answers" if covered else "upstream_needed"] += 1
+
+    return matches, covered
+
+def catalog_stats():
+    ''' gets the catalog index size and how often it answered searches locally
+
+    Parameters
+    ----------
+    none
+
+    Returns
+    -------
+    dict
+        the index counters
+    '''
+    return {
+        "movies": len(catalog.movies),
+        "providers": len(catalog.by_provider),
+        "age": round(time.time() - catalog.built_at) if catalog.built_at else None,
+        **catalog.stats
+    }
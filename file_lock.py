@@ -0,0 +1,79 @@
+#########################################
+##### Name: Tara Dorje              #####
+##### Uniqname: tydorje             #####
+#########################################
+
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+
+@contextmanager
+def file_lock(path, shared=False):
+    ''' holds an advisory lock on a file for as long as the with block runs
+
+    the lock is taken on a separate "<path>.lock" file, so the locked file itself can be replaced
+    with os.replace while the lock is held. advisory locks only exclude other processes that lock too.
+
+    Parameters
+    ----------
+    path : str
+        the path of the file to lock
+    shared : bool, optional
+        True for a shared (reader) lock, False for an exclusive (writer) lock (default of False)
+
+    Returns
+    -------
+    none
+    '''
+    with open(f"{path}.lock", 'a+') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        else: # msvcrt only has exclusive locks
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+def atomic_write_json(path, value):
+    ''' writes a JSON file so readers see either the old or the new contents, never a partial file
+
+    the value is written to a temporary file in the same directory, flushed to disk, then renamed over the target.
+
+    Parameters
+    ----------
+    path : str
+        the path of the JSON file
+    value : object
+        the JSON-serializable value
+
+    Returns
+    -------
+    none
+    '''
+    directory = os.path.dirname(os.path.abspath(path))
+    descriptor, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory) # unique per writer
+
+    try:
+        with os.fdopen(descriptor, 'w') as temp_file:
+            json.dump(value, temp_file)
+            temp_file.flush()
+            os.fsync(temp_file.fileno()) # the rename must not be visible before the data
+        os.replace(temp_path, path) # atomic on POSIX and Windows
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
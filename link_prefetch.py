@@ -0,0 +1,288 @@
+#########################################
+##### Name: Tara Dorje              #####
+##### Uniqname: tydorje             #####
+#########################################
+
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from cache_store import get_availability_from_cache
+from metrics import registry
+from tmdb import DISCOVER_PAGE_SIZE, streaming_availability
+from upstream import BACKGROUND, upstream_priority
+
+PREFETCH_PER_SEARCH = int(os.environ.get("PREFETCH_PER_SEARCH", DISCOVER_PAGE_SIZE)) # results of a search whose streaming links are looked up ahead of a click (a rendered page by default), 0 turns prefetching off
+PREFETCH_QUOTA = int(os.environ.get("PREFETCH_QUOTA", 100)) # StreamingAvailabilityAPI requests prefetching may spend per quota period
+PREFETCH_QUOTA_PERIOD = int(os.environ.get("PREFETCH_QUOTA_PERIOD", 24 * 60 * 60)) # seconds, matches the API's daily quota
+PREFETCH_WORKERS = 2 # concurrent background lookups, the scheduler paces them further
+PREFETCH_QUEUE_SIZE = 1000 # lookups waiting at once, about 50 results pages, a burst of searches past this is not prefetched
+STATUS_SIZE = 10000 # movies whose prefetch status is remembered
+
+# a click on "Get Streaming Link" makes the slowest request a user waits on. after a search is served, the
+# availability records of its top results are fetched on background threads at BACKGROUND priority, so a click
+# on one of them is answered from the cache. prefetching spends the metered StreamingAvailabilityAPI quota on
+# links nobody may click, so it is capped per search and by its own share of the quota.
+
+QUEUED = "queued" # waiting for a worker
+FETCHING = "fetching" # the request is being made
+READY = "ready" # the record is cached, a click is answered without an upstream request
+FAILED = "failed" # the request failed, a click will try again
+OVER_QUOTA = "over_quota" # skipped, prefetching spent its quota for this period
+SKIPPED = "skipped" # not queued, too many lookups were waiting
+
+class QuotaBudget:
+    ''' a number of requests that may be spent per fixed period
+
+    Parameters
+    ----------
+    limit : int
+        the requests allowed per period
+    period : float
+        the period in seconds
+    '''
+
+    def __init__(self, limit, period):
+        self.limit = limit
+        self.period = period
+        self.spent = 0
+        self.resets_at = time.time() + period
+        self._lock = threading.Lock()
+
+    def try_spend(self):
+        ''' spends one request if any is left this period
+
+        Parameters
+        ----------
+        none
+
+        Returns
+        -------
+        bool
+            True if the request may be made
+        '''
+        with self._lock:
+            now = time.time()
+
+            if now >= self.resets_at: # a new period starts with the whole quota
+                self.spent = 0
+                self.resets_at = now + self.period
+
+            if self.spent >= self.limit:
+                return False
+
+            self.spent += 1
+            return True
+
+    def remaining(self):
+        ''' gets the requests left this period
+
+        Parameters
+        ----------
+        none
+
+        Returns
+        -------
+        int
+            the requests left
+        '''
+        with self._lock:
+            return self.limit if time.time() >= self.resets_at else self.limit - self.spent
+
+class LinkPrefetcher:
+    ''' looks up the availability records of search results in the background, within a quota
+
+    Parameters
+    ----------
+    per_search : int, optional
+        results looked up per search (default of PREFETCH_PER_SEARCH)
+    quota : QuotaBudget, optional
+        the StreamingAvailabilityAPI requests prefetching may spend (default of PREFETCH_QUOTA per PREFETCH_QUOTA_PERIOD)
+    '''
+
+    def __init__(self, per_search=PREFETCH_PER_SEARCH, quota=None):
+        self.per_search = per_search
+        self.quota = quota or QuotaBudget(PREFETCH_QUOTA, PREFETCH_QUOTA_PERIOD)
+        self.stats = Counter()
+        self._status = OrderedDict() # TMDb ID -> status, oldest first
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+
+    def prefetch(self, tmdb_ids):
+        ''' queues background lookups for the first results of a search, without waiting for them
+
+        movies already cached, or already queued, cost nothing.
+
+        Parameters
+        ----------
+        tmdb_ids : iterable of int
+            the TMDb IDs of the results shown, in page order
+
+        Returns
+        -------
+        none
+        '''
+        for tmdb_id in list(tmdb_ids)[:self.per_search]:
+            with self._lock:
+                if self._status.get(tmdb_id) in (QUEUED, FETCHING): # already on its way
+                    continue
+
+            if get_availability_from_cache(tmdb_id) is not None: # a click would already be answered from the cache
+                self._record(tmdb_id, READY, "already_cached")
+                continue
+
+            with self._lock:
+                if self._pending >= PREFETCH_QUEUE_SIZE: # if too many lookups are waiting,
+                    self._record(tmdb_id, SKIPPED, "skipped", locked=True)
+                    continue
+
+                self._pending += 1
+                self._record(tmdb_id, QUEUED, "queued", locked=True)
+
+            self._executor.submit(self._resolve, tmdb_id)
+
+    def _resolve(self, tmdb_id):
+        ''' looks up one movie's availability record on a background thread
+
+        Parameters
+        ----------
+        tmdb_id : int
+            the TMDb ID of the movie
+
+        Returns
+        -------
+        none
+        '''
+        try:
+            if get_availability_from_cache(tmdb_id) is not None: # a click got there first
+                self._record(tmdb_id, READY, "already_cached")
+                return
+
+            if not self.quota.try_spend():
+                self._record(tmdb_id, OVER_QUOTA, "over_quota")
+                return
+
+            self._record(tmdb_id, FETCHING)
+
+            with upstream_priority(BACKGROUND): # a click or search waiting on the same host goes first
+                availability = streaming_availability(tmdb_id)
+
+            if availability is not None:
+                self._record(tmdb_id, READY, "fetched")
+            else:
+                self._record(tmdb_id, FAILED, "failed")
+        except Exception: # never let a background lookup take down the worker
+            self._record(tmdb_id, FAILED, "failed")
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _record(self, tmdb_id, status, outcome=None, locked=False):
+        ''' records a movie's prefetch status and counts the outcome, forgetting the oldest movies over STATUS_SIZE
+
+        Parameters
+        ----------
+        tmdb_id : int
+            the TMDb ID of the movie
+        status : str
+            the new status
+        outcome : str, optional
+            the counter to add one to (default of none)
+        locked : bool, optional
+            True if the caller holds the lock (default of False)
+
+        Returns
+        -------
+        none
+        '''
+        if not locked:
+            with self._lock:
+                return self._record(tmdb_id, status, outcome, locked=True)
+
+        self._status.pop(tmdb_id, None)
+        self._status[tmdb_id] = status
+
+        if outcome is not None:
+            self.stats[outcome] += 1
+
+        while len(self._status) > STATUS_SIZE:
+            self._status.popitem(last=False)
+
+    def status(self, tmdb_id):
+        ''' gets whether a movie's streaming link prefetch has finished
+
+        Parameters
+        ----------
+        tmdb_id : int
+            the TMDb ID of the movie
+
+        Returns
+        -------
+        str
+            QUEUED, FETCHING, READY, FAILED, OVER_QUOTA or SKIPPED, or READY / "not_prefetched" for a movie never queued
+        '''
+        with self._lock:
+            status = self._status.get(tmdb_id)
+
+        if status is not None:
+            return status
+
+        return READY if get_availability_from_cache(tmdb_id) is not None else "not_prefetched"
+
+    def prefetch_stats(self):
+        ''' gets the prefetch counters and the quota left
+
+        Parameters
+        ----------
+        none
+
+        Returns
+        -------
+        dict
+            the counters
+        '''
+        with self._lock:
+            pending, stats = self._pending, dict(self.stats)
+
+        return {"per_search": self.per_search, "pending": pending, "quota": self.quota.limit, "quota_remaining": self.quota.remaining(), **stats}
+
+def prefetch_metrics(stats):
+    ''' gets the prefetch counters as metric families, at scrape time
+
+    Parameters
+    ----------
+    stats : dict
+        the LinkPrefetcher.prefetch_stats() counters
+
+    Returns
+    -------
+    list
+        (name, kind, documentation, samples) families
+    '''
+    return [
+        ("link_prefetch_total", "counter", "Streaming link prefetches by outcome.",
+         [({"outcome": outcome}, stats.get(outcome, 0)) for outcome in ("queued", "fetched", "already_cached", "failed", "over_quota", "skipped")]),
+        ("link_prefetch_pending", "gauge", "Streaming link prefetches queued or running.", [({}, stats["pending"])]),
+        ("link_prefetch_quota_remaining", "gauge", "StreamingAvailabilityAPI requests prefetching may still spend this period.", [({}, stats["quota_remaining"])])
+    ]
+
+link_prefetcher = LinkPrefetcher() # shared by every request, so the quota is per process
+registry.add_collector(lambda: prefetch_metrics(link_prefetcher.prefetch_stats()))
+
+def prefetch_links(tmdb_ids):
+    ''' queues background streaming link lookups for the results of a search, if prefetching is on
+
+    Parameters
+    ----------
+    tmdb_ids : iterable of int
+        the TMDb IDs of the results shown, in page order
+
+    Returns
+    -------
+    none
+    '''
+    if link_prefetcher.per_search > 0:
+        link_prefetcher.prefetch(tmdb_ids)
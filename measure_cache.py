@@ -0,0 +1,74 @@
+#########################################
+##### Name: Tara Dorje              #####
+##### Uniqname: tydorje             #####
+#########################################
+
+import json
+import sys
+
+from cache_store import encode_value
+from movie_record import project_movie, encode_movie
+
+def deep_sizeof(value):
+    ''' gets the in-memory size of a value and everything it contains
+
+    Parameters
+    ----------
+    value : object
+        a JSON-like value or a movie record
+
+    Returns
+    -------
+    int
+        the size in bytes
+    '''
+    size = sys.getsizeof(value)
+
+    if isinstance(value, dict):
+        size += sum(deep_sizeof(key) + deep_sizeof(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(deep_sizeof(item) for item in value)
+    elif hasattr(value, "__slots__"):
+        size += sum(deep_sizeof(getattr(value, field)) for field in value.__slots__)
+
+    return size
+
+def measure(cache_path):
+    ''' compares raw TMDb Details payloads with compact movie records for every movie in a legacy cache file
+
+    Parameters
+    ----------
+    cache_path : str
+        the path of a cache.json-shaped file
+
+    Returns
+    -------
+    dict
+        the movie count, the total encoded and in-memory sizes, raw and compact, and the encoded bytes of the overviews
+    '''
+    with open(cache_path, 'r') as cache_file:
+        cache = json.load(cache_file)
+
+    payloads = [value["movie_details"] for value in cache.values() if isinstance(value, dict) and value.get("movie_details")]
+    records = [project_movie(payload) for payload in payloads]
+
+    return {
+        "movies": len(payloads),
+        "raw_bytes": sum(len(encode_value(payload)) for payload in payloads), # as the cache stores them
+        "record_bytes": sum(len(encode_value(encode_movie(record))) for record in records),
+        "overview_bytes": sum(len(encode_value(record.overview)) for record in records), # displayed on the results page, so it can't be dropped
+        "raw_memory": sum(deep_sizeof(payload) for payload in payloads),
+        "record_memory": sum(deep_sizeof(record) for record in records)
+    }
+
+if __name__ == "__main__":
+    cache_path = sys.argv[1] if len(sys.argv) > 1 else "cache.json"
+    sizes = measure(cache_path)
+    movies = sizes["movies"] or 1
+
+    print(f"Movies measured: {sizes['movies']}")
+    print(f"Encoded size per movie: {sizes['raw_bytes'] / movies:,.0f} B raw, {sizes['record_bytes'] / movies:,.0f} B record "
+          f"({sizes['raw_bytes'] / max(sizes['record_bytes'], 1):.1f}x smaller)")
+    print(f"In-memory size per movie: {sizes['raw_memory'] / movies:,.0f} B raw, {sizes['record_memory'] / movies:,.0f} B record "
+          f"({sizes['raw_memory'] / max(sizes['record_memory'], 1):.1f}x smaller)")
+    print(f"Overview text per movie: {sizes['overview_bytes'] / movies:,.0f} B ({sizes['overview_bytes'] / max(sizes['record_bytes'], 1):.0%} of the encoded record)")
@@ -0,0 +1,302 @@
+#########################################
+##### Name: Tara Dorje              #####
+##### Uniqname: tydorje             #####
+#########################################
+
+import functools
+import inspect
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10) # seconds, upper bounds of the latency histograms
+
+# Prometheus-style metrics, rendered in the text exposition format at /metrics. recording is a dictionary
+# update under a per-metric lock (plus a bisect for histograms), so it is cheap enough to leave on.
+# values that already live elsewhere, like cache counters, are read by collectors at scrape time instead.
+
+class Metric:
+    ''' a named family of values, one per combination of label values
+
+    Parameters
+    ----------
+    name : str
+        the metric name
+    documentation : str
+        the HELP text
+    label_names : tuple, optional
+        the label names, every recording passes a value for each (default of none)
+    '''
+    kind = "untyped"
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {} # label values tuple -> value
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        ''' gets the label values tuple a recording's values are kept under '''
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def samples(self):
+        ''' gets the current samples
+
+        Parameters
+        ----------
+        none
+
+        Returns
+        -------
+        list
+            (name suffix, labels dict, value) tuples
+        '''
+        with self._lock:
+            return [("", dict(zip(self.label_names, key)), value) for key, value in self._values.items()]
+
+class Counter(Metric):
+    ''' a value that only goes up '''
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        ''' adds to the counter for a set of label values
+
+        Parameters
+        ----------
+        amount : float, optional
+            the amount to add (default of 1)
+        **labels
+            the label values
+
+        Returns
+        -------
+        none
+        '''
+        key = self._key(labels)
+
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Counter):
+    ''' a value that goes up and down '''
+    kind = "gauge"
+
+    def dec(self, amount=1, **labels):
+        ''' subtracts from the gauge for a set of label values
+
+        Parameters
+        ----------
+        amount : float, optional
+            the amount to subtract (default of 1)
+        **labels
+            the label values
+
+        Returns
+        -------
+        none
+        '''
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_in_flight(self, **labels):
+        ''' counts the with block as in flight while it runs '''
+        self.inc(**labels)
+
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+class Histogram(Metric):
+    ''' counts observations into cumulative buckets, with their sum and count
+
+    Parameters
+    ----------
+    name : str
+        the metric name
+    documentation : str
+        the HELP text
+    label_names : tuple, optional
+        the label names (default of none)
+    buckets : tuple, optional
+        the increasing bucket upper bounds (default of DEFAULT_BUCKETS)
+    '''
+    kind = "histogram"
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        ''' records one observation
+
+        Parameters
+        ----------
+        value : float
+            the observed value, seconds for latencies
+        **labels
+            the label values
+
+        Returns
+        -------
+        none
+        '''
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value) # the first bucket the value fits in, len(buckets) for +Inf
+
+        with self._lock:
+            counts = self._values.get(key)
+
+            if counts is None:
+                counts = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0] # per-bucket counts, sum, count
+
+            counts[0][index] += 1
+            counts[1] += value
+            counts[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        ''' observes how long the with block takes, even if it raises '''
+        started = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = [(dict(zip(self.label_names, key)), list(counts[0]), counts[1], counts[2]) for key, counts in self._values.items()]
+
+        samples = []
+
+        for labels, bucket_counts, total, count in values:
+            cumulative = 0
+
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), bucket_counts):
+                cumulative += bucket_count
+                samples.append(("_bucket", {**labels, "le": "+Inf" if bound == float("inf") else repr(float(bound))}, cumulative))
+
+            samples.append(("_sum", labels, total))
+            samples.append(("_count", labels, count))
+
+        return samples
+
+class Registry:
+    ''' the metrics and scrape-time collectors rendered at /metrics '''
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        ''' adds a metric, or returns the one already registered under its name '''
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric) # reloading a module reuses the metric
+
+    def counter(self, name, documentation, label_names=()):
+        ''' registers a Counter, see Metric for the parameters '''
+        return self._register(Counter(name, documentation, label_names))
+
+    def gauge(self, name, documentation, label_names=()):
+        ''' registers a Gauge, see Metric for the parameters '''
+        return self._register(Gauge(name, documentation, label_names))
+
+    def histogram(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        ''' registers a Histogram, see Histogram for the parameters '''
+        return self._register(Histogram(name, documentation, label_names, buckets))
+
+    def add_collector(self, collector):
+        ''' registers a function called at every scrape for values kept elsewhere
+
+        Parameters
+        ----------
+        collector : callable
+            returns (name, kind, documentation, [(labels dict, value), ...]) families
+
+        Returns
+        -------
+        none
+        '''
+        self._collectors.append(collector)
+
+    def render(self):
+        ''' renders every metric in the Prometheus text exposition format (version 0.0.4)
+
+        Parameters
+        ----------
+        none
+
+        Returns
+        -------
+        str
+            the exposition text
+        '''
+        lines = []
+
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        families = [(metric.name, metric.kind, metric.documentation, metric.samples()) for metric in metrics]
+
+        for collector in self._collectors:
+            families.extend((name, kind, documentation, [("", labels, value) for labels, value in samples])
+                            for name, kind, documentation, samples in collector())
+
+        for name, kind, documentation, samples in families:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+
+            for suffix, labels, value in samples:
+                lines.append(f"{name}{suffix}{format_labels(labels)} {format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+def format_labels(labels):
+    ''' formats a label set, escaping backslashes, quotes and newlines in the values '''
+    if not labels:
+        return ""
+
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+def format_value(value):
+    ''' formats a sample value, integers without a decimal point '''
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+registry = Registry() # the process's metrics
+
+function_duration = registry.histogram("tmdb_function_duration_seconds", "Time spent in TMDb and StreamingAvailabilityAPI functions, cache lookups included.", ("function",))
+
+def timed(function):
+    ''' records every call of a function, or coroutine function, in tmdb_function_duration_seconds
+
+    Parameters
+    ----------
+    function : callable
+        the function to time
+
+    Returns
+    -------
+    callable
+        the timed function
+    '''
+    name = function.__name__
+
+    if inspect.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def timed_coroutine(*args, **kwargs):
+            with function_duration.time(function=name):
+                return await function(*args, **kwargs)
+
+        return timed_coroutine
+
+    @functools.wraps(function)
+    def timed_function(*args, **kwargs):
+        with function_duration.time(function=name):
+            return function(*args, **kwargs)
+
+    return timed_function
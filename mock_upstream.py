@@ -0,0 +1,332 @@
+#########################################
+##### Name: Tara Dorje              #####
+##### Uniqname: tydorje             #####
+#########################################
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from tmdb import SERVICES, DISCOVER_PAGE_SIZE, get_streaming_availability_service
+
+# a local stand-in for the TMDb and StreamingAvailabilityAPI endpoints the app calls, for offline benchmarks.
+# start the app with UPSTREAM_ORIGIN pointing here (see upstream.redirect_upstream). responses are built from
+# the Discover lists, movie details and streaming links in cache.json; criteria and movies missing from it get
+# deterministic synthetic data, so every search has results.
+
+PROVIDERS = { # TMDb watch provider IDs, named like the app's service choices
+    "Netflix": 8, "Prime": 9, "Disney": 337, "HBO Max": 1899, "Hulu": 15, "Peacock": 386,
+    "Paramount": 531, "Starz": 43, "Showtime": 37, "Apple TV": 350, "MUBI": 11
+}
+GENRE_IDS = {
+    "Adventure": 12, "Fantasy": 14, "Animation": 16, "Drama": 18, "Horror": 27, "Action": 28, "Comedy": 35, "History": 36, "Western": 37,
+    "Thriller": 53, "Crime": 80, "Documentary": 99, "Science Fiction": 878, "Mystery": 9648, "Music": 10402, "Romance": 10749,
+    "Family": 10751, "War": 10752
+}
+LANGUAGE_CODES = {"English": "en", "French": "fr", "German": "de", "Spanish": "es", "Hindi": "hi", "Mandarin": "zh", "Japanese": "ja", "Korean": "ko"}
+SYNTHETIC_PAGES = 3 # Discover pages served for criteria missing from the fixtures
+SYNTHETIC_ID_BASE = 10_000_000 # synthetic TMDb IDs start here, above the fixtures' real IDs
+
+class Fixtures:
+    ''' the upstream data the mock serves, from a legacy cache.json file plus synthetic movies
+
+    Parameters
+    ----------
+    path : str or None
+        the path of a cache.json-shaped file, or None for synthetic data only
+    '''
+
+    def __init__(self, path):
+        self.discover = {} # Discover cache key -> TMDb IDs
+        self.movies = {} # TMDb ID -> Details payload
+        self.links = {} # TMDb ID -> service -> streaming link
+        self._lock = threading.Lock()
+
+        if path:
+            with open(path, 'r') as cache_file:
+                cache = json.load(cache_file)
+
+            for key, value in cache.items():
+                if isinstance(value, list): # Discover Movie result list
+                    self.discover[key] = value
+                elif isinstance(value, dict):
+                    if value.get("movie_details"):
+                        self.movies[int(key)] = value["movie_details"]
+                    if value.get("streaming_link"):
+                        self.links[int(key)] = value["streaming_link"]
+
+    def discover_page(self, params):
+        ''' gets the TMDb IDs of one Discover Movie page
+
+        Parameters
+        ----------
+        params : dict
+            the query string parameters
+
+        Returns
+        -------
+        tuple
+            the TMDb IDs and the total number of pages
+        '''
+        runtime_gte, runtime_lte = int(params["with_runtime.gte"]), int(params["with_runtime.lte"])
+        cache_key = f"{params['with_watch_providers']}_{params['with_genres']}_{params['with_original_language']}_{runtime_gte}_{runtime_lte}"
+        page = int(params.get("page", 1))
+
+        if cache_key in self.discover: # the fixture has this search
+            tmdb_ids = self.discover[cache_key]
+            total_pages = max(1, -(-len(tmdb_ids) // DISCOVER_PAGE_SIZE))
+            tmdb_ids = tmdb_ids[(page - 1) * DISCOVER_PAGE_SIZE:page * DISCOVER_PAGE_SIZE]
+        else: # make up movies that match the criteria
+            seed = int(hashlib.sha1(cache_key.encode()).hexdigest()[:8], 16) % 100_000
+            total_pages = SYNTHETIC_PAGES
+            tmdb_ids = [SYNTHETIC_ID_BASE + seed * 100 + (page - 1) * DISCOVER_PAGE_SIZE + number for number in range(DISCOVER_PAGE_SIZE)] if page <= total_pages else []
+
+        with self._lock:
+            for number, tmdb_id in enumerate(tmdb_ids):
+                if tmdb_id not in self.movies: # give every listed movie details that match the search
+                    self.movies[tmdb_id] = synthetic_movie(tmdb_id, int(params["with_genres"]), params["with_original_language"],
+                                                           runtime_gte + number % (min(runtime_lte, 240) - runtime_gte + 1))
+
+        return tmdb_ids, total_pages
+
+    def movie(self, tmdb_id):
+        ''' gets a movie's Details payload, made up if the movie is unknown '''
+        with self._lock:
+            return self.movies.setdefault(tmdb_id, synthetic_movie(tmdb_id, GENRE_IDS["Drama"], "en", 100))
+
+    def availability(self, tmdb_id):
+        ''' gets a movie's StreamingAvailabilityAPI record, with a link on every service that isn't saved as unavailable '''
+        links = self.links.get(tmdb_id, {})
+        options = []
+
+        for service in SERVICES:
+            link = links.get(service, f"https://example.com/{get_streaming_availability_service(service)}/{tmdb_id}")
+
+            if link != "Streaming link not available.":
+                options.append({"service": get_streaming_availability_service(service), "streamingType": "subscription", "link": link})
+
+        return {"result": {"tmdbId": f"movie/{tmdb_id}", "streamingInfo": {"us": options}}}
+
+def synthetic_movie(tmdb_id, genre_id, language, runtime):
+    ''' makes up a TMDb Details payload
+
+    Parameters
+    ----------
+    tmdb_id : int
+        the TMDb ID
+    genre_id : int
+        the TMDb genre ID
+    language : str
+        the original language code
+    runtime : int
+        the runtime in minutes
+
+    Returns
+    -------
+    dict
+        the Details payload
+    '''
+    return {
+        "id": tmdb_id,
+        "title": f"Synthetic Movie {tmdb_id}",
+        "runtime": runtime,
+        "genres": [{"id": genre_id}],
+        "original_language": language,
+        "poster_path": f"/synthetic{tmdb_id}.jpg",
+        "overview": "A movie made up by the mock upstream server. " * 4,
+        "popularity": float(tmdb_id % 1000)
+    }
+
+def credits_payload(tmdb_id):
+    ''' makes up a TMDb Credits payload with one director '''
+    return {"id": tmdb_id, "crew": [{"job": "Director", "name": f"Director {tmdb_id % 97}"}, {"job": "Producer", "name": "Producer"}]}
+
+class MockUpstreamServer(ThreadingHTTPServer):
+    ''' serves the mock endpoints with injected latency and errors, counting every call
+
+    Parameters
+    ----------
+    address : tuple
+        the (host, port) to listen on, port 0 picks a free port
+    fixtures : Fixtures
+        the data to serve
+    latency : float, optional
+        the mean seconds added to every response (default of 0)
+    jitter : float, optional
+        the seconds the latency varies by, uniformly either way (default of 0)
+    error_rate : float, optional
+        the fraction of requests answered 503 (default of 0)
+    rate_limit_rate : float, optional
+        the fraction of requests answered 429 with Retry-After: 1 (default of 0)
+    '''
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, fixtures, latency=0, jitter=0, error_rate=0, rate_limit_rate=0):
+        super().__init__(address, MockUpstreamHandler)
+        self.fixtures = fixtures
+        self.latency, self.jitter = latency, jitter
+        self.error_rate, self.rate_limit_rate = error_rate, rate_limit_rate
+        self.calls = Counter() # endpoint -> requests
+        self.calls_lock = threading.Lock()
+
+    def count(self, name):
+        with self.calls_lock:
+            self.calls[name] += 1
+
+class MockUpstreamHandler(BaseHTTPRequestHandler):
+    ''' answers one mock TMDb or StreamingAvailabilityAPI request '''
+    protocol_version = "HTTP/1.1" # keep-alive, like the real APIs
+
+    ROUTES = [ # path pattern -> endpoint name
+        (re.compile(r"^/3/discover/movie$"), "discover"),
+        (re.compile(r"^/3/movie/(\d+)$"), "details"),
+        (re.compile(r"^/3/movie/(\d+)/credits$"), "credits"),
+        (re.compile(r"^/3/watch/providers/movie$"), "providers"),
+        (re.compile(r"^/3/genre/movie/list$"), "genres"),
+        (re.compile(r"^/3/configuration/languages$"), "languages"),
+        (re.compile(r"^/get$"), "availability"),
+        (re.compile(r"^/t/p/(w\d+|original)/[A-Za-z0-9_-]+\.jpg$"), "poster")
+    ]
+
+    def log_message(self, format, *args): # quiet, the benchmark prints its own report
+        pass
+
+    def do_GET(self):
+        server = self.server
+        parts = urlsplit(self.path)
+        params = {name: values[-1] for name, values in parse_qs(parts.query).items()}
+
+        if parts.path == "/__mock/stats": # call counts for the benchmark
+            return self.send_json(200, {"calls": dict(server.calls)})
+
+        if parts.path == "/__mock/reset":
+            with server.calls_lock:
+                server.calls.clear()
+            return self.send_json(200, {})
+
+        for pattern, name in self.ROUTES:
+            match = pattern.match(parts.path)
+            if match:
+                break
+        else:
+            return self.send_json(404, {"status_message": "unknown mock endpoint"})
+
+        server.count(name)
+        time.sleep(max(0, server.latency + random.uniform(-server.jitter, server.jitter))) # network and server time
+
+        roll = random.random()
+
+        if roll < server.rate_limit_rate: # injected rate limiting
+            server.count("injected_429")
+            return self.send_json(429, {"status_message": "rate limited"}, {"Retry-After": "1"})
+        if roll < server.rate_limit_rate + server.error_rate: # injected server errors
+            server.count("injected_503")
+            return self.send_json(503, {"status_message": "unavailable"})
+
+        if name == "poster":
+            return self.send_image(match.group(1))
+
+        return self.send_json(200, self.payload(name, match, params), cacheable=name in ("discover", "details"))
+
+    def payload(self, name, match, params):
+        ''' builds the response body of a mock endpoint '''
+        fixtures = self.server.fixtures
+
+        if name == "discover":
+            tmdb_ids, total_pages = fixtures.discover_page(params)
+            return {"page": int(params.get("page", 1)), "results": [{"id": tmdb_id} for tmdb_id in tmdb_ids], "total_pages": total_pages}
+        if name == "details":
+            tmdb_id = int(match.group(1))
+            movie = dict(fixtures.movie(tmdb_id))
+            if params.get("append_to_response") == "credits":
+                movie["credits"] = credits_payload(tmdb_id)
+            return movie
+        if name == "credits":
+            return credits_payload(int(match.group(1)))
+        if name == "providers":
+            return {"results": [{"provider_name": service, "provider_id": provider_id} for service, provider_id in PROVIDERS.items()]}
+        if name == "genres":
+            return {"genres": [{"name": genre, "id": genre_id} for genre, genre_id in GENRE_IDS.items()]}
+        if name == "languages":
+            return [{"english_name": language, "iso_639_1": code} for language, code in LANGUAGE_CODES.items()]
+
+        return fixtures.availability(int(params["tmdb_id"].split("/")[-1]))
+
+    def send_json(self, status, body, headers=None, cacheable=False):
+        ''' sends a JSON response, with an ETag that answers If-None-Match with a 304 for cacheable endpoints '''
+        data = json.dumps(body).encode()
+        etag = f'"{hashlib.sha1(data).hexdigest()[:16]}"'
+
+        if cacheable and self.headers.get("If-None-Match") == etag: # the app's copy is current
+            status, data = 304, b""
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+
+        if cacheable:
+            self.send_header("ETag", etag)
+
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_image(self, size):
+        ''' sends a placeholder JPEG, larger for larger renditions like TMDb's '''
+        width = 500 if size == "original" else int(size[1:])
+        data = b"\xff\xd8\xff\xe0" + bytes(width * 16) + b"\xff\xd9" # JPEG start and end markers around filler
+
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+def start_mock_upstream(fixtures_path="cache.json", port=0, **injection):
+    ''' starts a mock upstream server on a background thread
+
+    Parameters
+    ----------
+    fixtures_path : str or None, optional
+        the cache.json-shaped fixtures (default of "cache.json")
+    port : int, optional
+        the port to listen on (default of 0, any free port)
+    **injection
+        latency, jitter, error_rate and rate_limit_rate, see MockUpstreamServer
+
+    Returns
+    -------
+    MockUpstreamServer
+        the running server, its address is server.server_address
+    '''
+    server = MockUpstreamServer(("127.0.0.1", port), Fixtures(fixtures_path), **injection)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve mock TMDb and StreamingAvailabilityAPI endpoints built from cache.json.")
+    parser.add_argument("--port", type=int, default=8089, help="port to listen on (default: 8089)")
+    parser.add_argument("--fixtures", default="cache.json", help="cache.json-shaped fixtures (default: cache.json)")
+    parser.add_argument("--latency", type=float, default=0.05, help="mean seconds added to every response (default: 0.05)")
+    parser.add_argument("--jitter", type=float, default=0.02, help="seconds the latency varies by (default: 0.02)")
+    parser.add_argument("--error-rate", type=float, default=0, help="fraction of requests answered 503 (default: 0)")
+    parser.add_argument("--rate-limit-rate", type=float, default=0, help="fraction of requests answered 429 (default: 0)")
+    args = parser.parse_args()
+
+    server = MockUpstreamServer(("127.0.0.1", args.port), Fixtures(args.fixtures), args.latency, args.jitter, args.error_rate, args.rate_limit_rate)
+    print(f"Mock upstream listening on http://127.0.0.1:{args.port}, start the app with UPSTREAM_ORIGIN=http://127.0.0.1:{args.port}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,133 @@
+#########################################
+##### Name: Tara Dorje              #####
+##### Uniqname: tydorje             #####
+#########################################
+
+from dataclasses import dataclass
+
+RECORD_VERSION = 2 # bump when the encoded field list changes, and teach decode_movie the old layout
+
+@dataclass(frozen=True)
+class MovieRecord:
+    ''' the fields of a TMDb Details payload that the program uses
+
+    a slotted record is a fraction of the size of the raw payload dictionary, which also carries
+    production companies, spoken languages, logos and other fields that are never displayed.
+
+    Attributes
+    ----------
+    tmdb_id : int
+        the TMDb ID of the movie
+    title : str
+        the movie title
+    runtime : int
+        the runtime in minutes (0 if unknown)
+    poster_path : str or None
+        the TMDb poster image path
+    overview : str
+        the movie synopsis
+    original_language : str
+        the TMDb language ID of the original language
+    genre_ids : tuple
+        the TMDb genre IDs
+    popularity : float
+        the TMDb popularity score, used to order results like the Discover Movie endpoint
+    '''
+    __slots__ = ("tmdb_id", "title", "runtime", "poster_path", "overview", "original_language", "genre_ids", "popularity")
+
+    tmdb_id: int
+    title: str
+    runtime: int
+    poster_path: str
+    overview: str
+    original_language: str
+    genre_ids: tuple
+    popularity: float
+
+def project_movie(movie_details):
+    ''' projects a TMDb Details payload (or a record dictionary from open_cache) onto a movie record
+
+    Parameters
+    ----------
+    movie_details : dict
+        the TMDb Details payload
+
+    Returns
+    -------
+    MovieRecord
+        the compact movie record
+    '''
+    if "genre_ids" in movie_details: # record dictionary
+        genre_ids = movie_details["genre_ids"]
+    else: # TMDb Details payload
+        genre_ids = [genre["id"] for genre in movie_details.get("genres", [])]
+
+    return MovieRecord(
+        tmdb_id=movie_details.get("tmdb_id", movie_details.get("id")),
+        title=movie_details.get("title", ""),
+        runtime=movie_details.get("runtime") or 0, # TMDb sends null for unknown runtimes
+        poster_path=movie_details.get("poster_path"),
+        overview=movie_details.get("overview", ""),
+        original_language=movie_details.get("original_language"),
+        genre_ids=tuple(genre_ids),
+        popularity=movie_details.get("popularity") or 0.0
+    )
+
+def encode_movie(record):
+    ''' encodes a movie record as a versioned JSON-serializable list
+
+    Parameters
+    ----------
+    record : MovieRecord
+        the movie record
+
+    Returns
+    -------
+    list
+        the record version followed by the record fields in __slots__ order
+    '''
+    return [RECORD_VERSION, record.tmdb_id, record.title, record.runtime, record.poster_path,
+            record.overview, record.original_language, list(record.genre_ids), record.popularity]
+
+def decode_movie(encoded):
+    ''' decodes a stored movie, accepting both encoded records and raw TMDb Details payloads
+
+    Parameters
+    ----------
+    encoded : list or dict
+        the value from encode_movie, or a raw TMDb Details payload cached before records existed
+
+    Returns
+    -------
+    MovieRecord
+        the movie record
+    '''
+    if isinstance(encoded, dict): # raw payload from an older cache
+        return project_movie(encoded)
+
+    version = encoded[0]
+
+    if version == 2:
+        _, tmdb_id, title, runtime, poster_path, overview, original_language, genre_ids, popularity = encoded
+        return MovieRecord(tmdb_id, title, runtime, poster_path, overview, original_language, tuple(genre_ids), popularity)
+
+    if version == 1: # before popularity was kept
+        _, tmdb_id, title, runtime, poster_path, overview, original_language, genre_ids = encoded
+        return MovieRecord(tmdb_id, title, runtime, poster_path, overview, original_language, tuple(genre_ids), 0.0)
+
+    raise ValueError(f"unknown movie record version {version}")
+
+def movie_to_dict(record):
+    ''' converts a movie record to a dictionary for export
+
+    Parameters
+    ----------
+    record : MovieRecord
+        the movie record
+
+    Returns
+    -------
+    dict
+        the record fields by name
+    '''
+    return {field: getattr(record, field) for field in MovieRecord.__slots__}
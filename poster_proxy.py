@@ -0,0 +1,262 @@
+#########################################
+##### Name: Tara Dorje              #####
+##### Uniqname: tydorje             #####
+#########################################
+
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+from metrics import registry
+from single_flight import SingleFlight
+from upstream import upstream_get
+
+POSTER_SIZES = ("w92", "w154", "w185", "w342", "w500", "w780") # TMDb's poster renditions, resized by its image CDN
+POSTER_FILE = re.compile(r"[A-Za-z0-9_-]+\.(jpg|jpeg|png|webp)") # TMDb poster file names are content-addressed
+POSTER_CACHE_DIR = os.environ.get("POSTER_CACHE_DIR", "poster_cache") # where fetched posters are kept
+POSTER_CACHE_BUDGET = int(os.environ.get("POSTER_CACHE_BUDGET", 256 * 1024 * 1024)) # bytes of posters kept on disk
+POSTER_MAX_AGE = 365 * 24 * 60 * 60 # seconds browsers may keep a poster, a file name never changes content
+CONTENT_TYPES = {"jpg": "image/jpeg", "jpeg": "image/jpeg", "png": "image/png", "webp": "image/webp"}
+
+class DiskLRU:
+    ''' a directory of files kept under a byte budget, deleting the least recently used first
+
+    recency is kept in memory and in each file's modification time, so a restarted process (or another process
+    sharing the directory) starts from the same order. files are written to a temporary name and renamed into place,
+    so readers never see a partial file.
+
+    Parameters
+    ----------
+    directory : str
+        the cache directory, created if missing
+    budget : int
+        the most bytes of files kept
+    '''
+
+    def __init__(self, directory, budget):
+        self.directory = os.path.abspath(directory) # send_file resolves relative paths against the app, not the working directory
+        self.budget = budget
+        self.size = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._files = OrderedDict() # file name -> size, least recently used first
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        entries = []
+
+        for name in os.listdir(directory):
+            if name.startswith("."): # a temporary file left by a crash
+                continue
+            status = os.stat(os.path.join(directory, name))
+            entries.append((status.st_mtime, name, status.st_size))
+
+        for _, name, size in sorted(entries):
+            self._files[name] = size
+            self.size += size
+
+    def get(self, name):
+        ''' gets the path of a cached file and marks it as most recently used
+
+        Parameters
+        ----------
+        name : str
+            the file name
+
+        Returns
+        -------
+        str or None
+            the file's path, or None if it is not cached
+        '''
+        path = os.path.join(self.directory, name)
+
+        with self._lock:
+            if name not in self._files and os.path.exists(path): # written by another process
+                self._files[name] = os.path.getsize(path)
+                self.size += self._files[name]
+
+            if name not in self._files:
+                self.stats["misses"] += 1
+                return None
+
+            self._files.move_to_end(name)
+            self.stats["hits"] += 1
+
+        try:
+            os.utime(path) # keep the recency across restarts
+        except FileNotFoundError: # evicted by another process
+            with self._lock:
+                self.size -= self._files.pop(name, 0)
+            return None
+
+        return path
+
+    def put(self, name, data):
+        ''' stores a file, deleting least recently used files to stay within the budget
+
+        Parameters
+        ----------
+        name : str
+            the file name
+        data : bytes
+            the file contents
+
+        Returns
+        -------
+        str or None
+            the file's path, or None if the file is larger than the whole budget
+        '''
+        if len(data) > self.budget:
+            return None
+
+        path = os.path.join(self.directory, name)
+        descriptor, temp_path = tempfile.mkstemp(prefix=f".{name}.", dir=self.directory)
+
+        with os.fdopen(descriptor, 'wb') as temp_file:
+            temp_file.write(data)
+
+        os.replace(temp_path, path)
+
+        with self._lock:
+            self.size += len(data) - self._files.pop(name, 0)
+            self._files[name] = len(data)
+
+            while self.size > self.budget: # delete from the least recently used end
+                oldest, size = self._files.popitem(last=False)
+                self.size -= size
+                self.stats["evictions"] += 1
+
+                try:
+                    os.remove(os.path.join(self.directory, oldest))
+                except FileNotFoundError: # already deleted by another process
+                    pass
+
+        return path
+
+    def cache_stats(self):
+        ''' gets the file count, bytes, budget and hit, miss and eviction counters
+
+        Parameters
+        ----------
+        none
+
+        Returns
+        -------
+        dict
+            the counters
+        '''
+        with self._lock:
+            return {"files": len(self._files), "bytes": self.size, "budget": self.budget, **self.stats}
+
+_cache = None
+_cache_lock = threading.Lock()
+poster_flights = SingleFlight("poster") # concurrent misses for the same poster share one download
+
+def get_poster_cache():
+    ''' returns the shared poster cache, scanning its directory on first use
+
+    Parameters
+    ----------
+    none
+
+    Returns
+    -------
+    DiskLRU
+        the poster cache
+    '''
+    global _cache
+
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = DiskLRU(POSTER_CACHE_DIR, POSTER_CACHE_BUDGET)
+
+    return _cache
+
+def poster_metrics():
+    ''' gets the poster cache counters as metric families, at scrape time
+
+    Parameters
+    ----------
+    none
+
+    Returns
+    -------
+    list
+        (name, kind, documentation, samples) families
+    '''
+    stats = get_poster_cache().cache_stats()
+    return [
+        ("poster_cache_lookups_total", "counter", "Poster cache reads by result.", [({"result": "hit"}, stats["hits"]), ({"result": "miss"}, stats["misses"])]),
+        ("poster_cache_evictions_total", "counter", "Posters deleted to stay within the byte budget.", [({}, stats["evictions"])]),
+        ("poster_cache_bytes", "gauge", "Bytes of posters on disk.", [({}, stats["bytes"])]),
+        ("poster_cache_budget_bytes", "gauge", "The poster cache byte budget.", [({}, stats["budget"])])
+    ]
+
+registry.add_collector(poster_metrics)
+
+def poster_content_type(file_name):
+    ''' gets the content type of a poster file from its extension
+
+    Parameters
+    ----------
+    file_name : str
+        the poster file name
+
+    Returns
+    -------
+    str
+        the MIME type
+    '''
+    return CONTENT_TYPES[file_name.rsplit(".", 1)[-1].lower()]
+
+def get_poster(size, file_name):
+    ''' gets the path of a cached poster rendition, downloading it from TMDb once
+
+    Parameters
+    ----------
+    size : str
+        one of POSTER_SIZES
+    file_name : str
+        the TMDb poster file name, without the leading slash
+
+    Returns
+    -------
+    str or None
+        the path of the cached file, or None if the size or file name is invalid or TMDb doesn't have it
+    '''
+    if size not in POSTER_SIZES or not POSTER_FILE.fullmatch(file_name): # only proxy TMDb posters, never arbitrary URLs
+        return None
+
+    name = f"{size}_{file_name}"
+    path = get_poster_cache().get(name)
+
+    if path is not None:
+        return path
+
+    return poster_flights.do(name, _fetch_poster, size, file_name, name)
+
+def _fetch_poster(size, file_name, name):
+    ''' downloads one poster rendition and caches it, for one caller of get_poster at a time
+
+    Parameters
+    ----------
+    size : str
+        one of POSTER_SIZES
+    file_name : str
+        the TMDb poster file name
+    name : str
+        the cache file name
+
+    Returns
+    -------
+    str or None
+        the path of the cached file, or None if TMDb doesn't have it
+    '''
+    response = upstream_get(f"https://image.tmdb.org/t/p/{size}/{file_name}")
+
+    if response.status_code != 200 or not response.headers.get("Content-Type", "").startswith("image/"):
+        return None
+
+    return get_poster_cache().put(name, response.content)
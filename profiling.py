@@ -0,0 +1,364 @@
+#########################################
+##### Name: Tara Dorje              #####
+##### Uniqname: tydorje             #####
+#########################################
+
+import argparse
+import glob
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from flask import g, request
+
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0)) # fraction of requests profiled
+PROFILE_HEADER = os.environ.get("PROFILE_HEADER") == "1" # also profile requests sent with "X-Profile: 1"
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles") # where profiles are written
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", 0.005)) # seconds between stack samples
+PROFILING_ENABLED = PROFILE_SAMPLE_RATE > 0 or PROFILE_HEADER # when off, no hook is installed and requests pay nothing
+REPO_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+# a sampling profiler for single requests: while a profiled request runs, a background thread records the
+# request thread's Python stack every PROFILE_INTERVAL seconds. each profile is a JSON file of collapsed stacks
+# ("outer;inner;leaf" -> samples, the input of flame graph tools) with the route, criteria, status and duration.
+# sampling the whole stack shows where the wall-clock time went, including waits on upstream requests.
+
+class Profile:
+    ''' the stack samples of one profiled request
+
+    Parameters
+    ----------
+    route : str
+        the route pattern, e.g. "/search"
+    method : str
+        the HTTP method
+    path : str
+        the request path
+    criteria : dict
+        the request's query string or form parameters
+    '''
+
+    def __init__(self, route, method, path, criteria):
+        self.route, self.method, self.path, self.criteria = route, method, path, criteria
+        self.thread_id = threading.get_ident()
+        self.started = time.time()
+        self.started_counter = time.perf_counter()
+        self.stacks = Counter() # collapsed stack -> samples
+
+class Sampler:
+    ''' samples the stacks of every thread serving a profiled request, from one background thread '''
+
+    def __init__(self):
+        self._active = {} # thread ID -> Profile
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def start(self, profile):
+        ''' starts sampling a profile's thread
+
+        Parameters
+        ----------
+        profile : Profile
+            the profile to fill
+
+        Returns
+        -------
+        none
+        '''
+        with self._condition:
+            self._active[profile.thread_id] = profile
+
+            if self._thread is None: # the first profiled request starts the sampler
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+
+            self._condition.notify()
+
+    def stop(self, profile):
+        ''' stops sampling a profile's thread
+
+        Parameters
+        ----------
+        profile : Profile
+            the profile
+
+        Returns
+        -------
+        none
+        '''
+        with self._condition:
+            if self._active.get(profile.thread_id) is profile:
+                del self._active[profile.thread_id]
+
+    def _run(self):
+        ''' records a stack sample of every active profile, sleeping while there are none '''
+        while True:
+            with self._condition:
+                while not self._active:
+                    self._condition.wait()
+                active = list(self._active.values())
+
+            frames = sys._current_frames()
+
+            for profile in active:
+                frame = frames.get(profile.thread_id)
+                if frame is not None:
+                    profile.stacks[collapse_stack(frame)] += 1
+
+            time.sleep(PROFILE_INTERVAL)
+
+def collapse_stack(frame):
+    ''' formats a stack as "outermost;...;innermost" frames, each "function (file:first line)"
+
+    this program's files are named alone ("tmdb.py"), others with their directory ("flask/app.py").
+
+    Parameters
+    ----------
+    frame : frame
+        the innermost frame
+
+    Returns
+    -------
+    str
+        the collapsed stack
+    '''
+    names = []
+
+    while frame is not None:
+        code = frame.f_code
+        directory, name = os.path.split(code.co_filename)
+        file_name = name if directory == REPO_DIRECTORY else f"{os.path.basename(directory)}/{name}"
+        names.append(f"{code.co_name} ({file_name}:{code.co_firstlineno})")
+        frame = frame.f_back
+
+    return ";".join(reversed(names))
+
+sampler = Sampler()
+
+def should_profile(headers):
+    ''' decides whether to profile a request: a PROFILE_SAMPLE_RATE sample, or an "X-Profile: 1" header if PROFILE_HEADER is set
+
+    Parameters
+    ----------
+    headers : mapping
+        the request headers
+
+    Returns
+    -------
+    bool
+        True to profile the request
+    '''
+    return (PROFILE_HEADER and headers.get("X-Profile") == "1") or random.random() < PROFILE_SAMPLE_RATE
+
+def start_profile(route, method, path, criteria):
+    ''' starts profiling the calling thread's request
+
+    Parameters
+    ----------
+    route : str
+        the route pattern
+    method : str
+        the HTTP method
+    path : str
+        the request path
+    criteria : dict
+        the request's query string or form parameters
+
+    Returns
+    -------
+    Profile
+        the running profile, pass it to finish_profile
+    '''
+    profile = Profile(route, method, path, criteria)
+    sampler.start(profile)
+    return profile
+
+def finish_profile(profile, status, directory=None):
+    ''' stops a profile and writes it to the profile directory
+
+    Parameters
+    ----------
+    profile : Profile
+        the running profile
+    status : int
+        the response status
+    directory : str, optional
+        where to write it (default of PROFILE_DIR)
+
+    Returns
+    -------
+    str
+        the path of the profile file
+    '''
+    sampler.stop(profile)
+    directory = directory or PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    slug = profile.route.strip("/").replace("/", "_").replace("<", "").replace(">", "") or "index"
+    path = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(profile.started))}-{slug}-{uuid.uuid4().hex[:8]}.json")
+    record = {
+        "route": profile.route,
+        "method": profile.method,
+        "path": profile.path,
+        "criteria": profile.criteria,
+        "status": status,
+        "started": profile.started,
+        "duration_ms": round(1000 * (time.perf_counter() - profile.started_counter), 1),
+        "interval": PROFILE_INTERVAL,
+        "samples": sum(profile.stacks.values()),
+        "stacks": dict(profile.stacks)
+    }
+
+    with open(path, 'w') as profile_file:
+        json.dump(record, profile_file)
+
+    return path
+
+def install_profiling(app):
+    ''' profiles sampled requests of a Flask app, if profiling is enabled
+
+    the profile covers the whole response, a streamed body included, and is written when the response closes.
+    a request whose view raised is written at teardown, with a 500 status.
+
+    Parameters
+    ----------
+    app : flask.Flask
+        the app
+
+    Returns
+    -------
+    none
+    '''
+    if not PROFILING_ENABLED: # no hooks at all, so requests pay nothing
+        return
+
+    @app.before_request
+    def start_request_profile():
+        if should_profile(request.headers):
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            g.profile = start_profile(route, request.method, request.path, {**request.args, **request.form})
+
+    @app.after_request
+    def finish_request_profile(response):
+        profile = g.pop("profile", None)
+
+        if profile is not None: # a streamed body is still being generated
+            response.call_on_close(lambda: finish_profile(profile, response.status_code))
+
+        return response
+
+    @app.teardown_request
+    def finish_failed_request_profile(error):
+        profile = g.pop("profile", None)
+
+        if profile is not None: # the view raised, so finish_request_profile never ran
+            finish_profile(profile, 500)
+
+##################SUMMARY################
+
+def load_profiles(directory, route=None):
+    ''' reads the profiles in a directory
+
+    Parameters
+    ----------
+    directory : str
+        the profile directory
+    route : str, optional
+        only read profiles of this route (default of every route)
+
+    Returns
+    -------
+    list
+        the profile records
+    '''
+    profiles = []
+
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        with open(path, 'r') as profile_file:
+            profile = json.load(profile_file)
+
+        if route is None or profile["route"] == route:
+            profiles.append(profile)
+
+    return profiles
+
+def is_program_frame(frame):
+    ''' checks whether a collapsed stack frame is in one of this program's files, which are named without a directory '''
+    return "/" not in frame[frame.rfind(" (") + 2:]
+
+def summarize_profiles(profiles, top=20):
+    ''' aggregates the hottest functions across profiles
+
+    a function's self samples are the samples it was running in, its total samples the samples it was on the stack in.
+    each sample is also charged to the innermost function of this program on its stack, so time spent waiting
+    in a library (a socket read, a Jinja render) shows up at the program function that started it.
+
+    Parameters
+    ----------
+    profiles : list
+        the profile records
+    top : int, optional
+        the number of functions kept (default of 20)
+
+    Returns
+    -------
+    dict
+        the profile, sample and route counts, and the top functions by self, innermost program and total samples
+    '''
+    self_samples, program_samples, total_samples, stacks = Counter(), Counter(), Counter(), Counter()
+
+    for profile in profiles:
+        for stack, count in profile["stacks"].items():
+            frames = stack.split(";")
+            program_frames = [frame for frame in frames if is_program_frame(frame)]
+            stacks[stack] += count
+            self_samples[frames[-1]] += count
+
+            if program_frames:
+                program_samples[program_frames[-1]] += count
+
+            for function in set(program_frames): # recursion counts once
+                total_samples[function] += count
+
+    samples = sum(stacks.values())
+    durations = sorted(profile["duration_ms"] for profile in profiles)
+
+    return {
+        "profiles": len(profiles),
+        "samples": samples,
+        "routes": dict(Counter(profile["route"] for profile in profiles)),
+        "median_duration_ms": durations[len(durations) // 2] if durations else 0,
+        "self": [(function, count, round(100 * count / samples, 1)) for function, count in self_samples.most_common(top)],
+        "program": [(function, count, round(100 * count / samples, 1)) for function, count in program_samples.most_common(top)],
+        "total": [(function, count, round(100 * count / samples, 1)) for function, count in total_samples.most_common(top)],
+        "stacks": stacks
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize the request profiles written with PROFILE_SAMPLE_RATE or PROFILE_HEADER.")
+    parser.add_argument("directory", nargs="?", default=PROFILE_DIR, help=f"profile directory (default: {PROFILE_DIR})")
+    parser.add_argument("--route", help="only summarize this route, e.g. /search")
+    parser.add_argument("--top", type=int, default=20, help="functions to list (default: 20)")
+    parser.add_argument("--collapsed", help="also write the merged stacks to this file, for flamegraph.pl or speedscope")
+    args = parser.parse_args()
+
+    summary = summarize_profiles(load_profiles(args.directory, args.route), args.top)
+
+    if not summary["profiles"]:
+        raise SystemExit(f"No profiles in {args.directory}")
+
+    print(f"{summary['profiles']} profiles, {summary['samples']} samples, median {summary['median_duration_ms']} ms, routes {summary['routes']}")
+
+    for title, rows in (("Self (running)", summary["self"]), ("Innermost program function", summary["program"]),
+                        ("Total (program functions on the stack)", summary["total"])):
+        print(f"\n{title}:")
+        for function, count, percent in rows:
+            print(f"  {percent:5.1f}%  {count:7d}  {function}")
+
+    if args.collapsed:
+        with open(args.collapsed, 'w') as collapsed_file:
+            collapsed_file.writelines(f"{stack} {count}\n" for stack, count in summary["stacks"].most_common())
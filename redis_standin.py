@@ -0,0 +1,227 @@
+#########################################
+##### Name: Tara Dorje              #####
+##### Uniqname: tydorje             #####
+#########################################
+
+import argparse
+import socketserver
+import threading
+from collections import Counter
+
+# a local stand-in for a Redis server, speaking just enough of the protocol for RedisBackend:
+# strings, hashes, sorted sets, MULTI/EXEC and WATCH. everything lives in memory and one lock
+# serializes every command, so it is only meant for development and cache_conformance.py.
+
+class Database:
+    ''' the keyspace of the stand-in server, shared by every connection '''
+
+    def __init__(self):
+        self.values = {} # key -> str (string), dict (hash) or ("zset", dict of member -> score) (sorted set)
+        self.versions = Counter() # key -> writes, for WATCH
+        self.lock = threading.Lock()
+
+    def touched(self, *keys):
+        ''' marks keys as written, so transactions watching them abort '''
+        for key in keys:
+            self.versions[key] += 1
+
+    def hash(self, key):
+        ''' gets the fields of a hash, creating it if missing '''
+        return self.values.setdefault(key, {})
+
+    def zset(self, key):
+        ''' gets the member scores of a sorted set, creating it if missing '''
+        return self.values.setdefault(key, ("zset", {}))[1]
+
+    def run(self, command, arguments):
+        ''' runs one data command, the caller holds the lock
+
+        Parameters
+        ----------
+        command : str
+            the upper-case command name
+        arguments : list
+            the command arguments
+
+        Returns
+        -------
+        object
+            the reply
+        '''
+        if command == "PING":
+            return "PONG"
+        if command == "SELECT": # a single database
+            return "OK"
+        if command == "GET":
+            value = self.values.get(arguments[0])
+            return value if isinstance(value, str) else None
+        if command == "SET":
+            key, value = arguments[0], arguments[1]
+            if "NX" in (option.upper() for option in arguments[2:]) and key in self.values: # if it must not exist yet,
+                return None
+            self.values[key] = value
+            self.touched(key)
+            return "OK"
+        if command == "DEL":
+            deleted = [key for key in arguments if self.values.pop(key, None) is not None]
+            self.touched(*deleted)
+            return len(deleted)
+        if command == "EXISTS":
+            return sum(1 for key in arguments if key in self.values)
+        if command == "HSET":
+            fields = self.hash(arguments[0])
+            pairs = list(zip(arguments[1::2], arguments[2::2]))
+            added = sum(1 for field, _ in pairs if field not in fields)
+            fields.update(pairs)
+            self.touched(arguments[0])
+            return added
+        if command == "HMGET":
+            fields = self.values.get(arguments[0]) or {}
+            return [fields.get(field) for field in arguments[1:]]
+        if command == "HGETALL":
+            fields = self.values.get(arguments[0]) or {}
+            return [item for pair in fields.items() for item in pair]
+        if command == "ZADD":
+            members = self.zset(arguments[0])
+            pairs = list(zip(arguments[1::2], arguments[2::2]))
+            added = sum(1 for _, member in pairs if member not in members)
+            members.update((member, float(score)) for score, member in pairs)
+            self.touched(arguments[0])
+            return added
+        if command == "ZREM":
+            members = self.zset(arguments[0])
+            removed = [member for member in arguments[1:] if members.pop(member, None) is not None]
+            self.touched(arguments[0])
+            return len(removed)
+        if command == "ZCARD":
+            value = self.values.get(arguments[0])
+            return len(value[1]) if value else 0
+        if command == "ZRANGE":
+            value = self.values.get(arguments[0])
+            ordered = sorted(value[1], key=lambda member: (value[1][member], member)) if value else []
+            start, stop = int(arguments[1]), int(arguments[2])
+            stop = len(ordered) + stop if stop < 0 else stop # negative indexes count from the end
+            return ordered[start:stop + 1]
+        if command == "FLUSHDB":
+            self.touched(*self.values)
+            self.values.clear()
+            return "OK"
+
+        return Exception(f"ERR unknown command '{command}'")
+
+class Handler(socketserver.StreamRequestHandler):
+    ''' serves one client connection, with its own transaction and watch state '''
+
+    def read_command(self):
+        ''' reads one RESP array of bulk strings, or None when the client disconnects '''
+        line = self.rfile.readline()
+
+        if not line:
+            return None
+
+        parts = []
+
+        for _ in range(int(line[1:-2])):
+            length = int(self.rfile.readline()[1:-2])
+            parts.append(self.rfile.read(length + 2)[:-2].decode())
+
+        return parts
+
+    def encode(self, reply):
+        ''' encodes a reply in RESP '''
+        if reply is None:
+            return b"$-1\r\n"
+        if isinstance(reply, Exception):
+            return f"-{reply}\r\n".encode()
+        if isinstance(reply, int):
+            return f":{reply}\r\n".encode()
+        if isinstance(reply, list):
+            return f"*{len(reply)}\r\n".encode() + b"".join(self.encode(item) for item in reply)
+        if reply in ("OK", "QUEUED", "PONG"):
+            return f"+{reply}\r\n".encode()
+
+        data = reply.encode()
+        return f"${len(data)}\r\n".encode() + data + b"\r\n"
+
+    def handle(self):
+        ''' reads commands until the client disconnects, queueing them between MULTI and EXEC '''
+        database = self.server.database
+        queued = None # commands queued since MULTI
+        watched = {} # key -> version when watched
+
+        while True:
+            parts = self.read_command()
+
+            if parts is None:
+                return
+
+            command, arguments = parts[0].upper(), parts[1:]
+
+            with database.lock:
+                if command == "MULTI":
+                    queued, reply = [], "OK"
+                elif command == "DISCARD":
+                    queued, watched, reply = None, {}, "OK"
+                elif command == "WATCH":
+                    watched.update((key, database.versions[key]) for key in arguments)
+                    reply = "OK"
+                elif command == "UNWATCH":
+                    watched, reply = {}, "OK"
+                elif command == "EXEC":
+                    if any(database.versions[key] != version for key, version in watched.items()): # if a watched key changed,
+                        reply = None # abort the transaction
+                    else:
+                        reply = [database.run(name, queued_arguments) for name, queued_arguments in queued or []]
+                    queued, watched = None, {}
+                elif queued is not None: # inside MULTI
+                    queued.append((command, arguments))
+                    reply = "QUEUED"
+                else:
+                    reply = database.run(command, arguments)
+
+            self.wfile.write(self.encode(reply))
+
+class StandinServer(socketserver.ThreadingTCPServer):
+    ''' a threaded TCP server holding one in-memory Database
+
+    Parameters
+    ----------
+    address : tuple
+        the (host, port) to listen on, port 0 picks a free port
+    '''
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, Handler)
+        self.database = Database()
+
+def start_standin(port=0):
+    ''' starts a stand-in server on a background thread
+
+    Parameters
+    ----------
+    port : int, optional
+        the port to listen on (default of 0, any free port)
+
+    Returns
+    -------
+    StandinServer
+        the running server, its address is server.server_address
+    '''
+    server = StandinServer(("127.0.0.1", port))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local in-memory stand-in for a Redis server, for CACHE_BACKEND=redis://.")
+    parser.add_argument("--port", type=int, default=6379, help="port to listen on (default: 6379)")
+    args = parser.parse_args()
+
+    server = StandinServer(("127.0.0.1", args.port))
+    print(f"Redis-protocol stand-in listening on redis://127.0.0.1:{args.port}/0")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
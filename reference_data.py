@@ -0,0 +1,221 @@
+#########################################
+##### Name: Tara Dorje              #####
+##### Uniqname: tydorje             #####
+#########################################
+
+import json
+import logging
+import os
+import threading
+import time
+
+from file_lock import atomic_write_json
+from upstream import BACKGROUND, upstream_priority
+
+REFERENCE_SNAPSHOT = "reference_data.json" # last successfully loaded lists, used when TMDb is unreachable at startup
+REFERENCE_TTL = int(os.environ.get("REFERENCE_DATA_TTL", 24 * 60 * 60)) # seconds between background refreshes
+REFERENCE_RETRY = 5 * 60 # seconds to wait before retrying a failed refresh
+RELOAD_INTERVAL = 30 # seconds between load attempts made by lookups while the tables are empty, shared by every lookup
+
+logger = logging.getLogger(__name__)
+
+class ReferenceRegistry:
+    ''' an in-memory registry of TMDb reference lists (watch providers, genres, languages)
+
+    each list is kept as a name -> ID dictionary, so lookups are O(1) and never hit the network.
+    the lists are loaded once, saved to a snapshot file for offline starts, and refreshed in a background thread.
+
+    Parameters
+    ----------
+    loaders : dict
+        maps each table name to a function that fetches that list from TMDb as a name -> ID dictionary
+    snapshot_path : str
+        the path of the JSON snapshot file
+    ttl : int
+        the number of seconds between background refreshes
+    '''
+
+    def __init__(self, loaders, snapshot_path=REFERENCE_SNAPSHOT, ttl=REFERENCE_TTL):
+        self.loaders = loaders
+        self.snapshot_path = snapshot_path
+        self.ttl = ttl
+        self.tables = {}
+        self.loaded_at = None
+        self._attempted_at = None # time.monotonic() of the last load attempt
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock() # held while the lists are fetched
+        self._refresh_thread = None
+
+    def refresh(self):
+        ''' fetches every list from TMDb, swaps it in and saves a snapshot
+
+        Parameters
+        ----------
+        none
+
+        Returns
+        -------
+        bool
+            True if every list was fetched, otherwise False (the previous tables are kept)
+        '''
+        try:
+            with self._refresh_lock:
+                tables = {name: loader() for name, loader in self.loaders.items()}
+        except Exception:
+            logger.exception("could not refresh TMDb reference data")
+            return False
+
+        with self._lock:
+            self.tables = tables # swap in the new dictionaries in one step
+            self.loaded_at = time.time()
+
+        self._save_snapshot()
+        return True
+
+    def load(self):
+        ''' loads the lists from TMDb, falling back to the snapshot file when TMDb is unreachable
+
+        Parameters
+        ----------
+        none
+
+        Returns
+        -------
+        none
+        '''
+        with self._lock:
+            self._attempted_at = time.monotonic()
+
+        if not self.refresh(): # if TMDb is unreachable,
+            self._load_snapshot() # start from the last saved lists
+
+    def start(self, wait=True):
+        ''' loads the lists and starts the background refresh thread, once
+
+        Parameters
+        ----------
+        wait : bool, optional
+            True to fetch the lists before returning, False to start from the snapshot and fetch them
+            on the refresh thread, so a server starts without waiting on TMDb (default of True)
+
+        Returns
+        -------
+        none
+        '''
+        with self._lock:
+            if self._refresh_thread is not None: # already started
+                return
+            self._refresh_thread = threading.Thread(target=self._refresh_loop, args=(not wait,), name="reference-data", daemon=True)
+
+        if wait:
+            self.load()
+        else:
+            with self._lock:
+                self._attempted_at = time.monotonic() # lookups leave the first fetch to the refresh thread
+            self._load_snapshot()
+
+        self._refresh_thread.start()
+
+    def lookup(self, table, name):
+        ''' gets the TMDb ID for a display name
+
+        Parameters
+        ----------
+        table : str
+            the table name, e.g. "providers"
+        name : str
+            the display name, e.g. "Netflix"
+
+        Returns
+        -------
+        int or str or None
+            the TMDb ID, or None if the name is unknown
+        '''
+        if not self.tables: # if never loaded,
+            if self._claim_reload(): # try again, at most every RELOAD_INTERVAL
+                self.load()
+            else:
+                with self._refresh_lock: # or wait for a fetch already under way, without starting another
+                    pass
+
+        return self.tables.get(table, {}).get(name)
+
+    def _claim_reload(self):
+        ''' decides whether a lookup should load the empty tables, so a TMDb outage costs one attempt per RELOAD_INTERVAL
+
+        Parameters
+        ----------
+        none
+
+        Returns
+        -------
+        bool
+            True if this lookup should make the load attempt
+        '''
+        with self._lock:
+            if self._attempted_at is not None and time.monotonic() - self._attempted_at < RELOAD_INTERVAL: # tried recently
+                return False
+            self._attempted_at = time.monotonic()
+            return True
+
+    def _refresh_loop(self, refresh_now=False):
+        ''' refreshes the lists every ttl seconds, retrying sooner after a failure
+
+        Parameters
+        ----------
+        refresh_now : bool, optional
+            True to fetch the lists right away, when start didn't wait for them (default of False)
+
+        Returns
+        -------
+        none
+        '''
+        delay = 0 if refresh_now else self.ttl if self.loaded_at else REFERENCE_RETRY
+
+        while True:
+            time.sleep(delay)
+
+            with upstream_priority(BACKGROUND): # never delay a user's search
+                delay = self.ttl if self.refresh() else REFERENCE_RETRY
+
+    def _save_snapshot(self):
+        ''' writes the current lists to the snapshot file
+
+        the file is written to a temporary path and renamed, so readers in any process never see a partial snapshot.
+
+        Parameters
+        ----------
+        none
+
+        Returns
+        -------
+        none
+        '''
+        snapshot = {"loaded_at": self.loaded_at, "tables": self.tables}
+
+        try:
+            atomic_write_json(self.snapshot_path, snapshot)
+        except OSError:
+            logger.exception("could not save TMDb reference data snapshot")
+
+    def _load_snapshot(self):
+        ''' loads the lists from the snapshot file, if there is one
+
+        Parameters
+        ----------
+        none
+
+        Returns
+        -------
+        none
+        '''
+        try:
+            with open(self.snapshot_path, 'r') as snapshot_file:
+                snapshot = json.load(snapshot_file)
+        except (OSError, ValueError):
+            logger.warning("no usable TMDb reference data snapshot at %s", self.snapshot_path)
+            return
+
+        with self._lock:
+            self.tables = snapshot["tables"]
+            self.loaded_at = snapshot["loaded_at"]
@@ -0,0 +1,183 @@
+#########################################
+##### Name: Tara Dorje              #####
+##### Uniqname: tydorje             #####
+#########################################
+
+import hashlib
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+
+RESULTS_CACHE_TTL = int(os.environ.get("RESULTS_CACHE_TTL", 10 * 60)) # seconds a rendered results page is reused, bounds staleness from other processes' writes
+RESULTS_CACHE_SIZE = int(os.environ.get("RESULTS_CACHE_SIZE", 1000)) # rendered results pages kept, least recently used evicted first
+
+class RenderedPage:
+    ''' a rendered results page and the cache entries it was built from
+
+    Attributes
+    ----------
+    html : str
+        the rendered page
+    etag : str
+        a hash of the page, for conditional GET requests
+    dependencies : frozenset
+        the (namespace, key) cache entries the page was rendered from
+    expires_at : float
+        the time the page must be rendered again
+    tmdb_ids : tuple
+        the TMDb IDs of the results shown, in page order
+    '''
+    __slots__ = ("html", "etag", "dependencies", "expires_at", "tmdb_ids")
+
+    def __init__(self, html, dependencies, ttl, tmdb_ids=()):
+        self.html = html
+        self.etag = hashlib.sha1(html.encode()).hexdigest()[:20]
+        self.dependencies = frozenset(dependencies)
+        self.expires_at = time.time() + ttl
+        self.tmdb_ids = tuple(tmdb_ids)
+
+class RenderedPageCache:
+    ''' an in-process cache of rendered results pages keyed by normalized search criteria
+
+    every page remembers the Discover lists and movie entries it was rendered from. the cache store
+    calls invalidate on every write, which drops the pages built from the written entry, so a warm
+    search is a single dictionary lookup. writes made by other processes are only picked up once
+    the page's ttl runs out.
+
+    Parameters
+    ----------
+    ttl : float, optional
+        the seconds a page is reused (default of RESULTS_CACHE_TTL)
+    size : int, optional
+        the maximum number of pages kept (default of RESULTS_CACHE_SIZE)
+    '''
+
+    def __init__(self, ttl=RESULTS_CACHE_TTL, size=RESULTS_CACHE_SIZE):
+        self.ttl = ttl
+        self.size = size
+        self.stats = Counter()
+        self._pages = OrderedDict() # criteria key -> RenderedPage, least recently used first
+        self._dependents = {} # (namespace, key) -> criteria keys of the pages built from it
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        ''' gets a fresh rendered page and marks it as most recently used
+
+        Parameters
+        ----------
+        key : tuple
+            the normalized search criteria
+
+        Returns
+        -------
+        RenderedPage or None
+            the page, or None if it is missing, expired or invalidated
+        '''
+        with self._lock:
+            page = self._pages.get(key)
+
+            if page is None or page.expires_at <= time.time(): # if missing or expired,
+                if page is not None:
+                    self._remove(key)
+                self.stats["misses"] += 1
+                return None
+
+            self._pages.move_to_end(key)
+            self.stats["hits"] += 1
+            return page
+
+    def put(self, key, html, dependencies, tmdb_ids=()):
+        ''' stores a rendered page, evicting the least recently used pages over the size limit
+
+        Parameters
+        ----------
+        key : tuple
+            the normalized search criteria
+        html : str
+            the rendered page
+        dependencies : iterable of tuple
+            the (namespace, key) cache entries the page was rendered from
+        tmdb_ids : iterable of int, optional
+            the TMDb IDs of the results shown (default of none)
+
+        Returns
+        -------
+        RenderedPage
+            the stored page
+        '''
+        page = RenderedPage(html, dependencies, self.ttl, tmdb_ids)
+
+        with self._lock:
+            self._remove(key)
+            self._pages[key] = page
+
+            for dependency in page.dependencies:
+                self._dependents.setdefault(dependency, set()).add(key)
+
+            while len(self._pages) > self.size: # if over the limit,
+                self._remove(next(iter(self._pages))) # drop the least recently used page
+                self.stats["evictions"] += 1
+
+        return page
+
+    def invalidate(self, namespace, key):
+        ''' drops every page rendered from a cache entry that was just written
+
+        Parameters
+        ----------
+        namespace : str
+            the cache namespace of the written entry
+        key : str
+            the entry key
+
+        Returns
+        -------
+        none
+        '''
+        if (namespace, key) not in self._dependents: # cheap check first, most writes affect no page
+            return
+
+        with self._lock:
+            for page_key in list(self._dependents.get((namespace, key), ())):
+                self._remove(page_key)
+                self.stats["invalidations"] += 1
+
+    def cache_stats(self):
+        ''' gets the page count and hit, miss, eviction and invalidation counters
+
+        Parameters
+        ----------
+        none
+
+        Returns
+        -------
+        dict
+            the counters
+        '''
+        with self._lock:
+            return {"pages": len(self._pages), **self.stats}
+
+    def _remove(self, key):
+        ''' removes a page and its dependency links, the caller holds the lock
+
+        Parameters
+        ----------
+        key : tuple
+            the normalized search criteria
+
+        Returns
+        -------
+        none
+        '''
+        page = self._pages.pop(key, None)
+
+        if page is None: # not cached
+            return
+
+        for dependency in page.dependencies:
+            dependents = self._dependents.get(dependency)
+            if dependents is not None:
+                dependents.discard(key)
+                if not dependents:
+                    del self._dependents[dependency]
@@ -0,0 +1,189 @@
+#########################################
+##### Name: Tara Dorje              #####
+##### Uniqname: tydorje             #####
+#########################################
+
+import asyncio
+import threading
+from collections import Counter
+
+from metrics import registry
+
+_groups = {} # name -> SingleFlight, for coalescing_stats
+
+class _Call:
+    ''' one in-flight call that later callers for the same key wait on '''
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    ''' deduplicates concurrent calls for the same key
+
+    the first caller for a key runs the function; callers arriving while it runs wait for it and share
+    its result (or its exception) instead of repeating the work. the key is forgotten as soon as the call
+    returns, so results are never cached here, only shared between overlapping callers.
+
+    Parameters
+    ----------
+    name : str
+        the group name shown by coalescing_stats
+    '''
+
+    def __init__(self, name):
+        self.name = name
+        self.stats = Counter()
+        self._calls = {}
+        self._lock = threading.Lock()
+        _groups[name] = self
+
+    def do(self, key, function, *args, **kwargs):
+        ''' runs a function once for all concurrent callers with the same key
+
+        Parameters
+        ----------
+        key : hashable
+            identifies identical calls
+        function : function
+            the call to make
+        *args, **kwargs
+            the function's arguments
+
+        Returns
+        -------
+        object
+            the function's result, shared by every coalesced caller
+        '''
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+
+            if leader: # if no identical call is running, this caller makes it
+                call = self._calls[key] = _Call()
+                self.stats["calls"] += 1
+            else:
+                self.stats["coalesced"] += 1
+
+        if not leader: # wait for the running call and share its outcome
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function(*args, **kwargs)
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result
+
+class AsyncSingleFlight(SingleFlight):
+    ''' deduplicates concurrent coroutine calls for the same key on one event loop
+
+    the first caller for a key starts the coroutine function as a task of its own, and every caller (the
+    first included) awaits that task. a caller that is cancelled, e.g. because its client went away,
+    stops waiting without cancelling the task, so the other callers still get its result (or its exception).
+
+    Parameters
+    ----------
+    name : str
+        the group name shown by coalescing_stats
+    '''
+
+    async def do(self, key, function, *args, **kwargs):
+        ''' awaits a coroutine function once for all concurrent callers with the same key
+
+        Parameters
+        ----------
+        key : hashable
+            identifies identical calls
+        function : coroutine function
+            the call to make
+        *args, **kwargs
+            the function's arguments
+
+        Returns
+        -------
+        object
+            the function's result, shared by every coalesced caller
+        '''
+        with self._lock:
+            task = self._calls.get(key)
+
+            if task is None: # if no identical call is running, start it detached from this caller
+                task = self._calls[key] = asyncio.ensure_future(function(*args, **kwargs))
+                task.add_done_callback(lambda done: self._forget(key, done))
+                self.stats["calls"] += 1
+            else:
+                self.stats["coalesced"] += 1
+
+        return await asyncio.shield(task) # a cancelled caller doesn't cancel the shared call
+
+    def _forget(self, key, task):
+        ''' forgets a finished call, so the next caller for its key starts a new one
+
+        Parameters
+        ----------
+        key : hashable
+            identifies identical calls
+        task : asyncio.Task
+            the finished call
+
+        Returns
+        -------
+        none
+        '''
+        with self._lock:
+            if self._calls.get(key) is task:
+                del self._calls[key]
+
+        if not task.cancelled():
+            task.exception() # mark it retrieved, in case every caller stopped waiting
+
+def coalescing_stats():
+    ''' gets how many calls every single-flight group made and how many it coalesced
+
+    Parameters
+    ----------
+    none
+
+    Returns
+    -------
+    dict
+        maps each group name to its "calls", "coalesced" and "in_flight" counters
+    '''
+    stats = {}
+
+    for name, group in _groups.items():
+        with group._lock:
+            stats[name] = {"calls": group.stats["calls"], "coalesced": group.stats["coalesced"], "in_flight": len(group._calls)}
+
+    return stats
+
+def coalescing_metrics():
+    ''' gets the single-flight counters as metric families, at scrape time
+
+    Parameters
+    ----------
+    none
+
+    Returns
+    -------
+    list
+        (name, kind, documentation, samples) families
+    '''
+    stats = coalescing_stats()
+    return [
+        ("single_flight_calls_total", "counter", "Calls made by each single-flight group.", [({"group": name}, group["calls"]) for name, group in stats.items()]),
+        ("single_flight_coalesced_total", "counter", "Callers that shared a running call instead of making their own.", [({"group": name}, group["coalesced"]) for name, group in stats.items()]),
+        ("single_flight_in_flight", "gauge", "Calls running now.", [({"group": name}, group["in_flight"]) for name, group in stats.items()])
+    ]
+
+registry.add_collector(coalescing_metrics)
@@ -0,0 +1,127 @@
+#########################################
+##### Name: Tara Dorje              #####
+##### Uniqname: tydorje             #####
+#########################################
+
+import logging
+import os
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import registry
+from upstream import BACKGROUND, upstream_priority
+
+REFRESH_WORKERS = int(os.environ.get("REFRESH_WORKERS", 2)) # concurrent background refreshes of stale entries
+
+logger = logging.getLogger(__name__)
+
+# stale-while-revalidate: a cache entry past its soft expiry is served at once, and refreshed here on a background
+# thread at BACKGROUND priority, so the next request gets a fresh entry without anyone waiting on the upstream API.
+
+class BackgroundRefresher:
+    ''' runs refreshes of stale cache entries on background threads, one at a time per entry
+
+    Parameters
+    ----------
+    workers : int, optional
+        the number of refresh threads (default of REFRESH_WORKERS)
+    '''
+
+    def __init__(self, workers=REFRESH_WORKERS):
+        self.stats = Counter()
+        self._pending = set() # keys queued or refreshing
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="refresh")
+
+    def refresh(self, key, function, *args):
+        ''' queues a refresh, unless one for the same key is already queued or running
+
+        Parameters
+        ----------
+        key : hashable
+            identifies the refreshed entry, e.g. ("discover", cache key)
+        function : callable
+            fetches the entry and writes it to the cache
+        *args
+            the function's arguments
+
+        Returns
+        -------
+        none
+        '''
+        with self._lock:
+            if key in self._pending: # the entry is already being refreshed
+                self.stats["coalesced"] += 1
+                return
+
+            self._pending.add(key)
+            self.stats["queued"] += 1
+
+        self._executor.submit(self._run, key, function, *args)
+
+    def _run(self, key, function, *args):
+        ''' runs one refresh on a background thread
+
+        Parameters
+        ----------
+        key : hashable
+            identifies the refreshed entry
+        function : callable
+            fetches the entry and writes it to the cache
+        *args
+            the function's arguments
+
+        Returns
+        -------
+        none
+        '''
+        outcome = "refreshed"
+
+        try:
+            with upstream_priority(BACKGROUND): # requests a user is waiting on go first
+                function(*args)
+        except Exception as error: # the stale entry stays servable until its hard expiry
+            outcome = "failed"
+            logger.warning("could not refresh %s (%s)", key, error)
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+                self.stats[outcome] += 1
+
+    def refresh_stats(self):
+        ''' gets the refresh counters
+
+        Parameters
+        ----------
+        none
+
+        Returns
+        -------
+        dict
+            the "queued", "coalesced", "refreshed" and "failed" counters and the refreshes "pending"
+        '''
+        with self._lock:
+            return {"pending": len(self._pending), **self.stats}
+
+def refresh_metrics(stats):
+    ''' gets the background refresh counters as metric families, at scrape time
+
+    Parameters
+    ----------
+    stats : dict
+        the BackgroundRefresher.refresh_stats() counters
+
+    Returns
+    -------
+    list
+        (name, kind, documentation, samples) families
+    '''
+    return [
+        ("stale_refresh_total", "counter", "Background refreshes of stale cache entries by outcome.",
+         [({"outcome": outcome}, stats.get(outcome, 0)) for outcome in ("queued", "coalesced", "refreshed", "failed")]),
+        ("stale_refresh_pending", "gauge", "Background refreshes queued or running.", [({}, stats["pending"])])
+    ]
+
+stale_refresher = BackgroundRefresher() # shared by the blocking and async clients
+registry.add_collector(lambda: refresh_metrics(stale_refresher.refresh_stats()))
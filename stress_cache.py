@@ -0,0 +1,125 @@
+#########################################
+##### Name: Tara Dorje              #####
+##### Uniqname: tydorje             #####
+#########################################
+
+import argparse
+import json
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+
+import cache_store
+
+def worker(number, db_path, export_path, updates, movies):
+    ''' hammers a shared cache from one process: merge-on-write link updates, Discover writes, reads and exports
+
+    Parameters
+    ----------
+    number : int
+        the worker number, which names the streaming service it writes
+    db_path : str
+        the path of the shared cache database
+    export_path : str
+        the path of the shared cache.json export
+    updates : int
+        the number of update rounds
+    movies : int
+        the number of movies the workers share
+
+    Returns
+    -------
+    int
+        the number of failed operations
+    '''
+    cache_store.CACHE_DB, cache_store.CACHE_FILE = db_path, export_path # before the store is opened in this process
+    failures = 0
+
+    for update in range(updates):
+        tmdb_id = update % movies
+
+        try:
+            cache_store.update_cache_with_streaming_link(tmdb_id, f"service{number}", f"https://example.com/{number}/{update}")
+            cache_store.update_cache(f"discover{update % 10}", [number, update])
+            cache_store.get_streaming_links_from_cache(tmdb_id)
+            cache_store.get_discover_from_cache(f"discover{update % 10}")
+
+            if update % 50 == 0: # exports are slow, do a few
+                cache_store.export_cache(export_path)
+        except Exception as error:
+            failures += 1
+            print(f"worker {number}: {error!r}")
+
+    return failures
+
+def stress(processes, updates, movies, directory):
+    ''' runs the workers at once, then checks that no update was lost and both the database and export are intact
+
+    Parameters
+    ----------
+    processes : int
+        the number of worker processes
+    updates : int
+        the number of update rounds per worker
+    movies : int
+        the number of movies the workers share
+    directory : str
+        where the database and export are created
+
+    Returns
+    -------
+    dict
+        the operation, failure and lost-update counts, and whether the database and export are intact
+    '''
+    db_path = os.path.join(directory, "stress.db")
+    export_path = os.path.join(directory, "stress.json")
+    context = multiprocessing.get_context("spawn") # a fresh interpreter per worker, like separate gunicorn workers
+    started = time.monotonic()
+
+    with context.Pool(processes) as pool:
+        failures = pool.starmap(worker, [(number, db_path, export_path, updates, movies) for number in range(processes)])
+
+    elapsed = time.monotonic() - started
+    store = cache_store.CacheStore(db_path)
+    lost = 0
+
+    for tmdb_id in range(movies):
+        links = store.get("streaming_link", tmdb_id) or {}
+        lost += sum(1 for number in range(processes) if f"service{number}" not in links) # every worker wrote every movie
+
+    with open(export_path, 'r') as export_file:
+        exported = json.load(export_file) # raises if a reader ever saw a partial file
+
+    connection = sqlite3.connect(db_path)
+    integrity = connection.execute("PRAGMA integrity_check").fetchone()[0]
+    connection.close()
+
+    return {
+        "operations": processes * updates * 4,
+        "seconds": round(elapsed, 2),
+        "failures": sum(failures),
+        "lost_updates": lost,
+        "exported_keys": len(exported),
+        "integrity": integrity
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run N processes updating one cache at once and check for lost or torn writes.")
+    parser.add_argument("--processes", type=int, default=8, help="concurrent worker processes (default: 8)")
+    parser.add_argument("--updates", type=int, default=200, help="update rounds per process (default: 200)")
+    parser.add_argument("--movies", type=int, default=20, help="movies shared by the workers (default: 20)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        report = stress(args.processes, args.updates, args.movies, directory)
+
+    print(f"Operations: {report['operations']} in {report['seconds']}s ({report['operations'] / max(report['seconds'], 0.01):,.0f}/s)")
+    print(f"Failures: {report['failures']}")
+    print(f"Lost updates: {report['lost_updates']}")
+    print(f"Exported keys: {report['exported_keys']}")
+    print(f"Database integrity: {report['integrity']}")
+
+    if report["failures"] or report["lost_updates"] or report["integrity"] != "ok":
+        raise SystemExit(1)
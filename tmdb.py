@@ -0,0 +1,1085 @@
+#########################################
+##### Name: Tara Dorje              #####
+##### Uniqname: tydorje             #####
+#########################################
+
+import logging
+import time
+
+from requests import RequestException
+
+from cache_store import (NAMESPACE_TTLS, get_discover_from_cache, update_cache, get_stale_discover_from_cache, extend_discover_in_cache,
+                         get_movie_details_from_cache, get_directors_from_cache, update_cache_with_movie_details, update_cache_with_directors,
+                         get_stale_movie_from_cache, extend_movie_in_cache, update_cache_with_availability, get_availability_from_cache,
+                         get_streaming_links_from_cache, get_servable_discover_from_cache, get_servable_movie_from_cache,
+                         get_servable_availability_from_cache)
+from catalog import catalog, local_discover
+from metrics import timed
+from movie_record import project_movie
+from reference_data import ReferenceRegistry
+from single_flight import SingleFlight
+from stale_refresh import stale_refresher
+from upstream import upstream_get, response_validators, conditional_headers, freshness_lifetime, circuit_open
+
+TMDb_key = "INSERT"
+StreamingAvailability_key = "INSERT"
+
+SERVICES = ["Netflix", "Prime", "Disney", "HBO Max", "Hulu", "Peacock", "Paramount", "Starz", "Showtime", "Apple TV", "MUBI"] # streaming service choices
+GENRES = ["Adventure","Fantasy","Animation","Drama","Horror","Action","Comedy","History","Western","Thriller","Crime","Documentary","Science Fiction","Mystery","Music","Romance","Family","War"] # genre choices
+LANGUAGES = ["English", "French", "German", "Spanish", "Hindi", "Mandarin", "Japanese", "Korean"] # language choices
+DURATION_RUNTIMES = { # duration choices and their runtime ranges in minutes
+    "Short (< 89 min)": (0, 89),
+    "Medium (90–120 min)": (90, 120),
+    "Long (> 120 min)": (121, 10000)
+}
+
+AVAILABILITY_NEGATIVE_TTL = 6 * 60 * 60 # seconds to remember that a movie has no US streaming options
+DISCOVER_PAGE_SIZE = 20 # results per TMDb Discover Movie page
+DISCOVER_MAX_PAGE = 500 # TMDb doesn't serve pages past 500
+TMDB_HOST = "api.themoviedb.org"
+STREAMING_AVAILABILITY_HOST = "streaming-availability.p.rapidapi.com"
+
+logger = logging.getLogger(__name__)
+
+discover_flights = SingleFlight("discover") # concurrent misses for the same cache key share one fetch
+movie_flights = SingleFlight("movie_details")
+availability_flights = SingleFlight("availability")
+
+##################CACHE##################
+
+@timed
+def tmdb_discover_movie_cached(cache_key, service, genre, original_language, runtime_gte, runtime_lte, page=1):
+    ''' either retrieves data from the cache or makes a request to the TMDb Discover Movie endpoint, updates the cache, and returns the retrieved data
+
+    Parameters
+    ----------
+    cache_key : str
+        the cache key used to identify the cached data
+    service : str
+        the TMDb ID for the movie's streaming service
+    genre : str
+        the TMDb ID for the movie's genre
+    original_language : str
+        the TMDb for the movie's original language
+    runtime_gte : int
+        the minimum runtime of the movie
+    runtime_lte : int
+        the maximum runtime of the movie
+    page : int, optional
+        the Discover Movie results page (default of 1), cached under the cache key plus the page number
+    
+    Returns
+    -------
+    dict
+        the cached data, if available. otherwise, the retrieved data from the TMDb Discover Movie endpoint
+    '''
+    page_key = cache_key if page == 1 else f"{cache_key}_page{page}" # page 1 keeps the original cache key
+    cached_data = cached_discover_page(page_key, service, genre, original_language, runtime_gte, runtime_lte, page)
+
+    if cached_data is not None: # if data is found in cache, fresh or still servable,
+        return cached_data # return the cached data
+
+    return discover_flights.do(page_key, _fetch_discover_page, page_key, service, genre, original_language, runtime_gte, runtime_lte, page)
+
+def cached_discover_page(page_key, service, genre, original_language, runtime_gte, runtime_lte, page):
+    ''' gets a Discover Movie list from the cache without waiting on TMDb, the fresh list or a stale one (see stale_discover_page)
+
+    Parameters
+    ----------
+    page_key : str
+        the cache key of the page
+    service : str
+        the TMDb ID for the movie's streaming service
+    genre : str
+        the TMDb ID for the movie's genre
+    original_language : str
+        the TMDb for the movie's original language
+    runtime_gte : int
+        the minimum runtime of the movie
+    runtime_lte : int
+        the maximum runtime of the movie
+    page : int
+        the Discover Movie results page
+
+    Returns
+    -------
+    list or None
+        the list of TMDb IDs, or None if the page must be fetched
+    '''
+    cached_data = get_discover_from_cache(page_key) # get the cached data
+
+    if cached_data: # if data is found in cache,
+        return cached_data
+
+    return stale_discover_page(page_key, service, genre, original_language, runtime_gte, runtime_lte, page) # if an expired list may still be served, don't wait on TMDb
+
+def stale_discover_page(page_key, service, genre, original_language, runtime_gte, runtime_lte, page):
+    ''' gets an expired Discover Movie list that may be served at once, refreshing it in the background
+
+    a list is served until its hard expiry, or at any age while TMDb's circuit is open (and then not refreshed).
+
+    Parameters
+    ----------
+    page_key : str
+        the cache key of the page
+    service : str
+        the TMDb ID for the movie's streaming service
+    genre : str
+        the TMDb ID for the movie's genre
+    original_language : str
+        the TMDb for the movie's original language
+    runtime_gte : int
+        the minimum runtime of the movie
+    runtime_lte : int
+        the maximum runtime of the movie
+    page : int
+        the Discover Movie results page
+
+    Returns
+    -------
+    list or None
+        the stale list of TMDb IDs, or None if there is none to serve
+    '''
+    open_circuit = circuit_open(TMDB_HOST)
+    stale_data = get_servable_discover_from_cache(page_key, any_age=open_circuit)
+
+    if stale_data is not None and not open_circuit: # refresh it for the next request
+        stale_refresher.refresh(("discover", page_key), discover_flights.do, page_key, _fetch_discover_page,
+                                page_key, service, genre, original_language, runtime_gte, runtime_lte, page)
+
+    return stale_data
+
+def _fetch_discover_page(page_key, service, genre, original_language, runtime_gte, runtime_lte, page):
+    ''' makes a request to the TMDb Discover Movie endpoint and updates the cache, for one caller of tmdb_discover_movie_cached at a time
+
+    an expired list stored with validators is revalidated with a conditional request, and a 304 Not Modified
+    makes it fresh again without rewriting it. the response's Cache-Control max-age sets how long the list stays fresh.
+
+    Parameters
+    ----------
+    page_key : str
+        the cache key of the page
+    service : str
+        the TMDb ID for the movie's streaming service
+    genre : str
+        the TMDb ID for the movie's genre
+    original_language : str
+        the TMDb for the movie's original language
+    runtime_gte : int
+        the minimum runtime of the movie
+    runtime_lte : int
+        the maximum runtime of the movie
+    page : int
+        the Discover Movie results page
+
+    Returns
+    -------
+    list
+        a list of TMDb IDs for movies that match the criteria
+    '''
+    cached_data = get_discover_from_cache(page_key) # a call that just finished may have filled it
+
+    if cached_data:
+        return cached_data
+
+    stale_data, validators = get_stale_discover_from_cache(page_key) # an expired list can be revalidated instead of refetched
+    response = tmdb_discover_movie_response(service, genre, original_language, runtime_gte, runtime_lte, page=page, validators=validators) # if no fresh data found in cache, make a request to the TMDb Discover Movie endpoint
+
+    return store_discover_response(page_key, response, stale_data)
+
+def store_discover_response(page_key, response, stale_data=None):
+    ''' caches a TMDb Discover Movie response, or extends the stale list after a 304 Not Modified
+
+    Parameters
+    ----------
+    page_key : str
+        the cache key of the page
+    response : requests.Response or httpx.Response
+        the Discover Movie response
+    stale_data : list, optional
+        the expired list the request revalidated
+
+    Returns
+    -------
+    list
+        a list of TMDb IDs for movies that match the criteria
+    '''
+    if response.status_code == 304: # if the list hasn't changed,
+        extend_discover_in_cache(page_key, freshness_lifetime(response)) # keep the stored list
+        return stale_data
+
+    response.raise_for_status() # never cache or index an error body
+    data = [result["id"] for result in response.json().get("results", [])]
+    update_cache(page_key, data, freshness_lifetime(response), response_validators(response)) # update the cache
+    catalog.add_discover_list(page_key, data) # index the movies' watch provider
+    return data # return the retrieved data
+
+def discover_movie_pages(cache_key, service, genre, original_language, runtime_gte, runtime_lte, start_page=1, after_local=False):
+    ''' lazily walks the TMDb Discover Movie result pages, fetching each page only when the caller asks for it
+
+    criteria that were never fetched are answered from the local catalog index when it has a full page of
+    matches. once the local matches run out, the next page is 1: "load more" continues with the Discover Movie
+    pages (after_local), leaving out the movies already served locally. a partial local answer is served if
+    the Discover Movie request fails.
+
+    Parameters
+    ----------
+    cache_key : str
+        the cache key used to identify the cached data
+    service : str
+        the TMDb ID for the movie's streaming service
+    genre : str
+        the TMDb ID for the movie's genre
+    original_language : str
+        the TMDb for the movie's original language
+    runtime_gte : int
+        the minimum runtime of the movie
+    runtime_lte : int
+        the maximum runtime of the movie
+    start_page : int, optional
+        the first page to fetch (default of 1)
+    after_local : bool, optional
+        True if the local catalog matches were already served (default of False)
+
+    Yields
+    ------
+    tuple
+        the page's list of TMDb IDs and the number of the next page, or None after the last page
+    '''
+    local_matches, covered, served_locally = local_discover_matches(cache_key, service, genre, original_language, runtime_gte, runtime_lte, after_local)
+
+    if covered: # if the catalog has enough matches, answer without the Discover Movie endpoint
+        for page_ids, next_page in local_discover_pages(local_matches, start_page):
+            yield page_ids, next_page or 1 # then continue with Discover Movie page 1
+        return
+
+    page = start_page
+
+    while True:
+        try:
+            tmdb_ids = tmdb_discover_movie_cached(cache_key, service, genre, original_language, runtime_gte, runtime_lte, page)
+        except RequestException:
+            if not local_matches: # if there's no partial local answer to fall back on,
+                raise
+            logger.warning("Discover Movie request failed, serving %d local catalog matches", len(local_matches))
+            yield from local_discover_pages(local_matches, page)
+            return
+
+        next_page = next_discover_page(page, tmdb_ids)
+        yield [tmdb_id for tmdb_id in tmdb_ids if tmdb_id not in served_locally], next_page
+
+        if next_page is None: # if there are no more pages,
+            return
+
+        page = next_page
+
+def local_discover_matches(cache_key, service, genre, original_language, runtime_gte, runtime_lte, after_local=False):
+    ''' gets the local catalog matches discover_movie_pages serves, or leaves out after serving them
+
+    Parameters
+    ----------
+    cache_key : str
+        the cache key used to identify the cached data
+    service : str
+        the TMDb ID for the movie's streaming service
+    genre : str
+        the TMDb ID for the movie's genre
+    original_language : str
+        the TMDb for the movie's original language
+    runtime_gte : int
+        the minimum runtime of the movie
+    runtime_lte : int
+        the maximum runtime of the movie
+    after_local : bool, optional
+        True if the local catalog matches were already served (default of False)
+
+    Returns
+    -------
+    tuple
+        the local matches to serve (or fall back on), whether they cover the search, and the TMDb IDs already served locally
+    '''
+    if after_local: # if the local matches were served, don't repeat them
+        return [], False, set(local_discover(service, genre, original_language, runtime_gte, runtime_lte)[0])
+
+    if get_discover_from_cache(cache_key) is None and get_servable_discover_from_cache(cache_key) is None: # if these exact criteria were never fetched (or long ago), try the local catalog
+        local_matches, covered = local_discover(service, genre, original_language, runtime_gte, runtime_lte)
+        return local_matches, covered, set()
+
+    return [], False, set()
+
+def next_discover_page(page, tmdb_ids):
+    ''' gets the number of the Discover Movie page after a fetched page
+
+    Parameters
+    ----------
+    page : int
+        the fetched page
+    tmdb_ids : list
+        the TMDb IDs on the fetched page
+
+    Returns
+    -------
+    int or None
+        the next page, or None if the fetched page was the last one
+    '''
+    return page + 1 if len(tmdb_ids) == DISCOVER_PAGE_SIZE and page < DISCOVER_MAX_PAGE else None # a short page is the last one
+
+def local_discover_pages(tmdb_ids, start_page):
+    ''' splits local catalog matches into Discover Movie sized pages
+
+    Parameters
+    ----------
+    tmdb_ids : list
+        the matching TMDb IDs
+    start_page : int
+        the first page to yield
+
+    Yields
+    ------
+    tuple
+        the page's list of TMDb IDs and the number of the next page, or None after the last page
+    '''
+    page = start_page
+
+    while True:
+        page_ids = tmdb_ids[(page - 1) * DISCOVER_PAGE_SIZE:page * DISCOVER_PAGE_SIZE]
+        next_page = page + 1 if page * DISCOVER_PAGE_SIZE < len(tmdb_ids) else None
+        yield page_ids, next_page
+
+        if next_page is None: # if there are no more pages,
+            return
+
+        page = next_page
+
+#################FUNCTIONS###############
+
+@timed
+def tmdb_watch_providers():
+    ''' makes a request to the TMDb Watch Providers endpoint
+
+    Parameters
+    ----------
+    none
+
+    Returns
+    -------
+    dict
+        maps each watch provider name to its TMDb watch provider ID
+    '''
+    url = "https://api.themoviedb.org/3/watch/providers/movie?language=en-US&watch_region=US"
+
+    headers = {
+        "accept": "application/json",
+        "Authorization": f"Bearer {TMDb_key}"
+    }
+
+    params={
+        "api_key": TMDb_key
+    }
+
+    response = upstream_get(url, headers=headers, params=params)
+    response.raise_for_status() # don't replace the registry with an error response
+    providers = response.json().get("results", [])
+
+    return {provider["provider_name"]: provider["provider_id"] for provider in providers}
+
+@timed
+def tmdb_genres():
+    ''' makes a request to the TMDb Genres endpoint
+
+    Parameters
+    ----------
+    none
+
+    Returns
+    -------
+    dict
+        maps each genre name to its TMDb genre ID
+    '''
+    url = "https://api.themoviedb.org/3/genre/movie/list?language=en"
+
+    headers = {
+        "accept": "application/json",
+        "Authorization": f"Bearer {TMDb_key}"
+    }
+
+    params={
+        "api_key": TMDb_key
+    }
+
+    response = upstream_get(url, headers=headers, params=params)
+    response.raise_for_status() # don't replace the registry with an error response
+    genres = response.json().get("genres", [])
+
+    return {genre["name"]: genre["id"] for genre in genres}
+
+@timed
+def tmdb_languages():
+    ''' makes a request to the TMDb Languages endpoint
+
+    Parameters
+    ----------
+    none
+
+    Returns
+    -------
+    dict
+        maps each language's English name to its TMDb language ID
+    '''
+    url = "https://api.themoviedb.org/3/configuration/languages"
+
+    headers = {
+        "accept": "application/json",
+        "Authorization": f"Bearer {TMDb_key}"
+    }
+
+    params={
+        "api_key": TMDb_key
+    }
+
+    response = upstream_get(url, headers=headers, params=params)
+    response.raise_for_status() # don't replace the registry with an error response
+    languages = response.json()
+
+    return {language["english_name"]: language["iso_639_1"] for language in languages}
+
+reference_registry = ReferenceRegistry({
+    "providers": tmdb_watch_providers,
+    "genres": tmdb_genres,
+    "languages": tmdb_languages
+})
+
+def get_tmdb_watch_provider(user_service):
+    ''' gets the TMDb watch provider ID for the specified streaming service from the reference data registry
+
+    Parameters
+    ----------
+    user_service : str
+        the name of the streaming service
+
+    Returns
+    -------
+    int
+        the TMDb watch provider ID
+    '''
+    return reference_registry.lookup("providers", user_service)
+
+def get_tmdb_genre_id(user_genre):
+    ''' gets the TMDb genre ID for the user-specified genre from the reference data registry
+
+    Parameters
+    ----------
+    user_genre : str
+        the name of the genre
+
+    Returns
+    -------
+    int
+        the TMDb genre ID
+    '''
+    return reference_registry.lookup("genres", user_genre)
+
+def get_tmdb_language_id(user_language):
+    ''' gets the TMDb language ID for the user-specified language from the reference data registry
+
+    Parameters
+    ----------
+    user_language : str
+        the name of the language
+
+    Returns
+    -------
+    str
+        the TMDb language ID
+    '''
+    return reference_registry.lookup("languages", user_language)
+
+@timed
+def tmdb_discover_movie(service, genre, original_language, runtime_gte, runtime_lte, language="en-US", page=1):
+    ''' makes a request to the TMDb Discover Movie endpoint based on user-specified criteria
+
+    Parameters
+    ----------
+    service : str
+        the TMDb watch provider ID for filtering
+    genre : int
+        the TMDb genre ID for filtering
+    original_language : str
+        the TMDb language ID for filtering
+    runtime_gte : int
+        the minimum runtime (in minutes) for filtering
+    runtime_lte : int
+        the maximum runtime (in minutes) for filtering
+    language : str, optional
+        the language for movie details results (default of "en-US")
+    page : int, optional
+        the results page (default of 1)
+
+    Returns
+    -------
+    list
+        a list of TMDb IDs for movies that match the criteria
+    '''
+    response = tmdb_discover_movie_response(service, genre, original_language, runtime_gte, runtime_lte, language, page)
+    response.raise_for_status()
+    results = response.json().get("results", [])
+
+    return [result["id"] for result in results]
+
+@timed
+def tmdb_discover_movie_response(service, genre, original_language, runtime_gte, runtime_lte, language="en-US", page=1, validators=None):
+    ''' makes a request to the TMDb Discover Movie endpoint, conditional if validators are given
+
+    Parameters
+    ----------
+    service : str
+        the TMDb watch provider ID for filtering
+    genre : int
+        the TMDb genre ID for filtering
+    original_language : str
+        the TMDb language ID for filtering
+    runtime_gte : int
+        the minimum runtime (in minutes) for filtering
+    runtime_lte : int
+        the maximum runtime (in minutes) for filtering
+    language : str, optional
+        the language for movie details results (default of "en-US")
+    page : int, optional
+        the results page (default of 1)
+    validators : dict, optional
+        the validators of a cached list, sent as If-None-Match / If-Modified-Since
+
+    Returns
+    -------
+    requests.Response
+        the response, 304 Not Modified if the cached list is still current
+    '''
+    url, headers, params = discover_request(service, genre, original_language, runtime_gte, runtime_lte, language, page, validators)
+    return upstream_get(url, headers=headers, params=params)
+
+def discover_request(service, genre, original_language, runtime_gte, runtime_lte, language="en-US", page=1, validators=None):
+    ''' builds a TMDb Discover Movie request, shared by the blocking and async clients
+
+    Parameters
+    ----------
+    service : str
+        the TMDb watch provider ID for filtering
+    genre : int
+        the TMDb genre ID for filtering
+    original_language : str
+        the TMDb language ID for filtering
+    runtime_gte : int
+        the minimum runtime (in minutes) for filtering
+    runtime_lte : int
+        the maximum runtime (in minutes) for filtering
+    language : str, optional
+        the language for movie details results (default of "en-US")
+    page : int, optional
+        the results page (default of 1)
+    validators : dict, optional
+        the validators of a cached list, sent as If-None-Match / If-Modified-Since
+
+    Returns
+    -------
+    tuple
+        the URL, headers and query string parameters
+    '''
+    url = "https://api.themoviedb.org/3/discover/movie"
+
+    headers = {
+        "accept": "application/json",
+        "Authorization": f"Bearer {TMDb_key}"
+    }
+
+    params={
+        "api_key": TMDb_key,
+        "include_adult": "false",
+        "include_video": "false",
+        "language": language,
+        "with_genres": genre,
+        "with_original_language": original_language,
+        "with_runtime.gte": runtime_gte,
+        "with_runtime.lte": runtime_lte,
+        "watch_region": "US",
+        "with_watch_providers": service,
+        "page": page
+    }
+
+    return url, conditional_headers(headers, validators), params
+
+@timed
+def tmdb_movie_with_directors(tmdb_id):
+    ''' either retrieves movie details and directors from the cache or makes one combined request to the TMDb Details and Credits endpoints
+
+    the Details endpoint is called with append_to_response=credits, so a cold movie costs a single request.
+    cached movies that predate director caching only fetch the Credits endpoint, once. concurrent misses for
+    the same movie share one fetch.
+
+    Parameters
+    ----------
+    tmdb_id : int
+        the TMDb ID of the movie
+
+    Returns
+    -------
+    tuple or None
+        the movie record and the list of directors, or None if TMDb doesn't have the movie (a 404)
+    '''
+    cached_movie = cached_movie_with_directors(tmdb_id)
+
+    if cached_movie is not None: # if cache already contains both, fresh or still servable,
+        return cached_movie # return cached data
+
+    return movie_flights.do(tmdb_id, _fetch_movie_with_directors, tmdb_id)
+
+def cached_movie_with_directors(tmdb_id):
+    ''' gets a movie record and its directors from the cache without waiting on TMDb, fresh or stale (see stale_movie_with_directors)
+
+    Parameters
+    ----------
+    tmdb_id : int
+        the TMDb ID of the movie
+
+    Returns
+    -------
+    tuple or None
+        the movie record and the list of directors, or None if the movie must be fetched
+    '''
+    movie_details, directors = fresh_movie_with_directors(tmdb_id)
+
+    if movie_details and directors: # if cache already contains both,
+        return movie_details, directors
+
+    return stale_movie_with_directors(tmdb_id) # if an expired movie may still be served, don't wait on TMDb
+
+def fresh_movie_with_directors(tmdb_id):
+    ''' gets a movie's fresh cached record and directors
+
+    Parameters
+    ----------
+    tmdb_id : int
+        the TMDb ID of the movie
+
+    Returns
+    -------
+    tuple
+        the movie record and the list of directors, either None if not cached
+    '''
+    return get_movie_details_from_cache(tmdb_id), get_directors_from_cache(tmdb_id) # check cache for movie details and directors
+
+def stale_movie_with_directors(tmdb_id):
+    ''' gets an expired movie record and its directors that may be served at once, refreshing them in the background
+
+    a movie is served until its hard expiry, or at any age while TMDb's circuit is open (and then not refreshed).
+
+    Parameters
+    ----------
+    tmdb_id : int
+        the TMDb ID of the movie
+
+    Returns
+    -------
+    tuple or None
+        the stale movie record and directors, or None if there is none to serve
+    '''
+    open_circuit = circuit_open(TMDB_HOST)
+    stale_movie = get_servable_movie_from_cache(tmdb_id, any_age=open_circuit)
+
+    if stale_movie is not None and not open_circuit: # refresh it for the next request
+        stale_refresher.refresh(("movie", str(tmdb_id)), movie_flights.do, tmdb_id, _fetch_movie_with_directors, tmdb_id)
+
+    return stale_movie
+
+def _fetch_movie_with_directors(tmdb_id):
+    ''' fetches whatever tmdb_movie_with_directors is missing and updates the cache, for one caller at a time
+
+    an expired movie stored with validators is revalidated with a conditional request, and a 304 Not Modified
+    makes it fresh again without rewriting it. the response's Cache-Control max-age sets how long it stays fresh.
+
+    Parameters
+    ----------
+    tmdb_id : int
+        the TMDb ID of the movie
+
+    Returns
+    -------
+    tuple or None
+        the movie record and the list of directors, or None if TMDb doesn't have the movie (a 404)
+    '''
+    movie_details, directors = fresh_movie_with_directors(tmdb_id) # a call that just finished may have filled them
+
+    if movie_details and directors:
+        return movie_details, directors
+
+    if movie_details: # if only the movie details are cached,
+        credits = tmdb_credits(tmdb_id) # backfill the directors from the Credits endpoint
+
+        if credits is None: # if the movie was removed from TMDb,
+            return None
+
+        directors = directors_from_credits(credits)
+        update_cache_with_directors(tmdb_id, directors) # update the cache
+        return movie_details, directors
+
+    stale_record, stale_directors, validators = get_stale_movie_from_cache(tmdb_id) # an expired movie can be revalidated instead of refetched
+    url, headers, params = details_request(tmdb_id, validators)
+    response = upstream_get(url, headers=headers, params=params) # if no data found in cache, make a request to TMDb Details endpoint with credits appended
+    return store_movie_response(tmdb_id, response, stale_record, stale_directors)
+
+def details_request(tmdb_id, validators=None):
+    ''' builds a TMDb Details request with credits appended, shared by the blocking and async clients
+
+    Parameters
+    ----------
+    tmdb_id : int
+        the TMDb ID of the movie
+    validators : dict, optional
+        the validators of a cached movie, sent as If-None-Match / If-Modified-Since
+
+    Returns
+    -------
+    tuple
+        the URL, headers and query string parameters
+    '''
+    url = f"https://api.themoviedb.org/3/movie/{tmdb_id}"
+
+    headers = {
+        "accept": "application/json",
+        "Authorization": f"Bearer {TMDb_key}"
+    }
+
+    params={
+        "api_key": TMDb_key,
+        "language": "en-US",
+        "append_to_response": "credits"
+    }
+
+    return url, conditional_headers(headers, validators), params
+
+def store_movie_response(tmdb_id, response, stale_record=None, stale_directors=None):
+    ''' caches a TMDb Details response with credits appended, or extends the stale movie after a 304 Not Modified
+
+    Parameters
+    ----------
+    tmdb_id : int
+        the TMDb ID of the movie
+    response : requests.Response or httpx.Response
+        the Details response
+    stale_record : MovieRecord, optional
+        the expired movie record the request revalidated
+    stale_directors : list, optional
+        the expired directors the request revalidated
+
+    Returns
+    -------
+    tuple or None
+        the movie record and the list of directors, or None if TMDb doesn't have the movie (a 404)
+    '''
+    if response.status_code == 304: # if the movie hasn't changed,
+        extend_movie_in_cache(tmdb_id, freshness_lifetime(response)) # keep the stored record and directors
+        return stale_record, stale_directors
+
+    if response.status_code == 404: # if the movie was removed from TMDb, skip it instead of failing the search
+        return None
+
+    response.raise_for_status() # never cache or index an error body
+    movie_details = response.json()
+    directors = directors_from_credits(movie_details.pop("credits", {})) # store the directors, not the whole cast and crew
+
+    record = project_movie(movie_details) # keep the compact movie record
+
+    update_cache_with_movie_details(tmdb_id, movie_details, directors, freshness_lifetime(response), response_validators(response)) # update the cache
+    catalog.add_movie(record) # index the movie for local searches
+    return record, directors # return the retrieved data
+
+@timed
+def tmdb_movie_details(tmdb_id):
+    ''' gets the TMDb details for a specific movie, from the cache or the TMDb Details endpoint
+
+    Parameters
+    ----------
+    tmdb_id : int
+        the TMDb ID of the movie
+
+    Returns
+    -------
+    MovieRecord or None
+        the movie's title, runtime, poster, overview, language and genres, or None if TMDb doesn't have the movie
+    '''
+    movie = tmdb_movie_with_directors(tmdb_id)
+    return movie[0] if movie is not None else None
+
+@timed
+def tmdb_directors(tmdb_id):
+    ''' gets the Director(s) for a specific movie, from the cache or the TMDb Credits endpoint
+
+    Parameters
+    ----------
+    tmdb_id : int
+        the TMDb ID of the movie
+
+    Returns
+    -------
+    list
+        a list of directors for the movie, or a list containing "Unknown" if no crew and/or directors
+    '''
+    movie = tmdb_movie_with_directors(tmdb_id)
+    return movie[1] if movie is not None else ["Unknown"]
+
+@timed
+def tmdb_credits(tmdb_id):
+    ''' makes a request to the TMDb Credits endpoint for a specific movie
+
+    Parameters
+    ----------
+    tmdb_id : int
+        the TMDb ID of the movie
+
+    Returns
+    -------
+    dict or None
+        the cast and crew of the movie, or None if TMDb doesn't have the movie (a 404)
+    '''
+    url, headers, params = credits_request(tmdb_id)
+    response = upstream_get(url, headers=headers, params=params)
+
+    if response.status_code == 404: # if the movie was removed from TMDb,
+        return None
+
+    response.raise_for_status() # a failed backfill must not be cached as an "Unknown" director
+    return response.json()
+
+def credits_request(tmdb_id):
+    ''' builds a TMDb Credits request, shared by the blocking and async clients
+
+    Parameters
+    ----------
+    tmdb_id : int
+        the TMDb ID of the movie
+
+    Returns
+    -------
+    tuple
+        the URL, headers and query string parameters
+    '''
+    url = f"https://api.themoviedb.org/3/movie/{tmdb_id}/credits"
+
+    headers = {
+        "accept": "application/json",
+        "Authorization": f"Bearer {TMDb_key}"
+    }
+
+    params={
+        "api_key": TMDb_key,
+        "language": "en-US"
+    }
+
+    return url, headers, params
+
+def directors_from_credits(credits):
+    ''' gets the Director(s) from a TMDb Credits response
+
+    Parameters
+    ----------
+    credits : dict
+        the TMDb Credits response, or the "credits" part of an appended Details response
+
+    Returns
+    -------
+    list
+        a list of directors for the movie, or a list containing "Unknown" if no crew and/or directors
+    '''
+    crew = credits.get("crew", [])
+    if not crew: # if no crew data available,
+        return ["Unknown"] # return Unknown director
+    directors = [member["name"] for member in crew if member["job"] == "Director"]
+    if not directors: # if no director data available,
+        return ["Unknown"] # return Unknown director
+    return directors # return the list of directors
+        
+def get_streaming_link_from_cache(tmdb_id, user_service):
+    '''retrieves the streaming link from the cache for a specified TMDb ID and service
+
+    answers for any service from the movie's cached availability record, then falls back to
+    links saved with update_cache_with_streaming_link.
+
+    Parameters
+    ----------
+    tmdb_id : int
+        the TMDb ID of the movie
+    user_service : str
+        the streaming service for which the link is being retrieved
+
+    Returns
+    -------
+    str or None
+        the streaming link, "Streaming link not available." if the movie is known not to be on the service,
+        or None if not found in the cache
+    '''
+    availability = get_availability_from_cache(tmdb_id) # check cache for the availability record
+
+    if availability is not None: # if the record is cached,
+        return streaming_link_from_availability(availability, user_service) or "Streaming link not available."
+
+    return get_streaming_links_from_cache(tmdb_id).get(user_service) # else, check saved links
+
+@timed
+def get_streaming_link(tmdb_id, user_service):
+    ''' either retrieves data from the cache or makes a request to the StreamingAvailabilityAPI, updates the cache, and returns the retrieved streaming link
+
+    Parameters
+    ----------
+    tmdb_id : int
+        the TMDb ID of the movie
+    user_service : str
+        the preferred streaming service
+
+    Returns
+    -------
+    str or None
+        the streaming link, if available. otherwise, returns None or "Streaming link not available."
+    '''
+    cached_details = get_streaming_link_from_cache(tmdb_id, user_service) # check cache for streaming link
+
+    if cached_details: # if streaming link in cache,
+        return cached_details # return cached streaming link
+
+    open_circuit = circuit_open(STREAMING_AVAILABILITY_HOST)
+    availability = get_servable_availability_from_cache(tmdb_id, any_age=open_circuit) # an expired record may still be served
+
+    if availability is not None: # if so, refresh it for the next click
+        if not open_circuit:
+            stale_refresher.refresh(("availability", str(tmdb_id)), streaming_availability, tmdb_id)
+        return streaming_link_from_availability(availability, user_service) or "Streaming link not available."
+
+    if open_circuit: # if the StreamingAvailabilityAPI keeps failing, answer "unavailable" at once instead of waiting on it
+        return None
+
+    availability = streaming_availability(tmdb_id) # else, make a request to StreamingAvailabilityAPI
+
+    if availability is None: # if the request failed,
+        return None
+
+    return streaming_link_from_availability(availability, user_service)
+
+@timed
+def streaming_availability(tmdb_id):
+    ''' makes a request to the StreamingAvailabilityAPI and caches the movie's whole availability record
+
+    the record keeps every US streaming option for every service, so later lookups for any service are served from the cache.
+    a record is kept until the first of its options leaves its service, and movies with no US options are cached for
+    AVAILABILITY_NEGATIVE_TTL. concurrent calls for the same movie share one request.
+
+    Parameters
+    ----------
+    tmdb_id : int
+        the TMDb ID of the movie
+
+    Returns
+    -------
+    dict or None
+        the availability record, or None if the request failed
+    '''
+    return availability_flights.do(tmdb_id, _fetch_availability, tmdb_id)
+
+def _fetch_availability(tmdb_id):
+    ''' makes a request to the StreamingAvailabilityAPI and caches the record, for one caller of streaming_availability at a time
+
+    Parameters
+    ----------
+    tmdb_id : int
+        the TMDb ID of the movie
+
+    Returns
+    -------
+    dict or None
+        the availability record, or None if the request failed
+    '''
+    availability = get_availability_from_cache(tmdb_id) # a call that just finished may have filled it
+
+    if availability is not None:
+        return availability
+
+    url = "https://streaming-availability.p.rapidapi.com/get"
+
+    querystring = {"output_language":"en","tmdb_id":f"movie/{tmdb_id}"}
+
+    headers = {
+        "X-RapidAPI-Key": StreamingAvailability_key,
+        "X-RapidAPI-Host": "streaming-availability.p.rapidapi.com"
+    }
+
+    try:
+        response = upstream_get(url, headers=headers, params=querystring)
+    except RequestException: # don't cache quota or server errors, timeouts, or an open circuit (CircuitOpenError)
+        return None
+
+    if response.status_code == 404: # if the movie is unknown,
+        result = {} # cache it as not available
+    elif response.status_code == 200:
+        result = response.json().get("result", {})
+    else: # don't cache quota or server errors
+        return None
+
+    availability = {"us": result.get("streamingInfo", {}).get("us", [])} # every service, link type and expiry date
+
+    if not availability["us"]: # if not streaming anywhere,
+        update_cache_with_availability(tmdb_id, availability, AVAILABILITY_NEGATIVE_TTL) # cache the miss for a shorter time
+        return availability
+
+    leaving = [option["leaving"] for option in availability["us"] if option.get("leaving", 0) > time.time()] # upcoming expiry dates, if present
+    ttl = min(NAMESPACE_TTLS["availability"], min(leaving) - time.time()) if leaving else None # keep the record until the first option expires
+
+    update_cache_with_availability(tmdb_id, availability, ttl) # update the cache
+    return availability
+
+def streaming_link_from_availability(availability, user_service):
+    ''' gets the streaming link for a service from an availability record
+
+    Parameters
+    ----------
+    availability : dict
+        the availability record
+    user_service : str
+        the preferred streaming service
+
+    Returns
+    -------
+    str or None
+        the link of the first option on the service that hasn't left it, or None
+    '''
+    service_code = get_streaming_availability_service(user_service)
+
+    for option in availability["us"]:
+        if option["service"] == service_code and not (option.get("leaving") and option["leaving"] <= time.time()): # if user-specified service is available,
+            return option["link"] # return streaming link
+
+    return None
+
+def get_streaming_availability_service(user_service):
+    ''' gets the corresponding StreamingAvailabilityAPI service code for the given streaming service
+
+    Parameters
+    ----------
+    user_service : str
+        the name of the streaming service
+
+    Returns
+    -------
+    str
+        the corresponding StreamingAvailabilityAPI service code
+    '''
+    service_mappings = {
+        "Netflix": "netflix",
+        "Prime": "prime",
+        "Disney": "disney",
+        "HBO Max": "hbo",
+        "Hulu": "hulu",
+        "Peacock": "peacock",
+        "Paramount": "paramount",
+        "Starz": "starz",
+        "Showtime": "showtime",
+        "Apple TV": "apple",
+        "MUBI": "mubi",
+    }
+    return service_mappings[user_service]
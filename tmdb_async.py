@@ -0,0 +1,225 @@
+#########################################
+##### Name: Tara Dorje              #####
+##### Uniqname: tydorje             #####
+#########################################
+
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from cache_store import get_discover_from_cache, get_stale_discover_from_cache, update_cache_with_directors, get_stale_movie_from_cache
+from metrics import timed
+from single_flight import AsyncSingleFlight
+from tmdb import (discover_request, details_request, credits_request, store_discover_response, store_movie_response, directors_from_credits,
+                  next_discover_page, local_discover_pages, local_discover_matches, cached_discover_page, cached_movie_with_directors,
+                  fresh_movie_with_directors)
+from upstream_async import upstream_get_async
+
+CACHE_WORKERS = int(os.environ.get("CACHE_WORKERS", 8)) # threads running cache store calls for the event loop
+
+logger = logging.getLogger(__name__)
+cache_executor = ThreadPoolExecutor(max_workers=CACHE_WORKERS, thread_name_prefix="cache") # apart from the default executor, whose threads can wait on the scheduler
+
+discover_flights = AsyncSingleFlight("discover_async") # concurrent misses for the same cache key share one fetch
+movie_flights = AsyncSingleFlight("movie_details_async")
+
+async def run_off_loop(function, *args):
+    ''' runs a blocking cache store call on the cache threads, so a slow SQLite or Redis call doesn't stall the event loop
+
+    Parameters
+    ----------
+    function : function
+        the call to make
+    *args
+        the function's arguments
+
+    Returns
+    -------
+    object
+        the function's result
+    '''
+    return await asyncio.get_running_loop().run_in_executor(cache_executor, function, *args)
+
+@timed
+async def tmdb_discover_movie_cached_async(cache_key, service, genre, original_language, runtime_gte, runtime_lte, page=1):
+    ''' the async counterpart of tmdb.tmdb_discover_movie_cached, sharing its cache keys and entries
+
+    Parameters
+    ----------
+    cache_key : str
+        the cache key used to identify the cached data
+    service : str
+        the TMDb ID for the movie's streaming service
+    genre : str
+        the TMDb ID for the movie's genre
+    original_language : str
+        the TMDb for the movie's original language
+    runtime_gte : int
+        the minimum runtime of the movie
+    runtime_lte : int
+        the maximum runtime of the movie
+    page : int, optional
+        the Discover Movie results page (default of 1)
+
+    Returns
+    -------
+    list
+        a list of TMDb IDs for movies that match the criteria
+    '''
+    page_key = cache_key if page == 1 else f"{cache_key}_page{page}" # page 1 keeps the original cache key
+    cached_data = await run_off_loop(cached_discover_page, page_key, service, genre, original_language, runtime_gte, runtime_lte, page) # a stale list is refreshed on a background thread
+
+    if cached_data is not None: # if data is found in cache, fresh or still servable,
+        return cached_data
+
+    return await discover_flights.do(page_key, _fetch_discover_page, page_key, service, genre, original_language, runtime_gte, runtime_lte, page)
+
+async def _fetch_discover_page(page_key, service, genre, original_language, runtime_gte, runtime_lte, page):
+    ''' makes a request to the TMDb Discover Movie endpoint and updates the cache, for one caller at a time
+
+    Parameters
+    ----------
+    page_key : str
+        the cache key of the page
+    service : str
+        the TMDb ID for the movie's streaming service
+    genre : str
+        the TMDb ID for the movie's genre
+    original_language : str
+        the TMDb for the movie's original language
+    runtime_gte : int
+        the minimum runtime of the movie
+    runtime_lte : int
+        the maximum runtime of the movie
+    page : int
+        the Discover Movie results page
+
+    Returns
+    -------
+    list
+        a list of TMDb IDs for movies that match the criteria
+    '''
+    cached_data = await run_off_loop(get_discover_from_cache, page_key) # a call that just finished may have filled it
+
+    if cached_data:
+        return cached_data
+
+    stale_data, validators = await run_off_loop(get_stale_discover_from_cache, page_key) # an expired list can be revalidated instead of refetched
+    url, headers, params = discover_request(service, genre, original_language, runtime_gte, runtime_lte, page=page, validators=validators)
+    response = await upstream_get_async(url, headers=headers, params=params)
+    return await run_off_loop(store_discover_response, page_key, response, stale_data)
+
+async def discover_movie_pages_async(cache_key, service, genre, original_language, runtime_gte, runtime_lte, start_page=1, after_local=False):
+    ''' the async counterpart of tmdb.discover_movie_pages, including its local catalog answers and fallback
+
+    Parameters
+    ----------
+    cache_key : str
+        the cache key used to identify the cached data
+    service : str
+        the TMDb ID for the movie's streaming service
+    genre : str
+        the TMDb ID for the movie's genre
+    original_language : str
+        the TMDb for the movie's original language
+    runtime_gte : int
+        the minimum runtime of the movie
+    runtime_lte : int
+        the maximum runtime of the movie
+    start_page : int, optional
+        the first page to fetch (default of 1)
+    after_local : bool, optional
+        True if the local catalog matches were already served (default of False)
+
+    Yields
+    ------
+    tuple
+        the page's list of TMDb IDs and the number of the next page, or None after the last page
+    '''
+    local_matches, covered, served_locally = await run_off_loop(local_discover_matches, cache_key, service, genre, original_language,
+                                                                     runtime_gte, runtime_lte, after_local) # may build the catalog index
+
+    if covered: # if the catalog has enough matches, answer without the Discover Movie endpoint
+        for page_ids, next_page in local_discover_pages(local_matches, start_page):
+            yield page_ids, next_page or 1 # then continue with Discover Movie page 1
+        return
+
+    page = start_page
+
+    while True:
+        try:
+            tmdb_ids = await tmdb_discover_movie_cached_async(cache_key, service, genre, original_language, runtime_gte, runtime_lte, page)
+        except httpx.HTTPError: # connection errors, timeouts and 429/5xx responses that ran out of retries
+            if not local_matches: # if there's no partial local answer to fall back on,
+                raise
+            logger.warning("Discover Movie request failed, serving %d local catalog matches", len(local_matches))
+            for local_page in local_discover_pages(local_matches, page):
+                yield local_page
+            return
+
+        next_page = next_discover_page(page, tmdb_ids)
+        yield [tmdb_id for tmdb_id in tmdb_ids if tmdb_id not in served_locally], next_page
+
+        if next_page is None: # if there are no more pages,
+            return
+
+        page = next_page
+
+@timed
+async def tmdb_movie_with_directors_async(tmdb_id):
+    ''' the async counterpart of tmdb.tmdb_movie_with_directors, sharing its cache entries
+
+    Parameters
+    ----------
+    tmdb_id : int
+        the TMDb ID of the movie
+
+    Returns
+    -------
+    tuple or None
+        the movie record and the list of directors, or None if TMDb doesn't have the movie (a 404)
+    '''
+    cached_movie = await run_off_loop(cached_movie_with_directors, tmdb_id) # a stale movie is refreshed on a background thread
+
+    if cached_movie is not None: # if cache already contains both, fresh or still servable,
+        return cached_movie
+
+    return await movie_flights.do(tmdb_id, _fetch_movie_with_directors, tmdb_id)
+
+async def _fetch_movie_with_directors(tmdb_id):
+    ''' fetches whatever tmdb_movie_with_directors_async is missing and updates the cache, for one caller at a time
+
+    Parameters
+    ----------
+    tmdb_id : int
+        the TMDb ID of the movie
+
+    Returns
+    -------
+    tuple or None
+        the movie record and the list of directors, or None if TMDb doesn't have the movie (a 404)
+    '''
+    movie_details, directors = await run_off_loop(fresh_movie_with_directors, tmdb_id) # a call that just finished may have filled them
+
+    if movie_details and directors:
+        return movie_details, directors
+
+    if movie_details: # if only the movie details are cached,
+        url, headers, params = credits_request(tmdb_id) # backfill the directors from the Credits endpoint
+        response = await upstream_get_async(url, headers=headers, params=params)
+
+        if response.status_code == 404: # if the movie was removed from TMDb,
+            return None
+
+        response.raise_for_status() # a failed backfill must not be cached as an "Unknown" director
+        directors = directors_from_credits(response.json())
+        await run_off_loop(update_cache_with_directors, tmdb_id, directors)
+        return movie_details, directors
+
+    stale_record, stale_directors, validators = await run_off_loop(get_stale_movie_from_cache, tmdb_id) # an expired movie can be revalidated instead of refetched
+    url, headers, params = details_request(tmdb_id, validators)
+    response = await upstream_get_async(url, headers=headers, params=params)
+    return await run_off_loop(store_movie_response, tmdb_id, response, stale_record, stale_directors)
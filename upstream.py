@@ -0,0 +1,775 @@
+#########################################
+##### Name: Tara Dorje              #####
+##### Uniqname: tydorje             #####
+#########################################
+
+import email.utils
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import registry
+from single_flight import SingleFlight
+
+CONNECT_TIMEOUT = float(os.environ.get("UPSTREAM_CONNECT_TIMEOUT", 3.05)) # seconds to open a connection
+READ_TIMEOUT = float(os.environ.get("UPSTREAM_READ_TIMEOUT", 10)) # seconds to wait for response data
+POOL_SIZE = int(os.environ.get("UPSTREAM_POOL_SIZE", 16)) # kept-alive connections per host, keep >= MAX_UPSTREAM_WORKERS
+MAX_RETRIES = int(os.environ.get("UPSTREAM_MAX_RETRIES", 3)) # retries after the first attempt
+BACKOFF_BASE = 0.5 # seconds, doubled on every retry
+MAX_RETRY_DELAY = 30 # seconds, caps both the backoff and a server's Retry-After
+RETRY_STATUSES = {429, 500, 502, 503, 504} # rate limited or temporarily unavailable
+DEFAULT_RATE = float(os.environ.get("UPSTREAM_RATE", 20)) # requests per second for hosts without their own rate
+UPSTREAM_RATES = { # requests per second, below each API's published limit
+    "api.themoviedb.org": float(os.environ.get("TMDB_RATE", 40)),
+    "streaming-availability.p.rapidapi.com": float(os.environ.get("RAPIDAPI_RATE", 5)), # metered per request
+    "image.tmdb.org": float(os.environ.get("IMAGE_RATE", 40)) # poster downloads for the poster proxy
+}
+UPSTREAM_ORIGIN = os.environ.get("UPSTREAM_ORIGIN") # e.g. "http://127.0.0.1:8089" sends every upstream request to a mock server (see mock_upstream.py)
+MIN_RATE_FRACTION = 0.05 # a host's rate is never throttled below this fraction of its configured rate
+RECOVERY_FRACTION = 0.05 # fraction of the configured rate regained after every successful response
+BREAKER_FAILURES = int(os.environ.get("BREAKER_FAILURES", 5)) # consecutive failed requests that open a host's circuit
+BREAKER_COOLDOWN = float(os.environ.get("BREAKER_COOLDOWN", 30)) # seconds an open circuit waits before letting one trial request through
+
+NUMERIC_SEGMENT = re.compile(r"(?<!^)/\d+(?=/|$)") # movie IDs in upstream paths, not the leading API version
+
+INTERACTIVE = "interactive" # a user is waiting on the request
+BACKGROUND = "background" # warming and refresh work, only sent when no interactive request is queued
+
+CLOSED = "closed" # requests are sent
+OPEN = "open" # requests fail at once, callers serve from the cache
+HALF_OPEN = "half_open" # one trial request is sent, its outcome closes or reopens the circuit
+CIRCUIT_STATES = (CLOSED, HALF_OPEN, OPEN) # the circuit_state gauge value is the index
+
+logger = logging.getLogger(__name__)
+
+session = requests.Session() # one session, so every upstream host gets a kept-alive connection pool
+session.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=POOL_SIZE))
+session.mount("http://", HTTPAdapter(pool_connections=8, pool_maxsize=POOL_SIZE))
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+upstream_duration = registry.histogram("upstream_request_duration_seconds", "Upstream request attempts by host, endpoint and status (\"error\" for connection errors and timeouts).",
+                                       ("host", "endpoint", "status"))
+upstream_in_flight = registry.gauge("upstream_requests_in_flight", "Upstream requests waiting for a response.", ("host",))
+_context = threading.local() # the priority of the requests made by the current thread
+
+class TokenBucket:
+    ''' the request budget of one upstream host
+
+    Parameters
+    ----------
+    rate : float
+        the configured requests per second, also the burst size
+    '''
+
+    def __init__(self, rate):
+        self.configured_rate = rate
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.queued = Counter() # priority -> requests waiting for a token
+
+    def refill(self):
+        ''' adds the tokens earned since the last refill, up to one second of burst
+
+        Parameters
+        ----------
+        none
+
+        Returns
+        -------
+        none
+        '''
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+class Scheduler:
+    ''' hands out upstream request slots from a token bucket per host
+
+    interactive requests always go first: a background request only takes a token when no interactive
+    request for the same host is waiting. a 429 halves the host's rate and empties its bucket, and every
+    successful response wins back a little of the configured rate (additive increase, multiplicative decrease).
+    '''
+
+    def __init__(self, rates=UPSTREAM_RATES, default_rate=DEFAULT_RATE):
+        self.rates = rates
+        self.default_rate = default_rate
+        self.buckets = {}
+        self._condition = threading.Condition()
+
+    def acquire(self, host, priority):
+        ''' waits until a request to a host may be sent
+
+        Parameters
+        ----------
+        host : str
+            the upstream host
+        priority : str
+            INTERACTIVE or BACKGROUND
+
+        Returns
+        -------
+        float
+            the seconds spent waiting
+        '''
+        started = time.monotonic()
+
+        with self._condition:
+            bucket = self._bucket(host)
+            bucket.queued[priority] += 1
+
+            try:
+                while True:
+                    bucket.refill()
+                    ahead = priority == BACKGROUND and bucket.queued[INTERACTIVE] # interactive requests go first
+
+                    if bucket.tokens >= 1 and not ahead: # if a token is free,
+                        bucket.tokens -= 1
+                        break
+
+                    self._condition.wait(max(0.01, (1 - bucket.tokens) / bucket.rate))
+            finally:
+                bucket.queued[priority] -= 1
+                self._condition.notify_all() # a waiting background request may now go
+
+        return time.monotonic() - started
+
+    def throttled(self, host):
+        ''' halves a host's rate after a 429 response
+
+        Parameters
+        ----------
+        host : str
+            the upstream host
+
+        Returns
+        -------
+        none
+        '''
+        with self._condition:
+            bucket = self._bucket(host)
+            bucket.rate = max(bucket.configured_rate * MIN_RATE_FRACTION, bucket.rate / 2)
+            bucket.tokens = min(bucket.tokens, 0)
+
+    def succeeded(self, host):
+        ''' recovers part of a throttled host's rate after a successful response
+
+        Parameters
+        ----------
+        host : str
+            the upstream host
+
+        Returns
+        -------
+        none
+        '''
+        with self._condition:
+            bucket = self._bucket(host)
+            bucket.rate = min(bucket.configured_rate, bucket.rate + bucket.configured_rate * RECOVERY_FRACTION)
+
+    def stats(self):
+        ''' gets the current rate and queue depth of every host
+
+        Parameters
+        ----------
+        none
+
+        Returns
+        -------
+        dict
+            maps each upstream host to its scheduler state
+        '''
+        with self._condition:
+            return {
+                host: {
+                    "rate": round(bucket.rate, 2),
+                    "configured_rate": bucket.configured_rate,
+                    "queued_interactive": bucket.queued[INTERACTIVE],
+                    "queued_background": bucket.queued[BACKGROUND]
+                }
+                for host, bucket in self.buckets.items()
+            }
+
+    def _bucket(self, host):
+        ''' gets a host's token bucket, creating it on first use, the caller holds the lock
+
+        Parameters
+        ----------
+        host : str
+            the upstream host
+
+        Returns
+        -------
+        TokenBucket
+            the host's bucket
+        '''
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.rates.get(host, self.default_rate))
+        return self.buckets[host]
+
+class CircuitOpenError(requests.ConnectionError):
+    ''' raised instead of sending a request to a host whose circuit is open '''
+
+class CircuitBreaker:
+    ''' stops sending requests to a host after BREAKER_FAILURES consecutive failed requests
+
+    a request that runs out of retries on connection errors, timeouts or 5xx responses is one failure, however
+    many attempts it made. once open, requests to the host fail at once for BREAKER_COOLDOWN seconds instead of
+    waiting on timeouts and retries, then a single trial request is let through: a success closes the circuit,
+    a failure opens it for another cooldown.
+    '''
+
+    def __init__(self, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.circuits = {} # host -> {"state", "failures", "opened_at", "opened", "rejected"}
+        self._lock = threading.Lock()
+
+    def allow(self, host):
+        ''' decides whether a request to a host may be sent, moving an open circuit to half open after the cooldown
+
+        Parameters
+        ----------
+        host : str
+            the upstream host
+
+        Returns
+        -------
+        bool
+            True to send the request, False to fail it at once
+        '''
+        with self._lock:
+            circuit = self._circuit(host)
+
+            if circuit["state"] == CLOSED:
+                return True
+
+            if time.monotonic() - circuit["opened_at"] >= self.cooldown: # if the cooldown is over, or a trial never reported back,
+                circuit["state"], circuit["opened_at"] = HALF_OPEN, time.monotonic()
+                return True # this request is the trial
+
+            circuit["rejected"] += 1 # open, or half open with the trial still running
+            return False
+
+    def is_open(self, host):
+        ''' checks whether requests to a host would fail at once right now
+
+        Parameters
+        ----------
+        host : str
+            the upstream host
+
+        Returns
+        -------
+        bool
+            True if the circuit is open and still cooling down, or half open with its trial running
+        '''
+        with self._lock:
+            circuit = self.circuits.get(host)
+            return circuit is not None and circuit["state"] != CLOSED and time.monotonic() - circuit["opened_at"] < self.cooldown
+
+    def succeeded(self, host):
+        ''' closes a host's circuit after a successful request
+
+        Parameters
+        ----------
+        host : str
+            the upstream host
+
+        Returns
+        -------
+        none
+        '''
+        with self._lock:
+            circuit = self._circuit(host)
+            circuit["state"], circuit["failures"] = CLOSED, 0
+
+    def failed(self, host):
+        ''' counts a failed request, opening the circuit after BREAKER_FAILURES in a row or a failed trial
+
+        Parameters
+        ----------
+        host : str
+            the upstream host
+
+        Returns
+        -------
+        none
+        '''
+        with self._lock:
+            circuit = self._circuit(host)
+            circuit["failures"] += 1
+
+            if circuit["state"] == HALF_OPEN or (circuit["state"] == CLOSED and circuit["failures"] >= self.failures):
+                if circuit["state"] == CLOSED:
+                    logger.warning("%s failed %d times in a row, opening its circuit for %.0fs", host, circuit["failures"], self.cooldown)
+                circuit["state"], circuit["opened_at"] = OPEN, time.monotonic()
+                circuit["opened"] += 1
+
+    def stats(self):
+        ''' gets the circuit state and counters of every host
+
+        Parameters
+        ----------
+        none
+
+        Returns
+        -------
+        dict
+            maps each upstream host to its "circuit" state, "circuit_failures" in a row,
+            "circuit_opened" count and "circuit_rejected" requests
+        '''
+        with self._lock:
+            return {
+                host: {"circuit": circuit["state"], "circuit_failures": circuit["failures"], "circuit_opened": circuit["opened"], "circuit_rejected": circuit["rejected"]}
+                for host, circuit in self.circuits.items()
+            }
+
+    def _circuit(self, host):
+        ''' gets a host's circuit, creating it closed on first use, the caller holds the lock '''
+        if host not in self.circuits:
+            self.circuits[host] = {"state": CLOSED, "failures": 0, "opened_at": 0.0, "opened": 0, "rejected": 0}
+        return self.circuits[host]
+
+scheduler = Scheduler()
+breaker = CircuitBreaker()
+registry.add_collector(lambda: scheduler_metrics(scheduler.stats()))
+registry.add_collector(lambda: breaker_metrics(breaker.stats()))
+request_flights = SingleFlight("upstream") # identical concurrent GETs share one response
+
+@contextmanager
+def upstream_priority(priority):
+    ''' sets the scheduler priority of the upstream requests made by the current thread
+
+    Parameters
+    ----------
+    priority : str
+        INTERACTIVE or BACKGROUND
+
+    Returns
+    -------
+    none
+    '''
+    previous = getattr(_context, "priority", INTERACTIVE)
+    _context.priority = priority
+
+    try:
+        yield
+    finally:
+        _context.priority = previous
+
+def upstream_get(url, headers=None, params=None, timeout=None):
+    ''' makes a GET request to an upstream API through the shared connection pool
+
+    concurrent calls for the same URL, parameters, conditional headers and priority are coalesced into one request whose response they share.
+    every attempt waits for a slot from the scheduler at the current thread's priority (see upstream_priority).
+    connection errors, timeouts and 429/5xx responses are retried with jittered exponential backoff,
+    waiting at least as long as the server's Retry-After header asks. once retries run out, the connection error
+    is raised, or requests.HTTPError for a 429/5xx response, so callers only ever see other statuses. a host whose
+    circuit is open (see CircuitBreaker) raises CircuitOpenError without a request.
+
+    Parameters
+    ----------
+    url : str
+        the request URL
+    headers : dict, optional
+        the request headers
+    params : dict, optional
+        the query string parameters
+    timeout : tuple, optional
+        the (connect, read) timeouts in seconds (default of (CONNECT_TIMEOUT, READ_TIMEOUT))
+
+    Returns
+    -------
+    requests.Response
+        the response, never a 429 or 5xx, callers still check for 404 and other client errors
+    '''
+    priority = getattr(_context, "priority", INTERACTIVE)
+    conditions = tuple((headers or {}).get(name) for name in ("If-None-Match", "If-Modified-Since")) # a 304 only answers a conditional request
+    key = (url, tuple(sorted((params or {}).items())), conditions, priority) # priority too, so a user never waits behind a background request
+
+    return request_flights.do(key, _send, url, headers, params, timeout or (CONNECT_TIMEOUT, READ_TIMEOUT), priority)
+
+def _send(url, headers, params, timeout, priority):
+    ''' sends a GET request, retrying failures, for upstream_get
+
+    Parameters
+    ----------
+    url : str
+        the request URL
+    headers : dict or None
+        the request headers
+    params : dict or None
+        the query string parameters
+    timeout : tuple
+        the (connect, read) timeouts in seconds
+    priority : str
+        INTERACTIVE or BACKGROUND
+
+    Returns
+    -------
+    requests.Response
+        the response, never a 429 or 5xx
+    '''
+    host, endpoint = urlsplit(url).hostname, endpoint_label(url)
+    url, headers = redirect_upstream(url, headers)
+
+    if not breaker.allow(host): # if the host keeps failing, don't wait on it
+        raise CircuitOpenError(f"{host} circuit is open")
+
+    for attempt in range(MAX_RETRIES + 1):
+        waited = scheduler.acquire(host, priority)
+        count(host, "requests")
+        count(host, f"{priority}_requests")
+        count(host, f"{priority}_wait_seconds", waited)
+        started = time.perf_counter()
+
+        try:
+            with upstream_in_flight.track_in_flight(host=host):
+                response = session.get(url, headers=headers, params=params, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as error:
+            upstream_duration.observe(time.perf_counter() - started, host=host, endpoint=endpoint, status="error")
+            count(host, "errors")
+            if attempt == MAX_RETRIES: # if out of retries,
+                breaker.failed(host) # the request failed, however many attempts it took
+                raise # let the caller handle the failure
+            delay = backoff_delay(attempt)
+            logger.warning("%s failed (%s), retrying in %.1fs", host, error, delay)
+        else:
+            upstream_duration.observe(time.perf_counter() - started, host=host, endpoint=endpoint, status=response.status_code)
+            record_response(host, response.status_code)
+
+            if response.status_code not in RETRY_STATUSES: # if done,
+                breaker.succeeded(host)
+                return response # return the response
+            count(host, f"status_{response.status_code}")
+            if attempt == MAX_RETRIES: # if out of retries,
+                record_failure(host, response.status_code)
+                response.raise_for_status() # never hand a 429 or 5xx to a caller as data
+            delay = max(backoff_delay(attempt), retry_after_delay(response)) # honor the server's Retry-After
+            logger.warning("%s returned %s, retrying in %.1fs", host, response.status_code, delay)
+
+        count(host, "retries")
+        time.sleep(delay)
+
+def record_response(host, status_code):
+    ''' updates a host's scheduler rate after a response
+
+    Parameters
+    ----------
+    host : str
+        the upstream host
+    status_code : int
+        the response status
+
+    Returns
+    -------
+    none
+    '''
+    if status_code == 429: # rate limited, slow down every request to this host
+        scheduler.throttled(host)
+    elif status_code < 500:
+        scheduler.succeeded(host)
+
+def record_failure(host, status_code):
+    ''' updates a host's circuit after a request ran out of retries on a 429 or 5xx response
+
+    Parameters
+    ----------
+    host : str
+        the upstream host
+    status_code : int
+        the last response status
+
+    Returns
+    -------
+    none
+    '''
+    if status_code >= 500: # the host is failing
+        breaker.failed(host)
+    else: # a 429 still means the host is up
+        breaker.succeeded(host)
+
+def endpoint_label(url):
+    ''' gets the path of an upstream URL with its numeric IDs replaced, so every movie shares one metrics series
+
+    Parameters
+    ----------
+    url : str
+        the request URL
+
+    Returns
+    -------
+    str
+        the path, e.g. "/3/movie/{id}/credits"
+    '''
+    return NUMERIC_SEGMENT.sub("/{id}", urlsplit(url).path)
+
+def redirect_upstream(url, headers):
+    ''' points a request at UPSTREAM_ORIGIN, if set, keeping its path and naming the real host in an X-Upstream-Host header
+
+    rates, counters and coalescing still use the real host, so a benchmark against the mock server behaves like production.
+
+    Parameters
+    ----------
+    url : str
+        the request URL
+    headers : dict or None
+        the request headers
+
+    Returns
+    -------
+    tuple
+        the URL and headers to send
+    '''
+    if not UPSTREAM_ORIGIN: # if talking to the real APIs,
+        return url, headers
+
+    parts = urlsplit(url)
+    redirected = f"{UPSTREAM_ORIGIN.rstrip('/')}{parts.path}" + (f"?{parts.query}" if parts.query else "")
+    return redirected, {**(headers or {}), "X-Upstream-Host": parts.hostname}
+
+def backoff_delay(attempt):
+    ''' gets a jittered exponential backoff delay for a retry
+
+    Parameters
+    ----------
+    attempt : int
+        the number of the failed attempt, starting at 0
+
+    Returns
+    -------
+    float
+        the delay in seconds, between 0 and BACKOFF_BASE * 2 ** attempt (full jitter)
+    '''
+    return random.uniform(0, min(MAX_RETRY_DELAY, BACKOFF_BASE * 2 ** attempt))
+
+def retry_after_delay(response):
+    ''' gets the delay requested by a response's Retry-After header
+
+    Parameters
+    ----------
+    response : requests.Response
+        the 429 or 5xx response
+
+    Returns
+    -------
+    float
+        the delay in seconds, or 0 if the header is missing or invalid
+    '''
+    retry_after = response.headers.get("Retry-After")
+
+    if not retry_after: # no header
+        return 0
+
+    if retry_after.isdigit(): # delay in seconds
+        return min(MAX_RETRY_DELAY, int(retry_after))
+
+    try:
+        retry_at = email.utils.parsedate_to_datetime(retry_after) # HTTP date
+    except (TypeError, ValueError):
+        return 0
+
+    return min(MAX_RETRY_DELAY, max(0, retry_at.timestamp() - time.time()))
+
+def response_validators(response):
+    ''' gets the validators a response can later be revalidated with
+
+    Parameters
+    ----------
+    response : requests.Response
+        the 200 response
+
+    Returns
+    -------
+    dict or None
+        the "etag" and/or "last_modified" header values, or None if the response has neither
+    '''
+    validators = {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+    validators = {name: value for name, value in validators.items() if value}
+    return validators or None
+
+def conditional_headers(headers, validators):
+    ''' adds If-None-Match / If-Modified-Since headers for revalidating a cached response
+
+    Parameters
+    ----------
+    headers : dict
+        the request headers
+    validators : dict or None
+        the cached response's validators from response_validators
+
+    Returns
+    -------
+    dict
+        a copy of the headers with the conditional headers added
+    '''
+    headers = dict(headers)
+
+    if validators and validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators and validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+
+    return headers
+
+def freshness_lifetime(response):
+    ''' gets how long a response may be cached, from its Cache-Control header
+
+    Parameters
+    ----------
+    response : requests.Response
+        the 200 or 304 response
+
+    Returns
+    -------
+    float or None
+        the max-age in seconds, 0 for no-cache / no-store (revalidate every time), or None if the header doesn't say
+    '''
+    directives = {}
+
+    for directive in response.headers.get("Cache-Control", "").split(","):
+        name, _, value = directive.strip().partition("=")
+        directives[name.lower()] = value.strip('"')
+
+    if "no-cache" in directives or "no-store" in directives:
+        return 0
+
+    if directives.get("max-age", "").isdigit():
+        return int(directives["max-age"])
+
+    return None
+
+def count(host, name, amount=1):
+    ''' increments an upstream counter for a host
+
+    Parameters
+    ----------
+    host : str
+        the upstream host
+    name : str
+        the counter name
+    amount : float, optional
+        the increment (default of 1)
+
+    Returns
+    -------
+    none
+    '''
+    with _stats_lock:
+        _stats[(host, name)] += amount
+
+def scheduler_metrics(scheduler_stats):
+    ''' gets the scheduler's rates and queue depths as metric families, at scrape time
+
+    Parameters
+    ----------
+    scheduler_stats : dict
+        the Scheduler.stats() of every host
+
+    Returns
+    -------
+    list
+        (name, kind, documentation, samples) families
+    '''
+    return [
+        ("upstream_scheduler_rate", "gauge", "Requests per second the scheduler currently allows, lowered after 429 responses.",
+         [({"host": host}, stats["rate"]) for host, stats in scheduler_stats.items()]),
+        ("upstream_scheduler_queued", "gauge", "Requests waiting for a scheduler slot.",
+         [({"host": host, "priority": priority}, stats[f"queued_{priority}"]) for host, stats in scheduler_stats.items() for priority in (INTERACTIVE, BACKGROUND)])
+    ]
+
+def breaker_metrics(breaker_stats):
+    ''' gets the circuit breaker states and counters as metric families, at scrape time
+
+    Parameters
+    ----------
+    breaker_stats : dict
+        the CircuitBreaker.stats() of every host
+
+    Returns
+    -------
+    list
+        (name, kind, documentation, samples) families
+    '''
+    return [
+        ("upstream_circuit_state", "gauge", "Circuit breaker state per host: 0 closed, 1 half open, 2 open.",
+         [({"host": host}, CIRCUIT_STATES.index(stats["circuit"])) for host, stats in breaker_stats.items()]),
+        ("upstream_circuit_opened_total", "counter", "Times a host's circuit opened.", [({"host": host}, stats["circuit_opened"]) for host, stats in breaker_stats.items()]),
+        ("upstream_circuit_rejected_total", "counter", "Requests failed at once because the host's circuit was open.",
+         [({"host": host}, stats["circuit_rejected"]) for host, stats in breaker_stats.items()])
+    ]
+
+def circuit_open(host):
+    ''' checks whether requests to an upstream host fail at once right now, so callers should serve from the cache
+
+    Parameters
+    ----------
+    host : str
+        the upstream host
+
+    Returns
+    -------
+    bool
+        True if the host's circuit is open
+    '''
+    return breaker.is_open(host)
+
+def upstream_stats():
+    ''' gets request, retry, scheduler and connection pool counters for every upstream host
+
+    "connections" is the number of connections opened, so "requests_per_connection" above 1 means keep-alive is reusing them.
+    "rate" is the scheduler's current requests per second, below "configured_rate" after 429 responses.
+
+    Parameters
+    ----------
+    none
+
+    Returns
+    -------
+    dict
+        maps each upstream host to its counters
+    '''
+    stats = {}
+
+    with _stats_lock:
+        for (host, name), value in _stats.items():
+            stats.setdefault(host, {})[name] = value
+
+    for adapter in set(session.adapters.values()):
+        pools = adapter.poolmanager.pools
+
+        for pool_key in list(pools.keys()):
+            pool = pools.get(pool_key)
+            if pool is None: # evicted since keys() was read
+                continue
+            host_stats = stats.setdefault(pool.host, {})
+            host_stats["connections"] = host_stats.get("connections", 0) + pool.num_connections
+            host_stats["pooled_requests"] = host_stats.get("pooled_requests", 0) + pool.num_requests
+
+    for host, scheduler_stats in scheduler.stats().items():
+        stats.setdefault(host, {}).update(scheduler_stats)
+
+    for host, circuit_stats in breaker.stats().items():
+        stats.setdefault(host, {}).update(circuit_stats)
+
+    for host_stats in stats.values():
+        if host_stats.get("connections"):
+            host_stats["requests_per_connection"] = round(host_stats["pooled_requests"] / host_stats["connections"], 2)
+
+        for priority in (INTERACTIVE, BACKGROUND):
+            if host_stats.get(f"{priority}_requests"):
+                wait = host_stats.pop(f"{priority}_wait_seconds")
+                host_stats[f"{priority}_mean_wait_ms"] = round(1000 * wait / host_stats[f"{priority}_requests"], 1)
+
+    return stats
@@ -0,0 +1,144 @@
+#########################################
+##### Name: Tara Dorje              #####
+##### Uniqname: tydorje             #####
+#########################################
+
+import asyncio
+import logging
+import time
+from urllib.parse import urlsplit
+
+import httpx
+
+from single_flight import AsyncSingleFlight
+from upstream import (CONNECT_TIMEOUT, READ_TIMEOUT, POOL_SIZE, MAX_RETRIES, RETRY_STATUSES, INTERACTIVE, scheduler, breaker,
+                      upstream_duration, upstream_in_flight, endpoint_label, redirect_upstream, record_response, record_failure, backoff_delay, retry_after_delay, count)
+
+logger = logging.getLogger(__name__)
+
+request_flights = AsyncSingleFlight("upstream_async") # identical concurrent GETs on the event loop share one response
+_client = None
+
+def get_client():
+    ''' returns the shared async HTTP client, creating it on the running event loop on first use
+
+    Parameters
+    ----------
+    none
+
+    Returns
+    -------
+    httpx.AsyncClient
+        the client, with a kept-alive connection pool per upstream host
+    '''
+    global _client
+
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_keepalive_connections=POOL_SIZE)
+        )
+
+    return _client
+
+async def close_client():
+    ''' closes the shared async HTTP client, at event loop shutdown
+
+    Parameters
+    ----------
+    none
+
+    Returns
+    -------
+    none
+    '''
+    global _client
+
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+async def upstream_get_async(url, headers=None, params=None):
+    ''' makes a GET request to an upstream API without blocking the event loop
+
+    the async counterpart of upstream.upstream_get: requests go through the same per-host scheduler
+    at interactive priority and are counted in the same upstream stats, identical concurrent requests
+    are coalesced, and connection errors, timeouts and 429/5xx responses are retried the same way. once retries
+    run out, the transport error is raised, or httpx.HTTPStatusError for a 429/5xx response.
+
+    Parameters
+    ----------
+    url : str
+        the request URL
+    headers : dict, optional
+        the request headers
+    params : dict, optional
+        the query string parameters
+
+    Returns
+    -------
+    httpx.Response
+        the response, never a 429 or 5xx, callers still check for 404 and other client errors
+    '''
+    conditions = tuple((headers or {}).get(name) for name in ("If-None-Match", "If-Modified-Since")) # a 304 only answers a conditional request
+    key = (url, tuple(sorted((params or {}).items())), conditions)
+
+    return await request_flights.do(key, _send, url, headers, params)
+
+async def _send(url, headers, params):
+    ''' sends a GET request, retrying failures, for upstream_get_async
+
+    Parameters
+    ----------
+    url : str
+        the request URL
+    headers : dict or None
+        the request headers
+    params : dict or None
+        the query string parameters
+
+    Returns
+    -------
+    httpx.Response
+        the response, never a 429 or 5xx
+    '''
+    host, endpoint = urlsplit(url).hostname, endpoint_label(url)
+    url, headers = redirect_upstream(url, headers)
+
+    if not breaker.allow(host): # if the host keeps failing, fail like an unreachable host without waiting on it
+        raise httpx.ConnectError(f"{host} circuit is open")
+
+    for attempt in range(MAX_RETRIES + 1):
+        waited = await asyncio.to_thread(scheduler.acquire, host, INTERACTIVE) # the scheduler blocks, so wait for it off the loop
+        count(host, "requests")
+        count(host, f"{INTERACTIVE}_requests")
+        count(host, f"{INTERACTIVE}_wait_seconds", waited)
+        started = time.perf_counter()
+
+        try:
+            with upstream_in_flight.track_in_flight(host=host):
+                response = await get_client().get(url, headers=headers, params=params)
+        except httpx.TransportError as error: # connection errors and timeouts
+            upstream_duration.observe(time.perf_counter() - started, host=host, endpoint=endpoint, status="error")
+            count(host, "errors")
+            if attempt == MAX_RETRIES: # if out of retries,
+                breaker.failed(host) # the request failed, however many attempts it took
+                raise # let the caller handle the failure
+            delay = backoff_delay(attempt)
+            logger.warning("%s failed (%s), retrying in %.1fs", host, error, delay)
+        else:
+            upstream_duration.observe(time.perf_counter() - started, host=host, endpoint=endpoint, status=response.status_code)
+            record_response(host, response.status_code)
+
+            if response.status_code not in RETRY_STATUSES: # if done,
+                breaker.succeeded(host)
+                return response # return the response
+            count(host, f"status_{response.status_code}")
+            if attempt == MAX_RETRIES: # if out of retries,
+                record_failure(host, response.status_code)
+                response.raise_for_status() # never hand a 429 or 5xx to a caller as data
+            delay = max(backoff_delay(attempt), retry_after_delay(response)) # honor the server's Retry-After
+            logger.warning("%s returned %s, retrying in %.1fs", host, response.status_code, delay)
+
+        count(host, "retries")
+        await asyncio.sleep(delay)
@@ -0,0 +1,289 @@
+#########################################
+##### Name: Tara Dorje              #####
+##### Uniqname: tydorje             #####
+#########################################
+
+import argparse
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cache_store import get_discover_from_cache, get_movie_details_from_cache, get_directors_from_cache
+from tmdb import (SERVICES, GENRES, LANGUAGES, DURATION_RUNTIMES, DISCOVER_PAGE_SIZE, reference_registry, tmdb_discover_movie_cached,
+                  tmdb_movie_with_directors, get_tmdb_watch_provider, get_tmdb_genre_id, get_tmdb_language_id)
+from upstream import BACKGROUND, upstream_priority, upstream_stats
+
+CHECKPOINT_FILE = "warm_cache.checkpoint" # one finished combination per line, so an interrupted run can resume
+
+class RateBudget:
+    ''' spaces out upstream requests so a warming run stays under a requests-per-second budget
+
+    Parameters
+    ----------
+    rate : float
+        the maximum number of upstream requests per second
+    '''
+
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self.next_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        ''' waits until the next request is allowed
+
+        Parameters
+        ----------
+        none
+
+        Returns
+        -------
+        none
+        '''
+        with self._lock:
+            now = time.monotonic()
+            wait = self.next_at - now
+            self.next_at = max(now, self.next_at) + self.interval
+
+        if wait > 0:
+            time.sleep(wait)
+
+def grid(services, genres, languages, durations):
+    ''' lists every service x genre x language x duration combination to warm
+
+    Parameters
+    ----------
+    services : list
+        the streaming service names
+    genres : list
+        the genre names
+    languages : list
+        the language names
+    durations : list
+        the duration choices
+
+    Returns
+    -------
+    list
+        (service, genre, language, duration) tuples
+    '''
+    return list(itertools.product(services, genres, languages, durations))
+
+def combination_key(combination):
+    ''' gets the checkpoint line for a combination
+
+    Parameters
+    ----------
+    combination : tuple
+        the (service, genre, language, duration) combination
+
+    Returns
+    -------
+    str
+        the combination joined with "|"
+    '''
+    return "|".join(combination)
+
+def read_checkpoint(checkpoint_path):
+    ''' reads the combinations finished by earlier runs
+
+    Parameters
+    ----------
+    checkpoint_path : str
+        the path of the checkpoint file
+
+    Returns
+    -------
+    set
+        the finished combination keys
+    '''
+    if not os.path.exists(checkpoint_path): # first run
+        return set()
+
+    with open(checkpoint_path, 'r') as checkpoint_file:
+        return {line.strip() for line in checkpoint_file if line.strip()}
+
+def warm_movie(tmdb_id, budget):
+    ''' fills the cache with a movie's details and directors if they are missing
+
+    Parameters
+    ----------
+    tmdb_id : int
+        the TMDb ID of the movie
+    budget : RateBudget
+        the shared upstream request budget
+
+    Returns
+    -------
+    bool
+        True if an upstream request was made, False if the movie was already cached
+    '''
+    if get_movie_details_from_cache(tmdb_id) and get_directors_from_cache(tmdb_id): # already warm, costs nothing
+        return False
+
+    budget.acquire()
+
+    with upstream_priority(BACKGROUND): # pool threads start at interactive priority
+        tmdb_movie_with_directors(tmdb_id)
+
+    return True
+
+def warm_combination(combination, pages, budget, executor):
+    ''' fills the cache with the Discover Movie pages, details and directors for one combination
+
+    Parameters
+    ----------
+    combination : tuple
+        the (service, genre, language, duration) combination
+    pages : int
+        the number of Discover Movie pages to warm
+    budget : RateBudget
+        the shared upstream request budget
+    executor : ThreadPoolExecutor
+        the pool that fetches the movies
+
+    Returns
+    -------
+    tuple
+        the number of movies seen and the number fetched from upstream
+    '''
+    service, genre, language, duration = combination
+    runtime_gte, runtime_lte = DURATION_RUNTIMES[duration]
+
+    service_id = get_tmdb_watch_provider(service)
+    genre_id = get_tmdb_genre_id(genre)
+    language_id = get_tmdb_language_id(language)
+    cache_key = f"{service_id}_{genre_id}_{language_id}_{runtime_gte}_{runtime_lte}" # the same key search() uses
+    tmdb_ids = []
+
+    for page in range(1, pages + 1):
+        page_key = cache_key if page == 1 else f"{cache_key}_page{page}"
+
+        if get_discover_from_cache(page_key) is None: # if the page isn't cached,
+            budget.acquire() # it costs an upstream request
+
+        page_ids = tmdb_discover_movie_cached(cache_key, service_id, genre_id, language_id, runtime_gte, runtime_lte, page)
+        tmdb_ids.extend(page_ids)
+
+        if len(page_ids) < DISCOVER_PAGE_SIZE: # last page
+            break
+
+    fetched = list(executor.map(lambda tmdb_id: warm_movie(tmdb_id, budget), tmdb_ids))
+    return len(tmdb_ids), sum(fetched)
+
+def warm(combinations, pages=1, workers=4, rate=10, checkpoint_path=CHECKPOINT_FILE):
+    ''' warms the cache for a list of combinations, skipping those finished in earlier runs
+
+    Parameters
+    ----------
+    combinations : list
+        (service, genre, language, duration) tuples
+    pages : int, optional
+        the number of Discover Movie pages per combination (default of 1)
+    workers : int, optional
+        the number of concurrent upstream requests (default of 4)
+    rate : float, optional
+        the maximum number of upstream requests per second (default of 10)
+    checkpoint_path : str, optional
+        the path of the checkpoint file (default of CHECKPOINT_FILE)
+
+    Returns
+    -------
+    dict
+        the progress and coverage report
+    '''
+    finished = read_checkpoint(checkpoint_path)
+    budget = RateBudget(rate)
+    report = {"combinations": len(combinations), "skipped": 0, "warmed": 0, "failed": 0, "movies": 0, "movies_fetched": 0}
+    started = time.monotonic()
+
+    reference_registry.start() # provider, genre and language IDs for every combination
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="warm") as executor, open(checkpoint_path, 'a') as checkpoint_file, \
+            upstream_priority(BACKGROUND): # user searches served by the same process go first
+        for number, combination in enumerate(combinations, start=1):
+            key = combination_key(combination)
+
+            if key in finished: # if an earlier run finished it,
+                report["skipped"] += 1
+                continue
+
+            try:
+                movies, fetched = warm_combination(combination, pages, budget, executor)
+            except Exception as error:
+                report["failed"] += 1
+                print(f"[{number}/{len(combinations)}] {key}: failed ({error})")
+                continue
+
+            report["warmed"] += 1
+            report["movies"] += movies
+            report["movies_fetched"] += fetched
+            checkpoint_file.write(key + "\n")
+            checkpoint_file.flush() # survive an interrupted run
+            print(f"[{number}/{len(combinations)}] {key}: {movies} movies, {fetched} fetched ({time.monotonic() - started:.0f}s)")
+
+    report["coverage"] = round((report["skipped"] + report["warmed"]) / max(len(combinations), 1), 3)
+    report["upstream_requests"] = sum(host.get("requests", 0) for host in upstream_stats().values())
+    return report
+
+def parse_list(value, choices):
+    ''' parses a comma-separated subset of a list of choices
+
+    Parameters
+    ----------
+    value : str or None
+        the comma-separated names, or None for every choice
+    choices : list
+        the allowed names
+
+    Returns
+    -------
+    list
+        the chosen names
+    '''
+    if not value: # default to the whole list
+        return list(choices)
+
+    names = [name.strip() for name in value.split(",")]
+    unknown = [name for name in names if name not in choices]
+
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown choices {unknown}, expected some of {list(choices)}")
+
+    return names
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Warm the cache for the service x genre x language x duration grid.")
+    parser.add_argument("--services", help="comma-separated streaming services (default: all)")
+    parser.add_argument("--genres", help="comma-separated genres (default: all)")
+    parser.add_argument("--languages", help="comma-separated languages (default: all)")
+    parser.add_argument("--durations", help="comma-separated duration choices (default: all)")
+    parser.add_argument("--pages", type=int, default=1, help="Discover Movie pages per combination (default: 1)")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent upstream requests (default: 4)")
+    parser.add_argument("--rate", type=float, default=10, help="upstream requests per second (default: 10)")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_FILE, help=f"resumable checkpoint file (default: {CHECKPOINT_FILE})")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and warm every combination again")
+    args = parser.parse_args()
+
+    try:
+        combinations = grid(
+            parse_list(args.services, SERVICES),
+            parse_list(args.genres, GENRES),
+            parse_list(args.languages, LANGUAGES),
+            parse_list(args.durations, list(DURATION_RUNTIMES))
+        )
+    except argparse.ArgumentTypeError as error:
+        parser.error(str(error))
+
+    if args.restart and os.path.exists(args.checkpoint): # start over
+        os.remove(args.checkpoint)
+
+    report = warm(combinations, args.pages, args.workers, args.rate, args.checkpoint)
+
+    print()
+    print(f"Combinations: {report['combinations']} ({report['warmed']} warmed, {report['skipped']} already done, {report['failed']} failed)")
+    print(f"Movies: {report['movies']} seen, {report['movies_fetched']} fetched")
+    print(f"Coverage: {report['coverage']:.1%} of the grid")
+    print(f"Upstream requests: {report['upstream_requests']}")